@@ -0,0 +1,437 @@
+# Archivo en frío de los solves de sesiones antiguas
+
+# Los solves de las sesiones sin solves nuevos desde hace ARCHIVE_AFTER_DAYS
+# días se mueven de la tabla solve a archivos columnares por usuario, en
+# ARCHIVE_DIR/user-<id>/: un .npy por columna (id_solve y date en int64, con
+# la fecha en milisegundos desde 1970; time_ms, fk_session, fk_cube y
+# fk_solve_type en int32; penalty en int8) y los scrambles concatenados en un
+# .npy de bytes junto con sus posiciones. Las filas se guardan ordenadas por
+# (date, id_solve) y los valores nulos como -1.
+#
+# Los archivos se leen con memoria mapeada. Las estadísticas de toda la vida
+# de un usuario (user_stats.py), las de una sesión archivada (stats.py), los
+# rankings (leaderboard.py) y las exportaciones combinan estos archivos con
+# las filas de la tabla solve, sin pasar millones de filas por el ORM.
+#
+# Cada escritura agrega un segmento (una generación de archivos) sólo con las
+# filas nuevas, sin copiar las ya archivadas, y después reemplaza de forma
+# atómica manifest.json, que lista los segmentos vigentes, así que un lector
+# nunca ve archivos a medio escribir. Cuando un usuario llega a
+# ARCHIVE_MAX_SEGMENTS segmentos, o hay que descartar filas de una ejecución
+# interrumpida, sus segmentos se compactan en uno.
+#
+# Una sesión se lee del archivo sólo cuando está marcada como archivada
+# (Session.archived), lo que ocurre en la misma transacción que borra sus
+# filas archivadas de la tabla solve: si el proceso se interrumpe entre ambos
+# pasos, las filas ya escritas se ignoran y se reemplazan en la siguiente
+# ejecución. Sólo se borran los solves que se escribieron en el archivo; los
+# que se agreguen a la sesión mientras tanto siguen en la tabla solve, que se
+# lee junto con el archivo.
+#
+# Los id_solve archivados no deben volver a asignarse: MySQL 5.7 recalcula el
+# AUTO_INCREMENT a partir de las filas existentes al reiniciarse, así que el
+# contador se vuelve a subir al archivar y al arrancar (ver migrations.py).
+#
+# Uso: python archive.py [--older-than DÍAS] [--dry-run]   (una ejecución a la vez)
+
+import argparse
+import json
+import os
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from threading import Lock
+
+import numpy as np
+from sqlalchemy import delete, func, select, text, update
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, Cube, Penalty, Session as SessionModel, Solve
+from stats import DNF, PLUS_TWO_MS
+from changes import change_log
+
+# Directorio de los archivos y antigüedad (en días) a partir de la cual se archiva una sesión
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "archive"))
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "180"))
+# Segmentos por usuario a partir de los cuales se compactan en uno
+ARCHIVE_MAX_SEGMENTS = int(os.getenv("ARCHIVE_MAX_SEGMENTS", "8"))
+# Usuarios cuyos archivos se mantienen abiertos (se cierran los usados hace más tiempo)
+ARCHIVE_CACHE_SIZE = int(os.getenv("ARCHIVE_CACHE_SIZE", "64"))
+# Solves que se borran de la tabla por sentencia al archivar
+DELETE_CHUNK_SIZE = 1000
+
+# Columnas numéricas y su tipo
+COLUMNS = {
+    "id_solve": np.int64,
+    "date": np.int64,
+    "time_ms": np.int32,
+    "penalty": np.int8,
+    "fk_session": np.int32,
+    "fk_cube": np.int32,
+    "fk_solve_type": np.int32,
+}
+# Código de cada penalización en la columna penalty
+PENALTIES = (Penalty.OK, Penalty.PLUS_TWO, Penalty.DNF)
+PENALTY_CODES = {penalty: code for code, penalty in enumerate(PENALTIES)}
+# Valor que representa un nulo en las columnas de claves
+NULL = -1
+
+
+# Función para convertir fechas (datetime) en milisegundos desde 1970
+def to_timestamps(dates) -> np.ndarray:
+    return np.array(dates, dtype="datetime64[ms]").astype(np.int64)
+
+
+# Función para convertir milisegundos desde 1970 en un datetime
+def to_datetime(timestamp) -> datetime:
+    return np.int64(timestamp).astype("datetime64[ms]").item()
+
+
+# Función para leer una clave nula (-1) como None
+def key_value(value):
+    return None if value == NULL else int(value)
+
+
+# Une varias series (ids, timestamps, tiempos) en una sola, ordenada por (date, id_solve)
+def merge_series(*series):
+    ids = np.concatenate([s[0] for s in series]).astype(np.int64)
+    timestamps = np.concatenate([s[1] for s in series]).astype(np.int64)
+    results = np.concatenate([s[2] for s in series]).astype(np.float64)
+    order = np.lexsort((ids, timestamps))
+    return ids[order], timestamps[order], results[order]
+
+
+def user_dir(id_user: int) -> str:
+    return os.path.join(ARCHIVE_DIR, f"user-{id_user}")
+
+
+# Generaciones de los segmentos vigentes según el manifiesto (los manifiestos
+# anteriores a los segmentos indican una sola generación)
+def manifest_segments(manifest: dict) -> list:
+    return manifest.get("segments", [manifest["generation"]])
+
+
+# Un segmento de los archivos de un usuario, con memoria mapeada
+class ArchiveSegment:
+    def __init__(self, path: str, generation: int):
+        self.generation = generation
+        self.columns = {
+            name: np.load(os.path.join(path, f"{name}.{generation}.npy"), mmap_mode="r") for name in COLUMNS
+        }
+        self.scramble_data = np.load(os.path.join(path, f"scramble_data.{generation}.npy"), mmap_mode="r")
+        self.scramble_offsets = np.load(os.path.join(path, f"scramble_offsets.{generation}.npy"), mmap_mode="r")
+
+    def __len__(self):
+        return len(self.columns["id_solve"])
+
+    def scramble(self, position: int) -> str:
+        start, stop = self.scramble_offsets[position], self.scramble_offsets[position + 1]
+        return bytes(self.scramble_data[start:stop]).decode()
+
+
+# Solves archivados de un usuario. Las posiciones (`index`) son pares de
+# arreglos (número de segmento, posición dentro del segmento)
+class UserArchive:
+    # Los segmentos de `previous` (la generación anterior abierta) que siguen
+    # vigentes se reutilizan en lugar de volver a abrirlos
+    def __init__(self, path: str, manifest: dict, previous=None):
+        self.generation = manifest["generation"]
+        self.max_id = manifest.get("max_id", 0)
+        opened = {segment.generation: segment for segment in previous.segments} if previous is not None else {}
+        self.segments = [
+            opened.get(generation) or ArchiveSegment(path, generation) for generation in manifest_segments(manifest)
+        ]
+
+    def __len__(self):
+        return sum(len(segment) for segment in self.segments)
+
+    # Valores de una columna en unas posiciones
+    def column(self, name: str, index) -> np.ndarray:
+        parts, positions = index
+        values = np.empty(len(positions), dtype=COLUMNS[name])
+        for number, segment in enumerate(self.segments):
+            mask = parts == number
+            values[mask] = segment.columns[name][positions[mask]]
+        return values
+
+    # Tiempos con su penalización (los DNF valen infinito, como en stats.py)
+    def results(self, index) -> np.ndarray:
+        ms = self.column("time_ms", index).astype(np.float64)
+        penalty = self.column("penalty", index)
+        ms[penalty == PENALTY_CODES[Penalty.PLUS_TWO]] += PLUS_TWO_MS
+        ms[penalty == PENALTY_CODES[Penalty.DNF]] = DNF
+        return ms
+
+    # Posiciones de los solves de unas sesiones, ordenadas por (date, id_solve)
+    def sessions_index(self, id_sessions):
+        parts, positions = [np.empty(0, dtype=np.int64)], [np.empty(0, dtype=np.int64)]
+        for number, segment in enumerate(self.segments):
+            found = np.flatnonzero(np.isin(segment.columns["fk_session"], list(id_sessions)))
+            parts.append(np.full(len(found), number, dtype=np.int64))
+            positions.append(found)
+        index = (np.concatenate(parts), np.concatenate(positions))
+        order = np.lexsort((self.column("id_solve", index), self.column("date", index)))
+        return index[0][order], index[1][order]
+
+    # Solves en el mismo formato que los listados (ver routers/solve.py)
+    def rows(self, index):
+        for number, position in zip(*index):
+            segment = self.segments[number]
+            columns = segment.columns
+            yield {
+                "id_solve": int(columns["id_solve"][position]),
+                "date": to_datetime(columns["date"][position]).isoformat(),
+                "time_ms": int(columns["time_ms"][position]),
+                "penalty": PENALTIES[columns["penalty"][position]].value,
+                "scramble": segment.scramble(position),
+                "fk_cube": key_value(columns["fk_cube"][position]),
+                "fk_solve_type": key_value(columns["fk_solve_type"][position]),
+                "fk_session": key_value(columns["fk_session"][position]),
+            }
+
+
+# Archivos abiertos por usuario, del menos al más usado: {id_user: UserArchive}
+_opened = OrderedDict()
+_opened_lock = Lock()
+
+
+# Abrimos los archivos vigentes de un usuario (None si no tiene). Si la
+# generación leída se reemplaza mientras se abre, se vuelve a leer el manifiesto
+def open_archive(id_user: int, attempts: int = 3):
+    path = user_dir(id_user)
+    for attempt in range(attempts):
+        try:
+            with open(os.path.join(path, "manifest.json")) as file:
+                manifest = json.load(file)
+        except FileNotFoundError:
+            return None
+        try:
+            with _opened_lock:
+                archive = _opened.get(id_user)
+                if archive is None or archive.generation != manifest["generation"]:
+                    archive = _opened[id_user] = UserArchive(path, manifest, archive)
+                _opened.move_to_end(id_user)
+                # Los archivos de los usuarios descartados se cierran cuando
+                # ningún lector los está usando
+                while len(_opened) > ARCHIVE_CACHE_SIZE:
+                    _opened.popitem(last=False)
+                return archive
+        except FileNotFoundError:
+            if attempt == attempts - 1:
+                raise
+
+
+# Sesiones archivadas por usuario: {id_user: {id_session, ...}}
+def archived_sessions(db: Session, user_ids=None) -> dict:
+    query = select(SessionModel.fk_user, SessionModel.id_session).where(
+        SessionModel.archived.is_(True), SessionModel.fk_user.is_not(None))
+    if user_ids is not None:
+        query = query.where(SessionModel.fk_user.in_(list(user_ids)))
+    sessions = {}
+    for fk_user, id_session in db.execute(query):
+        sessions.setdefault(fk_user, set()).add(id_session)
+    return sessions
+
+
+# Solves archivados (de sesiones marcadas como archivadas) de los usuarios
+# indicados, o de todos. Devuelve {id_user: columnas} con id_solve, date,
+# result (con la penalización), fk_session, fk_cube_type y fk_solve_type
+def archived_solves(db: Session, user_ids=None) -> dict:
+    sessions = archived_sessions(db, user_ids)
+    if not sessions:
+        return {}
+    # Tipo de cubo de cada cubo, por id (el último elemento queda en NULL para
+    # los solves sin cubo o con un cubo que ya no existe)
+    cube_types = dict(db.execute(select(Cube.id_cube, Cube.fk_cube_type)).all())
+    lookup = np.full(max(cube_types, default=0) + 2, NULL, dtype=np.int32)
+    for id_cube, fk_cube_type in cube_types.items():
+        lookup[id_cube] = NULL if fk_cube_type is None else fk_cube_type
+    solves = {}
+    for id_user, id_sessions in sessions.items():
+        archive = open_archive(id_user)
+        if archive is None:
+            continue
+        index = archive.sessions_index(id_sessions)
+        fk_cube = np.clip(archive.column("fk_cube", index), NULL, len(lookup) - 1)
+        solves[id_user] = {
+            "id_solve": archive.column("id_solve", index),
+            "date": archive.column("date", index),
+            "result": archive.results(index),
+            "fk_session": archive.column("fk_session", index),
+            "fk_cube_type": lookup[fk_cube],
+            "fk_solve_type": archive.column("fk_solve_type", index),
+        }
+    return solves
+
+
+# Escribimos un segmento de los archivos de un usuario con los solves
+# nuevos (`columns` y `scrambles`, en cualquier orden). Si ya tiene
+# ARCHIVE_MAX_SEGMENTS segmentos, o alguno contiene solves que se vuelven a
+# archivar (de una ejecución interrumpida: mismo id_solve y misma fecha),
+# todos se compactan con los nuevos en un único segmento
+def write_archive(id_user: int, columns: dict, scrambles: list):
+    path = user_dir(id_user)
+    os.makedirs(path, exist_ok=True)
+    current = open_archive(id_user)
+    encoded = [scramble.encode() for scramble in scrambles]
+    lengths = np.array([len(scramble) for scramble in encoded], dtype=np.int64)
+    data = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    columns = {name: np.asarray(columns[name], dtype=dtype) for name, dtype in COLUMNS.items()}
+    segments, previous_rows = [], 0
+    max_id = int(columns["id_solve"].max())
+    if current is not None:
+        max_id = max(max_id, current.max_id)
+        dates = dict(zip(columns["id_solve"].tolist(), columns["date"].tolist()))
+        keep = []
+        for segment in current.segments:
+            repeated = np.flatnonzero(np.isin(segment.columns["id_solve"], columns["id_solve"]))
+            repeated = [position for position in repeated.tolist()
+                        if dates[int(segment.columns["id_solve"][position])] == int(segment.columns["date"][position])]
+            keep.append(np.setdiff1d(np.arange(len(segment)), repeated))
+        if len(current.segments) < ARCHIVE_MAX_SEGMENTS and all(
+                len(kept) == len(segment) for kept, segment in zip(keep, current.segments)):
+            segments = [segment.generation for segment in current.segments]
+            previous_rows = len(current)
+        else:
+            # Compactamos: el segmento nuevo incluye las filas que se conservan
+            old_columns, old_lengths, old_data = [], [], []
+            for segment, kept in zip(current.segments, keep):
+                offsets = segment.scramble_offsets
+                kept_lengths = (offsets[1:] - offsets[:-1])[kept]
+                old_columns.append({name: segment.columns[name][kept] for name in COLUMNS})
+                old_lengths.append(kept_lengths)
+                old_data.append(gather(segment.scramble_data, offsets[:-1][kept], kept_lengths))
+            columns = {name: np.concatenate([part[name] for part in old_columns] + [columns[name]]) for name in COLUMNS}
+            lengths = np.concatenate(old_lengths + [lengths])
+            data = np.concatenate(old_data + [data])
+    # Ordenamos por (date, id_solve), también los scrambles
+    order = np.lexsort((columns["id_solve"], columns["date"]))
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    data = gather(data, starts[order], lengths[order])
+    lengths = lengths[order]
+    generation = (current.generation + 1) if current is not None else 1
+    segments.append(generation)
+    for name, dtype in COLUMNS.items():
+        np.save(os.path.join(path, f"{name}.{generation}.npy"), np.asarray(columns[name], dtype=dtype)[order])
+    np.save(os.path.join(path, f"scramble_data.{generation}.npy"), data)
+    np.save(os.path.join(path, f"scramble_offsets.{generation}.npy"), np.concatenate(([0], np.cumsum(lengths))))
+    rows = previous_rows + int(len(order))
+    # Publicamos los segmentos vigentes y borramos los demás (los lectores
+    # que aún los tengan abiertos conservan su copia hasta cerrarlos)
+    temporary = os.path.join(path, f"manifest.json.{os.getpid()}.tmp")
+    with open(temporary, "w") as file:
+        json.dump({"generation": generation, "segments": segments, "rows": rows, "max_id": max_id}, file)
+    os.replace(temporary, os.path.join(path, "manifest.json"))
+    live = {str(segment) for segment in segments}
+    for name in os.listdir(path):
+        parts = name.split(".")
+        if len(parts) == 3 and parts[2] == "npy" and parts[1] not in live:
+            os.remove(os.path.join(path, name))
+
+
+# Mayor id_solve archivado, según los manifiestos de todos los usuarios
+def max_archived_id() -> int:
+    top = 0
+    if not os.path.isdir(ARCHIVE_DIR):
+        return top
+    for name in os.listdir(ARCHIVE_DIR):
+        try:
+            with open(os.path.join(ARCHIVE_DIR, name, "manifest.json")) as file:
+                top = max(top, json.load(file).get("max_id", 0))
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+    return top
+
+
+# Subimos el contador de id_solve por encima de los ids archivados
+def reserve_ids(connection):
+    top = max_archived_id()
+    if not top or top <= (connection.scalar(select(func.max(Solve.id_solve))) or 0):
+        return
+    if connection.dialect.name == "mysql":
+        connection.execute(text(f"ALTER TABLE solve AUTO_INCREMENT = {top + 1}"))
+    elif connection.dialect.name == "sqlite" and connection.scalar(
+            text("SELECT count(*) FROM sqlite_master WHERE name = 'sqlite_sequence'")):
+        connection.execute(text("UPDATE sqlite_sequence SET seq = MAX(seq, :top) WHERE name = 'solve'"), {"top": top})
+
+
+# Copia de los tramos [start, start + length) de un arreglo de bytes, concatenados
+def gather(data, starts, lengths) -> np.ndarray:
+    total = int(lengths.sum())
+    if not total:
+        return np.empty(0, dtype=np.uint8)
+    offsets = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    index = np.repeat(starts - offsets, lengths) + np.arange(total)
+    return np.asarray(data)[index]
+
+
+# Sesiones con solves en la tabla solve cuyo último solve es anterior a
+# `cutoff` (incluye los solves agregados a una sesión ya archivada)
+def sessions_to_archive(db: Session, cutoff: datetime) -> dict:
+    rows = db.execute(
+        select(SessionModel.fk_user, SessionModel.id_session)
+        .join(Solve, Solve.fk_session == SessionModel.id_session)
+        .where(SessionModel.fk_user.is_not(None))
+        .group_by(SessionModel.fk_user, SessionModel.id_session)
+        .having(func.max(Solve.date) < cutoff)
+    )
+    sessions = {}
+    for fk_user, id_session in rows:
+        sessions.setdefault(fk_user, []).append(id_session)
+    return sessions
+
+
+# Archivamos las sesiones de un usuario: escribimos sus solves en los
+# archivos y, en una misma transacción, borramos esos solves de la tabla y
+# marcamos las sesiones como archivadas
+def archive_user(db: Session, id_user: int, id_sessions: list) -> int:
+    rows = db.execute(
+        select(Solve.id_solve, Solve.date, Solve.time_ms, Solve.penalty, Solve.fk_session,
+               Solve.fk_cube, Solve.fk_solve_type, Solve.scramble)
+        .where(Solve.fk_session.in_(id_sessions))
+    ).all()
+    if not rows:
+        return 0
+    null = lambda value: NULL if value is None else value
+    write_archive(id_user, {
+        "id_solve": np.array([row.id_solve for row in rows], dtype=np.int64),
+        "date": to_timestamps([row.date for row in rows]),
+        "time_ms": np.array([row.time_ms for row in rows], dtype=np.int32),
+        "penalty": np.array([PENALTY_CODES[Penalty(row.penalty)] for row in rows], dtype=np.int8),
+        "fk_session": np.array([null(row.fk_session) for row in rows], dtype=np.int32),
+        "fk_cube": np.array([null(row.fk_cube) for row in rows], dtype=np.int32),
+        "fk_solve_type": np.array([null(row.fk_solve_type) for row in rows], dtype=np.int32),
+    }, [row.scramble or "" for row in rows])
+    # Borramos sólo los solves archivados: uno agregado después de leerlos sigue en la tabla
+    ids = [row.id_solve for row in rows]
+    for offset in range(0, len(ids), DELETE_CHUNK_SIZE):
+        db.execute(delete(Solve).where(Solve.id_solve.in_(ids[offset:offset + DELETE_CHUNK_SIZE])))
+    db.execute(update(SessionModel).where(SessionModel.id_session.in_(id_sessions)).values(archived=True))
+    # Los clientes reciben el cambio de la marca por /sync (ver changes.py)
+    change_log.sessions_saved(db, [(id_session, id_user) for id_session in id_sessions])
+    db.commit()
+    reserve_ids(db.connection())
+    db.commit()
+    return len(rows)
+
+
+# Archivamos todas las sesiones sin actividad desde hace `days` días
+def archive_sessions(days: int = ARCHIVE_AFTER_DAYS, dry_run: bool = False) -> dict:
+    db = SessionLocal()
+    try:
+        sessions = sessions_to_archive(db, datetime.utcnow() - timedelta(days=days))
+        archived = {"users": len(sessions), "sessions": sum(len(ids) for ids in sessions.values()), "solves": 0}
+        if not dry_run:
+            for id_user, id_sessions in sorted(sessions.items()):
+                archived["solves"] += archive_user(db, id_user, id_sessions)
+        return archived
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Archiva los solves de las sesiones antiguas")
+    parser.add_argument("--older-than", type=int, default=ARCHIVE_AFTER_DAYS, help="días sin solves nuevos")
+    parser.add_argument("--dry-run", action="store_true", help="sólo contar lo que se archivaría")
+    args = parser.parse_args()
+    result = archive_sessions(args.older_than, args.dry_run)
+    print(f"{result['sessions']} sesiones de {result['users']} usuarios, {result['solves']} solves archivados")
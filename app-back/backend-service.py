@@ -1,6 +1,10 @@
 # Servicio backend para la aplicación utilizando FastAPI
 
+# Medimos el tiempo de arranque desde antes de importar el resto (ver startup.py)
+import startup
+
 # Importamos fastapi
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -11,9 +15,51 @@ from routers import cube_type
 from routers import cube
 from routers import solve
 from routers import user
+from routers import export
+from routers import health
+from routers import scramble
+from routers import leaderboard
+from routers import sync
+
+# Importamos la clase de respuesta JSON rápida (orjson)
+from responses import FastJSONResponse
+
+# Importamos el middleware de métricas
+from metrics import MetricsMiddleware
+
+# Importamos las tablas y las reservas del generador de scrambles
+from scramble import get_tables
+from scramble.pool import scramble_pools
+from leaderboard import leaderboards
+from stats import stats_engine
+from relay import relay
+
+startup.mark("import")
+
+# Tareas de inicio y cierre de la aplicación
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Abrimos con memoria mapeada (o generamos, la primera vez) las tablas del solver de scrambles
+    get_tables()
+    # Empezamos a llenar las reservas de scrambles en segundo plano
+    scramble_pools.start()
+    # Construimos los rankings desde la base de datos en segundo plano
+    leaderboards.start()
+    # Guardamos en segundo plano las estadísticas de las sesiones modificadas
+    stats_engine.queue.start()
+    # Retransmitimos a los WebSocket los cambios hechos por los demás workers
+    relay.start()
+    # Registramos cuánto tardó el arranque y avisamos si supera el presupuesto
+    startup.mark("boot")
+    startup.check_budget()
+    yield
+    await relay.stop()
+    await stats_engine.queue.stop()
+    await leaderboards.stop()
+    await scramble_pools.stop()
 
 # Inicialización de la aplicación
-app = FastAPI()
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
 
 # Configuración de CORS
 app.add_middleware(
@@ -22,12 +68,21 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Permitir todos los métodos HTTP
     allow_headers=["*"],  # Permitir todos los encabezados
+    expose_headers=["X-Next-Cursor", "X-Query-Count"],  # Cursor de la siguiente página de solves y consultas SQL de la petición
 )
 
+# Métricas de latencia y consultas SQL por ruta (ver /metrics)
+app.add_middleware(MetricsMiddleware)
+
 app.include_router(session.router)
 app.include_router(solve_type.router)
 app.include_router(cube_type.router)
 app.include_router(cube.router)
 app.include_router(solve.router)
 app.include_router(user.router)
+app.include_router(export.router)
+app.include_router(health.router)
+app.include_router(scramble.router)
+app.include_router(leaderboard.router)
+app.include_router(sync.router)
 
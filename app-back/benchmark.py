@@ -0,0 +1,438 @@
+# Benchmark reproducible de la API
+
+# Crea (o reutiliza) una base de datos SQLite con datos sintéticos generados
+# a partir de una semilla, levanta backend-service.py con uvicorn apuntando a
+# ella y lanza una carga mixta (registrar tiempos, listar solves, estadísticas,
+# login, ...) desde varios hilos con conexiones keep-alive. Al terminar
+# escribe en JSON, por cada ruta, la cantidad de peticiones, errores,
+# throughput y latencias p50/p95/p99, junto con el commit y los parámetros
+# usados, para poder comparar dos ejecuciones.
+#
+# Uso:
+#   python benchmark.py run --users 1000 --solves 1000000 --output base.json
+#   python benchmark.py run --reuse --output new.json
+#   python benchmark.py compare base.json new.json --threshold 10
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import urlencode
+
+import numpy as np
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Contraseña de todos los usuarios sintéticos
+BENCH_PASSWORD = "bench"
+# Filas por bloque al insertar los datos sintéticos
+SEED_CHUNK_SIZE = 10000
+# Caras y modificadores para generar scrambles de 3x3 válidos
+FACES = "RLUDFB"
+SUFFIXES = ("", "'", "2")
+
+# Proporción de cada operación en la carga por defecto
+DEFAULT_MIX = "timing=40,listing=20,session_stats=15,user_stats=5,put_session=5,login=5,leaderboard=5,scramble=5"
+
+
+# Genera un scramble de 3x3 de `length` movimientos sin repetir cara seguida
+def random_scramble(rng: random.Random, length: int = 20) -> str:
+    moves, last = [], None
+    for _ in range(length):
+        face = rng.choice(FACES)
+        while face == last:
+            face = rng.choice(FACES)
+        last = face
+        moves.append(face + rng.choice(SUFFIXES))
+    return " ".join(moves)
+
+
+# Datos sintéticos
+
+# Insertamos usuarios, sesiones y solves de forma determinista según la semilla.
+# La actividad de cada usuario sigue una distribución log-normal (pocos
+# usuarios con muchos solves) y cada uno tiene su propio nivel de tiempos
+def seed_database(args):
+    from sqlalchemy import insert
+    from database import engine, Cube, CubeType, Session as SessionModel, Solve, SolveType, User
+    from migrations import upgrade
+    from routers.user import hash_password
+    from user_stats import mark_users_stale
+
+    rng = random.Random(args.seed)
+    upgrade(engine)
+    password = hash_password(BENCH_PASSWORD)
+    weights = [rng.lognormvariate(0, 1) for _ in range(args.users)]
+    scale = args.solves / sum(weights)
+    counts = [int(weight * scale) for weight in weights]
+    counts[0] += args.solves - sum(counts)
+    start = datetime(2024, 1, 1)
+
+    with engine.begin() as connection:
+        connection.execute(insert(CubeType), [{"id_cube_type": 1, "cube_type": "3x3"}, {"id_cube_type": 2, "cube_type": "2x2"}])
+        connection.execute(insert(SolveType), [{"id_solve_type": 1, "solve_type": "normal"}, {"id_solve_type": 2, "solve_type": "oh"}])
+        connection.execute(insert(Cube), [
+            {"id_cube": 1, "brand": "GAN", "model": "12", "fk_cube_type": 1, "magnetic": True},
+            {"id_cube": 2, "brand": "MoYu", "model": "RS3M", "fk_cube_type": 1, "magnetic": True},
+        ])
+        connection.execute(insert(User), [
+            {"id_user": u, "name": f"User {u}", "username": f"user{u}", "password": password, "email": f"user{u}@bench.local"}
+            for u in range(1, args.users + 1)
+        ])
+        sessions, solves, id_session = [], [], 0
+        for u, count in enumerate(counts, start=1):
+            level = rng.uniform(8000, 40000)
+            per_session = -(-count // args.sessions_per_user) if count else 0
+            for _ in range(args.sessions_per_user):
+                id_session += 1
+                qty = min(per_session, count)
+                count -= qty
+                sessions.append({"id_session": id_session, "name": id_session, "avg": 0, "ao5": 0, "ao12": 0, "qty": qty, "fk_user": u})
+                date = start + timedelta(days=rng.randrange(365))
+                for _ in range(qty):
+                    date += timedelta(seconds=rng.randint(20, 60))
+                    solves.append({
+                        "date": date,
+                        "time_ms": max(1000, int(rng.gauss(level, level * 0.12))),
+                        "scramble": random_scramble(rng),
+                        "fk_cube": rng.choice((1, 2)),
+                        "fk_solve_type": 1 if rng.random() < 0.9 else 2,
+                        "fk_session": id_session,
+                    })
+                    if len(solves) >= SEED_CHUNK_SIZE:
+                        # Las sesiones van antes que sus solves, por las claves foráneas
+                        if sessions:
+                            connection.execute(insert(SessionModel), sessions)
+                            sessions = []
+                        connection.execute(insert(Solve), solves)
+                        solves = []
+        if sessions:
+            connection.execute(insert(SessionModel), sessions)
+        if solves:
+            connection.execute(insert(Solve), solves)
+        # Filas de estadísticas por usuario, que se calculan en la primera consulta
+        mark_users_stale(connection)
+
+
+# Sesiones existentes por usuario, para elegir a quién apuntar en la carga
+def load_targets():
+    from sqlalchemy import select
+    from database import engine, Session as SessionModel
+
+    with engine.connect() as connection:
+        rows = connection.execute(select(SessionModel.id_session, SessionModel.fk_user)).all()
+    targets = {}
+    for id_session, fk_user in rows:
+        targets.setdefault(fk_user, []).append(id_session)
+    return sorted(targets.items())
+
+
+# Servidor
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# Levantamos backend-service.py con uvicorn y esperamos a que responda
+def start_server(args, env, port):
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend-service:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(args.workers), "--log-level", "warning"],
+        cwd=APP_DIR, env=env,
+        # Grupo de procesos propio, para detener también los procesos hijos (workers y generadores de scrambles)
+        start_new_session=True,
+    )
+    deadline = time.monotonic() + args.startup_timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f"backend-service exited with code {server.returncode}")
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=5)
+            connection.request("GET", "/health/db")
+            if connection.getresponse().status == 200:
+                return server
+        except OSError:
+            pass
+        time.sleep(0.5)
+    stop_server(server)
+    raise SystemExit("backend-service did not start in time")
+
+
+def stop_server(server):
+    try:
+        os.killpg(server.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        return
+    try:
+        server.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        os.killpg(server.pid, signal.SIGKILL)
+
+
+# Carga
+
+# Convierte "timing=40,listing=20" en ([operaciones], [pesos])
+def parse_mix(mix: str):
+    operations, weights = [], []
+    for item in mix.split(","):
+        name, weight = item.split("=")
+        if name not in OPERATIONS:
+            raise SystemExit(f"Unknown operation {name!r}; choose from {', '.join(OPERATIONS)}")
+        operations.append(name)
+        weights.append(float(weight))
+    return operations, weights
+
+
+# Cada operación devuelve (nombre de la ruta, método, url, cuerpo, cabeceras)
+def op_timing(rng, id_user, id_session):
+    body = {
+        "date": datetime.utcnow().isoformat(),
+        "time_ms": rng.randint(8000, 40000),
+        "scramble": random_scramble(rng),
+        "fk_cube": 1,
+        "fk_solve_type": 1,
+        "fk_session": id_session,
+    }
+    return "POST /session/{id}/solve/", "POST", f"/session/{id_session}/solve/", json.dumps(body), {"Content-Type": "application/json"}
+
+
+def op_listing(rng, id_user, id_session):
+    return "GET /session/{id}/solve/", "GET", f"/session/{id_session}/solve/?limit=100", None, {}
+
+
+def op_session_stats(rng, id_user, id_session):
+    return "GET /session/{id}/stats", "GET", f"/session/{id_session}/stats", None, {}
+
+
+def op_user_stats(rng, id_user, id_session):
+    return "GET /user/{id}/stats", "GET", f"/user/{id_user}/stats", None, {}
+
+
+def op_put_session(rng, id_user, id_session):
+    body = {"name": str(id_session), "avg": 0, "ao5": 0, "ao12": 0, "qty": 0, "fk_user": id_user}
+    return "PUT /session/{id}", "PUT", f"/session/{id_session}", json.dumps(body), {"Content-Type": "application/json"}
+
+
+def op_login(rng, id_user, id_session):
+    body = urlencode({"username": f"user{id_user}", "password": BENCH_PASSWORD})
+    return "POST /login", "POST", "/login", body, {"Content-Type": "application/x-www-form-urlencoded"}
+
+
+def op_leaderboard(rng, id_user, id_session):
+    metric = rng.choice(("single", "ao5", "ao12"))
+    return "GET /leaderboard/{fk_cube_type}", "GET", f"/leaderboard/1?metric={metric}", None, {}
+
+
+def op_scramble(rng, id_user, id_session):
+    return "GET /scramble/{cube_type}", "GET", "/scramble/3x3", None, {}
+
+
+OPERATIONS = {
+    "timing": op_timing,
+    "listing": op_listing,
+    "session_stats": op_session_stats,
+    "user_stats": op_user_stats,
+    "put_session": op_put_session,
+    "login": op_login,
+    "leaderboard": op_leaderboard,
+    "scramble": op_scramble,
+}
+
+
+# Hilo de carga: repite operaciones al azar (según la semilla del hilo) hasta
+# la fecha límite y guarda (ruta, inicio, latencia, estado) de cada una
+def worker(index, args, port, targets, mix, start_at, stop_at, results):
+    rng = random.Random(args.seed * 1000 + index)
+    operations, weights = mix
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    samples = []
+    while True:
+        now = time.monotonic()
+        if now >= stop_at:
+            break
+        id_user, sessions = rng.choice(targets)
+        operation = OPERATIONS[rng.choices(operations, weights)[0]]
+        route, method, url, body, headers = operation(rng, id_user, rng.choice(sessions))
+        began = time.perf_counter()
+        try:
+            connection.request(method, url, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+            status = 0
+        latency = time.perf_counter() - began
+        if now >= start_at:
+            samples.append((route, latency, status))
+    connection.close()
+    results[index] = samples
+
+
+# Resumen de latencias (en milisegundos) de un conjunto de muestras
+def summarize(latencies, errors, duration) -> dict:
+    values = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(values, (50, 95, 99)) if len(values) else (0.0, 0.0, 0.0)
+    return {
+        "count": int(len(values)),
+        "errors": int(errors),
+        "throughput_rps": round(len(values) / duration, 2),
+        "latency_ms": {
+            "mean": round(float(values.mean()), 3) if len(values) else 0.0,
+            "p50": round(float(p50), 3),
+            "p95": round(float(p95), 3),
+            "p99": round(float(p99), 3),
+            "max": round(float(values.max()), 3) if len(values) else 0.0,
+        },
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=APP_DIR, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    path = os.path.abspath(args.db)
+    os.environ["DB_BACKEND"] = "sqlite"
+    os.environ["SQLITE_PATH"] = path
+    sys.path.insert(0, APP_DIR)
+    if not (args.reuse and os.path.exists(path)):
+        # La base de SQLite en modo WAL deja también los archivos -wal y -shm
+        for leftover in (path, path + "-wal", path + "-shm"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        began = time.monotonic()
+        seed_database(args)
+        print(f"Seeded {args.users} users and {args.solves} solves in {time.monotonic() - began:.1f}s", file=sys.stderr)
+    targets = load_targets()
+    mix = parse_mix(args.mix)
+
+    port = free_port()
+    server = start_server(args, dict(os.environ), port)
+    try:
+        results = [None] * args.concurrency
+        start_at = time.monotonic() + args.warmup
+        stop_at = start_at + args.duration
+        threads = [
+            threading.Thread(target=worker, args=(i, args, port, targets, mix, start_at, stop_at, results))
+            for i in range(args.concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        stop_server(server)
+
+    routes = {}
+    for samples in results:
+        for route, latency, status in samples:
+            entry = routes.setdefault(route, ([], [0]))
+            entry[0].append(latency)
+            if status == 0 or status >= 400:
+                entry[1][0] += 1
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "date": datetime.utcnow().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "params": {
+                "users": args.users, "solves": args.solves, "sessions_per_user": args.sessions_per_user,
+                "seed": args.seed, "concurrency": args.concurrency, "duration": args.duration,
+                "warmup": args.warmup, "workers": args.workers, "mix": args.mix,
+            },
+        },
+        "routes": {
+            route: summarize(latencies, errors[0], args.duration)
+            for route, (latencies, errors) in sorted(routes.items())
+        },
+        "total": summarize(
+            [latency for latencies, _ in routes.values() for latency in latencies],
+            sum(errors[0] for _, errors in routes.values()),
+            args.duration,
+        ),
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+
+# Comparación de dos ejecuciones: muestra la variación de cada ruta y
+# termina con código 1 si algún p95 empeoró más que el umbral indicado
+def compare(args):
+    with open(args.base) as file:
+        base = json.load(file)
+    with open(args.new) as file:
+        new = json.load(file)
+    regressions = []
+    print(f"{'route':38} {'metric':>6} {'base':>10} {'new':>10} {'change':>8}")
+    for route in sorted(set(base["routes"]) | set(new["routes"])):
+        old_route, new_route = base["routes"].get(route), new["routes"].get(route)
+        if old_route is None or new_route is None:
+            print(f"{route:38} only in {'new' if old_route is None else 'base'}")
+            continue
+        rows = [(metric, old_route["latency_ms"][metric], new_route["latency_ms"][metric]) for metric in ("p50", "p95", "p99")]
+        rows.append(("rps", old_route["throughput_rps"], new_route["throughput_rps"]))
+        for metric, old, value in rows:
+            change = (value - old) / old * 100 if old else 0.0
+            print(f"{route:38} {metric:>6} {old:>10.2f} {value:>10.2f} {change:>+7.1f}%")
+            if metric == "p95" and change > args.threshold:
+                regressions.append(route)
+    if regressions:
+        print(f"p95 regressions over {args.threshold}%: {', '.join(regressions)}", file=sys.stderr)
+        sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark reproducible de la API")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="sembrar datos, levantar el servidor y medir")
+    run_parser.add_argument("--db", default=os.path.join(tempfile.gettempdir(), "scramble-timer-bench.db"))
+    run_parser.add_argument("--reuse", action="store_true", help="reutilizar la base de datos si ya existe")
+    run_parser.add_argument("--users", type=int, default=1000)
+    run_parser.add_argument("--sessions-per-user", type=int, default=3)
+    run_parser.add_argument("--solves", type=int, default=1000000)
+    run_parser.add_argument("--seed", type=int, default=42)
+    run_parser.add_argument("--concurrency", type=int, default=16)
+    run_parser.add_argument("--duration", type=float, default=30)
+    run_parser.add_argument("--warmup", type=float, default=5)
+    run_parser.add_argument("--workers", type=int, default=1, help="workers de uvicorn")
+    run_parser.add_argument("--startup-timeout", type=float, default=300)
+    run_parser.add_argument("--mix", default=DEFAULT_MIX)
+    run_parser.add_argument("--output")
+    run_parser.set_defaults(function=run)
+
+    compare_parser = commands.add_parser("compare", help="comparar dos resultados en JSON")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=10, help="porcentaje de empeoramiento del p95 tolerado")
+    compare_parser.set_defaults(function=compare)
+
+    args = parser.parse_args()
+    args.function(args)
+
+
+if __name__ == "__main__":
+    main()
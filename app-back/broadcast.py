@@ -0,0 +1,97 @@
+# Difusión de eventos en vivo a los clientes conectados por WebSocket
+
+# Cada canal (por ejemplo, una sesión) tiene un conjunto de suscriptores, y
+# cada suscriptor tiene su propia cola acotada (BROADCAST_QUEUE_SIZE). Al
+# publicar, el evento se serializa una sola vez y se deja en la cola de cada
+# suscriptor sin esperar: un cliente lento nunca frena a los demás ni a la
+# petición que publica. Si la cola de un cliente se llena, se vacía y se le
+# envía un único evento "resync", para que vuelva a pedir los datos por la API.
+#
+# Cada proceso difunde al momento sus propias escrituras. Las de los demás
+# procesos (otros workers) le llegan desde el registro de cambios (ver relay.py).
+
+import asyncio
+import os
+
+from responses import dumps
+
+# Cantidad máxima de eventos pendientes por cliente
+BROADCAST_QUEUE_SIZE = int(os.getenv("BROADCAST_QUEUE_SIZE", "100"))
+
+# Evento que reemplaza a los pendientes de un cliente que se quedó atrás
+RESYNC = dumps({"type": "resync"}).decode()
+
+
+# Suscriptor de un canal
+class Subscriber:
+    def __init__(self, size: int = BROADCAST_QUEUE_SIZE):
+        self.queue = asyncio.Queue(maxsize=size)
+        self.dropped = 0
+
+    # Dejamos un evento en la cola sin esperar
+    def push(self, message: str):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            # El cliente no da abasto: descartamos lo pendiente y le pedimos que se resincronice
+            while not self.queue.empty():
+                self.queue.get_nowait()
+                self.dropped += 1
+            self.queue.put_nowait(RESYNC)
+
+    async def get(self) -> str:
+        return await self.queue.get()
+
+
+# Registro de canales y suscriptores del proceso
+class Broadcaster:
+    def __init__(self):
+        self.channels = {}
+        self.loop = None
+        self.published = 0
+
+    # Suscribimos un cliente a un canal
+    def subscribe(self, channel) -> Subscriber:
+        self.loop = asyncio.get_running_loop()
+        subscriber = Subscriber()
+        self.channels.setdefault(channel, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, channel, subscriber: Subscriber):
+        subscribers = self.channels.get(channel)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self.channels[channel]
+
+    # Indica si alguien escucha el canal, para no preparar eventos que nadie recibirá
+    def has_subscribers(self, channel) -> bool:
+        return bool(self.channels.get(channel))
+
+    # Publicamos un evento en un canal (desde el event loop)
+    def publish(self, channel, event: dict):
+        subscribers = self.channels.get(channel)
+        if not subscribers:
+            return
+        message = dumps(event).decode()
+        self.published += 1
+        for subscriber in list(subscribers):
+            subscriber.push(message)
+
+    # Publicamos un evento desde otro hilo (por ejemplo, un endpoint síncrono)
+    def publish_threadsafe(self, channel, event: dict):
+        if self.loop is not None and self.has_subscribers(channel):
+            self.loop.call_soon_threadsafe(self.publish, channel, event)
+
+    def metrics(self) -> dict:
+        return {
+            "channels": len(self.channels),
+            "subscribers": sum(len(subscribers) for subscribers in self.channels.values()),
+            "published": self.published,
+            "pending": sum(s.queue.qsize() for subscribers in self.channels.values() for s in subscribers),
+            "dropped": sum(s.dropped for subscribers in self.channels.values() for s in subscribers),
+        }
+
+
+# Instancia global del difusor de eventos
+broadcaster = Broadcaster()
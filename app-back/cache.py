@@ -0,0 +1,105 @@
+# Cachés en memoria del proceso
+
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import CatalogVersion
+
+
+# Caché acotado con expiración (TTL) y desalojo del menos usado (LRU)
+class TTLCache:
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._items = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # Obtenemos un valor, o `default` si no está o ya expiró
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[0] < monotonic():
+                if item is not None:
+                    del self._items[key]
+                self.misses += 1
+                return default
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = (monotonic() + self.ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    # Invalidamos todas las claves (tuplas) cuyo primer elemento es `prefix`
+    def invalidate_prefix(self, prefix):
+        with self._lock:
+            for key in [key for key in self._items if key[0] == prefix]:
+                del self._items[key]
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._items), "hits": self.hits, "misses": self.misses}
+
+
+# Caché de lectura de las tablas de catálogo (cube_type, solve_type, cube)
+
+# Son tablas pequeñas que casi no cambian: se guardan ya serializadas junto a
+# su ETag (hash del contenido, igual en todos los workers). Cada entrada se
+# guarda con la versión de su catálogo (tabla catalog_version), que los
+# endpoints de escritura incrementan en la misma transacción: así ningún worker
+# sirve una respuesta anterior a la última escritura confirmada, aunque la haya
+# hecho otro proceso. Cada lectura hace una consulta por clave primaria; el TTL
+# solo libera las entradas de versiones antiguas
+catalog_cache = TTLCache(maxsize=1024, ttl=float(os.getenv("CATALOG_CACHE_TTL", "300")))
+
+# Los clientes pueden guardar la respuesta pero deben revalidarla con If-None-Match
+CATALOG_CACHE_CONTROL = "public, max-age=0, must-revalidate"
+
+# Función para responder desde el caché (o cargando con `loader`), con 304 si
+# el cliente ya tiene la misma versión. La versión se lee en la misma
+# transacción que usa `loader`, así que la respuesta nunca es más antigua que ella
+async def cached_json(request: Request, db: AsyncSession, key: tuple, loader) -> Response:
+    version = await db.scalar(select(CatalogVersion.version).where(CatalogVersion.name == key[0]))
+    key = key + (version,)
+    entry = catalog_cache.get(key)
+    if entry is None:
+        body = json.dumps(jsonable_encoder(await loader())).encode()
+        entry = (body, '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"')
+        catalog_cache.set(key, entry)
+    body, etag = entry
+    headers = {"ETag": etag, "Cache-Control": CATALOG_CACHE_CONTROL}
+    tags = [tag.strip() for tag in request.headers.get("if-none-match", "").split(",")]
+    if etag in tags or "W/" + etag in tags or "*" in tags:
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
+
+# Función para invalidar todas las respuestas de uno o varios catálogos en
+# todos los workers: se llama antes del commit de la escritura, para que la
+# nueva versión se confirme junto con los cambios
+async def invalidate_catalog(db: AsyncSession, *names: str):
+    await db.execute(update(CatalogVersion).where(CatalogVersion.name.in_(names)).values(version=CatalogVersion.version + 1))
+    for name in names:
+        catalog_cache.invalidate_prefix(name)
@@ -0,0 +1,198 @@
+# Registro de cambios para la sincronización incremental de los clientes
+
+# Los endpoints que escriben solves, sesiones y cubos agregan, en la misma
+# transacción, una fila por entidad modificada a la tabla change_log con una
+# versión nueva. Un cliente guarda la última versión que recibió y pide con
+# GET /sync?since=<versión> sólo lo que cambió desde entonces, en lugar de
+# volver a descargar las listas completas.
+#
+# La versión sale de un contador de una sola fila (change_version) que se
+# incrementa justo antes de confirmar la transacción: el bloqueo de la fila
+# hace que las versiones se vuelvan visibles en orden creciente, así que un
+# cliente nunca se salta un cambio confirmado más tarde con una versión menor.
+#
+# Los cambios de más de CHANGE_LOG_RETENTION_DAYS días se purgan con
+# `python changes.py --prune`; un cliente con un cursor anterior a lo purgado
+# recibe "reset" y debe volver a descargar las listas completas.
+#
+# Uso: python changes.py --prune [--older-than DÍAS]
+
+import argparse
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, event, func, insert, literal, select, update
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, Change, ChangeVersion, Session as SessionModel, Solve
+
+# Días que se conservan los cambios
+CHANGE_LOG_RETENTION_DAYS = int(os.getenv("CHANGE_LOG_RETENTION_DAYS", "90"))
+
+# Entidades y operaciones del registro
+SOLVE, SESSION, CUBE = "solve", "session", "cube"
+UPSERT, DELETE = "upsert", "delete"
+
+# Clave de db.info con las versiones registradas en la transacción en curso
+RECORDED_VERSIONS = "change_log_versions"
+
+
+# Reservamos la versión siguiente (una por transacción)
+def next_version(db: Session) -> int:
+    db.execute(update(ChangeVersion).where(ChangeVersion.id == 1).values(version=ChangeVersion.version + 1))
+    return db.scalar(select(ChangeVersion.version).where(ChangeVersion.id == 1))
+
+
+# Última versión registrada y última versión purgada
+def versions(db: Session):
+    row = db.execute(select(ChangeVersion.version, ChangeVersion.pruned).where(ChangeVersion.id == 1)).first()
+    return (row.version, row.pruned) if row is not None else (0, 0)
+
+
+# Registro de cambios, compartido por todos los routers
+class ChangeLog:
+    def __init__(self):
+        # Funciones a las que se avisa de las versiones que confirma este proceso (ver relay.py)
+        self.listeners = []
+
+    # Registramos cambios (entity, entity_id, op, fk_user) con una versión
+    # nueva. Las entidades nuevas ya deben tener id (después de db.flush())
+    def record(self, db: Session, changes) -> int:
+        version = next_version(db)
+        now = datetime.utcnow()
+        db.execute(insert(Change), [
+            {"version": version, "entity": entity, "entity_id": entity_id, "op": op, "fk_user": fk_user,
+             "created_at": now}
+            for entity, entity_id, op, fk_user in changes
+        ])
+        db.info.setdefault(RECORDED_VERSIONS, []).append(version)
+        return version
+
+    # Usuario dueño de una sesión
+    def _session_user(self, db: Session, id_session):
+        if id_session is None:
+            return None
+        return db.scalar(select(SessionModel.fk_user).where(SessionModel.id_session == id_session))
+
+    # Registramos un solve creado o editado. Si cambió a una sesión de otro
+    # usuario, para el usuario anterior el solve se eliminó
+    def solve_saved(self, db: Session, db_solve: Solve, old_session=None):
+        db.flush()
+        fk_user = self._session_user(db, db_solve.fk_session)
+        changes = []
+        if old_session is not None and old_session != db_solve.fk_session:
+            old_user = self._session_user(db, old_session)
+            if old_user != fk_user:
+                changes.append((SOLVE, db_solve.id_solve, DELETE, old_user))
+        changes.append((SOLVE, db_solve.id_solve, UPSERT, fk_user))
+        return self.record(db, changes)
+
+    def solve_removed(self, db: Session, db_solve: Solve):
+        return self.record(db, [(SOLVE, db_solve.id_solve, DELETE, self._session_user(db, db_solve.fk_session))])
+
+    # Registramos los solves de una carga masiva en unas sesiones: los de id
+    # mayor que `after_id`, con un único INSERT ... SELECT
+    def solves_inserted(self, db: Session, id_sessions, after_id):
+        db.flush()
+        version = next_version(db)
+        db.execute(insert(Change).from_select(
+            ["version", "entity", "entity_id", "op", "fk_user", "created_at"],
+            select(literal(version), literal(SOLVE), Solve.id_solve, literal(UPSERT), SessionModel.fk_user,
+                   literal(datetime.utcnow()))
+            .join(SessionModel, Solve.fk_session == SessionModel.id_session)
+            .where(Solve.fk_session.in_(list(id_sessions)), Solve.id_solve > (after_id or 0)),
+        ))
+        db.info.setdefault(RECORDED_VERSIONS, []).append(version)
+        return version
+
+    def session_saved(self, db: Session, db_session: SessionModel):
+        db.flush()
+        return self.record(db, [(SESSION, db_session.id_session, UPSERT, db_session.fk_user)])
+
+    # Registramos sesiones modificadas fuera de los endpoints de sesiones (el
+    # guardado de sus estadísticas, el archivo): pares (id_session, fk_user)
+    def sessions_saved(self, db: Session, sessions):
+        sessions = list(sessions)
+        if not sessions:
+            return None
+        return self.record(db, [(SESSION, id_session, UPSERT, fk_user) for id_session, fk_user in sessions])
+
+    # Al eliminarse una sesión, el cliente descarta también sus solves
+    def session_removed(self, db: Session, db_session: SessionModel):
+        return self.record(db, [(SESSION, db_session.id_session, DELETE, db_session.fk_user)])
+
+    def cube_saved(self, db: Session, db_cube):
+        db.flush()
+        return self.record(db, [(CUBE, db_cube.id_cube, UPSERT, None)])
+
+    def cube_removed(self, db: Session, db_cube):
+        return self.record(db, [(CUBE, db_cube.id_cube, DELETE, None)])
+
+    # Cambios de un usuario (y de los cubos) posteriores a `since`, como mucho
+    # `limit` salvo que una sola versión tenga más. Devuelve (cambios, hay_más),
+    # con un único cambio (el último) por entidad
+    def since(self, db: Session, id_user: int, since: int, limit: int):
+        query = (
+            select(Change.version, Change.entity, Change.entity_id, Change.op)
+            .where((Change.fk_user == id_user) | Change.fk_user.is_(None), Change.version > since)
+        )
+        rows = db.execute(query.order_by(Change.version, Change.id_change).limit(limit + 1)).all()
+        has_more = len(rows) > limit
+        if has_more:
+            # No cortamos una versión a la mitad: el cursor del cliente avanza por versiones
+            last = rows[limit].version
+            if rows[0].version == last:
+                rows = db.execute(query.where(Change.version == last).order_by(Change.id_change)).all()
+            else:
+                rows = [row for row in rows if row.version < last]
+        latest = {}
+        for row in rows:
+            latest.pop((row.entity, row.entity_id), None)
+            latest[(row.entity, row.entity_id)] = row
+        return list(latest.values()), has_more
+
+
+# Instancia global del registro de cambios
+change_log = ChangeLog()
+
+
+# Al confirmar una transacción avisamos de sus versiones
+@event.listens_for(Session, "after_commit")
+def notify_versions(db: Session):
+    recorded = db.info.pop(RECORDED_VERSIONS, None)
+    if recorded:
+        for listener in change_log.listeners:
+            listener(recorded)
+
+
+# Si se deshace, sus versiones no llegan a existir (se vuelven a asignar)
+@event.listens_for(Session, "after_rollback")
+def discard_versions(db: Session):
+    db.info.pop(RECORDED_VERSIONS, None)
+
+
+# Borramos los cambios de más de `days` días y guardamos la última versión purgada
+def prune_changes(days: int = CHANGE_LOG_RETENTION_DAYS) -> int:
+    db = SessionLocal()
+    try:
+        cutoff = datetime.utcnow() - timedelta(days=days)
+        pruned = db.scalar(select(func.max(Change.version)).where(Change.created_at < cutoff))
+        if pruned is None:
+            return 0
+        db.execute(update(ChangeVersion).where(ChangeVersion.id == 1, ChangeVersion.pruned < pruned).values(pruned=pruned))
+        deleted = db.execute(delete(Change).where(Change.version <= pruned)).rowcount
+        db.commit()
+        return deleted
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Purga el registro de cambios de la sincronización")
+    parser.add_argument("--prune", action="store_true", help="borrar los cambios antiguos")
+    parser.add_argument("--older-than", type=int, default=CHANGE_LOG_RETENTION_DAYS, help="días que se conservan")
+    args = parser.parse_args()
+    if args.prune:
+        print(f"{prune_changes(args.older_than)} cambios purgados")
+    else:
+        parser.print_help()
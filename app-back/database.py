@@ -1,21 +1,53 @@
 # Importamos sqlalchemy
-from sqlalchemy import create_engine, Column, Integer, String, ForeignKey, DateTime, Time, Boolean
+from sqlalchemy import create_engine, Column, Integer, BigInteger, String, Text, ForeignKey, DateTime, Boolean, Index, Enum
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship, Session
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+import enum
+
+# Importamos la configuración del pool de conexiones
+from pool import TimedAsyncAdaptedQueuePool, TimedQueuePool, pool_options, watch_invalidations
+
+# Importamos el contador de consultas SQL por petición
+from metrics import watch_queries
 
 # Importamos la función Depends de FastAPI
 from fastapi import Depends
 
-# Configuración de la base de datos mysql
-from config import user, password, host, port, db_name
-SQLALCHEMY_DATABASE_URL = f"mysql+mysqlconnector://{user}:{password}@{host}:{port}/{db_name}"
-engine = create_engine(SQLALCHEMY_DATABASE_URL)
+# Motor de base de datos elegido por configuración: MySQL o SQLite (ver storage.py)
+import storage
+
+# Las opciones de cada engine son las del pool más las propias del motor,
+# que reemplazan las que no aplican (se muestran en /health/db)
+SQLALCHEMY_DATABASE_URL = storage.database_url()
+ENGINE_OPTIONS = {**pool_options(), **storage.engine_options(SQLALCHEMY_DATABASE_URL)}
+engine = create_engine(SQLALCHEMY_DATABASE_URL, poolclass=TimedQueuePool, **ENGINE_OPTIONS)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Configuración asíncrona de la base de datos, con el driver asíncrono del
+# mismo motor (aiomysql o aiosqlite)
+ASYNC_DATABASE_URL = storage.async_url(SQLALCHEMY_DATABASE_URL)
+ASYNC_ENGINE_OPTIONS = {**pool_options(), **storage.engine_options(ASYNC_DATABASE_URL)}
+async_engine = create_async_engine(ASYNC_DATABASE_URL, poolclass=TimedAsyncAdaptedQueuePool, **ASYNC_ENGINE_OPTIONS)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+storage.configure(engine)
+storage.configure(async_engine.sync_engine)
+watch_invalidations(engine)
+watch_invalidations(async_engine.sync_engine)
+watch_queries(engine)
+watch_queries(async_engine.sync_engine)
+
 Base = declarative_base()
 
 # Definición de las tablas de la base de datos
 
+# Las relaciones usan lazy="raise_on_sql": no se cargan solas al acceder a
+# ellas (lo que en los endpoints async fallaría y en los síncronos haría una
+# consulta por fila), sino que hay que pedirlas con selectinload/joinedload.
+# passive_deletes deja que la base de datos decida qué pasa con los hijos al
+# eliminar el padre, igual que antes de declarar las relaciones
+
 class Cube(Base):
     __tablename__ = 'cube'
     id_cube = Column(Integer, primary_key=True, index=True)
@@ -24,16 +56,43 @@ class Cube(Base):
     fk_cube_type = Column(Integer, ForeignKey('cube_type.id_cube_type'))
     magnetic = Column(Boolean)
 
+    cube_type = relationship("CubeType", lazy="raise_on_sql")
+
+# Penalización de un solve: ninguna, +2 segundos o DNF (no terminado)
+class Penalty(str, enum.Enum):
+    OK = "OK"
+    PLUS_TWO = "+2"
+    DNF = "DNF"
+
 class Solve(Base):
     __tablename__ = 'solve'
     id_solve = Column(Integer, primary_key=True, index=True)
     date = Column(DateTime)
-    time = Column(Time)
+    # Tiempo medido en milisegundos, sin la penalización (ver stats.solve_ms)
+    time_ms = Column(Integer, nullable=False)
+    penalty = Column(
+        Enum(Penalty, name="solve_penalty", values_callable=lambda penalties: [p.value for p in penalties]),
+        nullable=False, default=Penalty.OK, server_default=Penalty.OK.value,
+    )
     scramble = Column(String(100))
     fk_cube = Column(Integer, ForeignKey('cube.id_cube'))
     fk_solve_type = Column(Integer, ForeignKey('solve_type.id_solve_type'))
     fk_session = Column(Integer, ForeignKey('session.id_session'))
 
+    cube = relationship("Cube", lazy="raise_on_sql")
+    solve_type = relationship("SolveType", lazy="raise_on_sql")
+    session = relationship("Session", back_populates="solves", lazy="raise_on_sql")
+
+    # Índices para los listados por sesión y globales, ordenados por (date, id_solve)
+    __table_args__ = (
+        Index('ix_solve_session_date', 'fk_session', 'date', 'id_solve'),
+        Index('ix_solve_date', 'date', 'id_solve'),
+        # Índice para agregar los tiempos de una sesión (MIN, AVG) sin leer la tabla
+        Index('ix_solve_session_time', 'fk_session', 'penalty', 'time_ms'),
+        # En SQLite, que no reutilice los ids de los solves archivados (ver archive.py)
+        {"sqlite_autoincrement": True},
+    )
+
 class Session(Base):
     __tablename__ = 'session'
     id_session = Column(Integer, primary_key=True, index=True)
@@ -43,14 +102,35 @@ class Session(Base):
     ao12 = Column(Integer)
     qty = Column(Integer)
     fk_user = Column(Integer, ForeignKey('user.id_user'))
+    # Los solves de las sesiones archivadas están en los archivos de archive.py
+    archived = Column(Boolean, nullable=False, default=False, server_default="0")
+    # Se incrementa con cada escritura de sus solves (ver stats.py)
+    revision = Column(Integer, nullable=False, default=0, server_default="0")
+
+    user = relationship("User", back_populates="sessions", lazy="raise_on_sql")
+    solves = relationship(
+        "Solve", back_populates="session", order_by="(Solve.date, Solve.id_solve)",
+        lazy="raise_on_sql", passive_deletes=True,
+    )
+
+    # Índice para obtener las sesiones de un usuario
+    __table_args__ = (
+        Index('ix_session_user', 'fk_user', 'id_session'),
+    )
 
 class User(Base):
     __tablename__ = "user"
     id_user = Column(Integer, primary_key=True, index=True)
-    name = Column(String, nullable=False)
-    username = Column(String, unique=True, nullable=False)
-    password = Column(String, nullable=False)
-    email = Column(String, unique=True, nullable=False)
+    name = Column(String(100), nullable=False)
+    # La restricción unique crea el índice usado por get_current_user y login
+    username = Column(String(50), unique=True, nullable=False)
+    password = Column(String(100), nullable=False)
+    email = Column(String(100), unique=True, nullable=False)
+
+    sessions = relationship(
+        "Session", back_populates="user", order_by="Session.id_session",
+        lazy="raise_on_sql", passive_deletes=True,
+    )
 
 class CubeType(Base):
     __tablename__ = 'cube_type'
@@ -62,6 +142,68 @@ class SolveType(Base):
     id_solve_type = Column(Integer, primary_key=True, index=True)
     solve_type = Column(String(50))
 
+# Resumen de los solves de un usuario por tipo de cubo y tipo de solve (ver user_stats.py)
+class UserStats(Base):
+    __tablename__ = 'user_stats'
+    id_user_stats = Column(Integer, primary_key=True, index=True)
+    fk_user = Column(Integer, ForeignKey('user.id_user'), nullable=False)
+    fk_cube_type = Column(Integer, ForeignKey('cube_type.id_cube_type'))
+    fk_solve_type = Column(Integer, ForeignKey('solve_type.id_solve_type'))
+    # Contadores que se actualizan con cada solve (tiempos en milisegundos)
+    # (total_ms y best_ms no incluyen los DNF, que se cuentan en dnf)
+    qty = Column(Integer, nullable=False, default=0)
+    dnf = Column(Integer, nullable=False, default=0, server_default="0")
+    total_ms = Column(BigInteger, nullable=False, default=0)
+    best_ms = Column(Integer)
+    # Percentiles, histograma, medias móviles, etc. en JSON; stale indica que
+    # hay que recalcularlos (y los contadores) antes de devolverlos
+    data = Column(Text)
+    stale = Column(Boolean, nullable=False, default=True)
+    updated_at = Column(DateTime)
+    # Cambia con las ediciones y eliminaciones de sus solves, que invalidan las
+    # series que los workers tienen en memoria (ver user_stats.py)
+    revision = Column(BigInteger, nullable=False, default=0, server_default="0")
+
+    # Una fila por usuario, tipo de cubo y tipo de solve
+    __table_args__ = (
+        Index('ux_user_stats_key', 'fk_user', 'fk_cube_type', 'fk_solve_type', unique=True),
+    )
+
+
+# Registro de cambios de solves, sesiones y cubos para la sincronización
+# incremental de los clientes (ver changes.py). Los cambios de una misma
+# transacción comparten versión; fk_user es NULL en los cubos, que son comunes
+class Change(Base):
+    __tablename__ = 'change_log'
+    id_change = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False)
+    entity = Column(String(20), nullable=False)
+    entity_id = Column(Integer, nullable=False)
+    op = Column(String(10), nullable=False)
+    fk_user = Column(Integer)
+    created_at = Column(DateTime, nullable=False)
+
+    # Índices para leer los cambios de un usuario desde una versión y para purgarlos
+    __table_args__ = (
+        Index('ix_change_log_user_version', 'fk_user', 'version'),
+        Index('ix_change_log_version', 'version'),
+    )
+
+# Contador de versiones del registro de cambios (una sola fila). Cada
+# transacción lo incrementa, lo que ordena las versiones en el orden en que se
+# confirman; pruned es la última versión purgada
+class ChangeVersion(Base):
+    __tablename__ = 'change_version'
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    pruned = Column(Integer, nullable=False, default=0)
+
+# Versión de cada catálogo (cube_type, solve_type, cube), que sus escrituras
+# incrementan: las respuestas en caché de todos los workers se guardan por versión (ver cache.py)
+class CatalogVersion(Base):
+    __tablename__ = 'catalog_version'
+    name = Column(String(20), primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
 
 # Definimos una función para obtener la sesión de la base de datos
 def get_db():
@@ -69,4 +211,9 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+# Definimos una función para obtener la sesión asíncrona de la base de datos
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
\ No newline at end of file
@@ -0,0 +1,63 @@
+# Configuración de gunicorn para producción (la lee automáticamente al
+# ejecutarse desde este directorio; ver serve.py)
+
+# gunicorn importa la aplicación una sola vez en el proceso principal
+# (preload_app) y crea los workers con fork: los módulos, los modelos de
+# SQLAlchemy y las tablas del solver de scrambles quedan compartidos en
+# memoria (copy-on-write) y cada worker sólo ejecuta su lifespan al arrancar.
+# Cada worker es un proceso de uvicorn con su propio event loop.
+#
+# Variables de entorno:
+# - WEB_CONCURRENCY: cantidad de workers (por defecto, uno por CPU disponible).
+#   Cada worker abre su propio pool de conexiones (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+# - PORT: puerto en el que se escucha (8000)
+# - GRACEFUL_TIMEOUT: segundos que un worker tiene, al detenerse, para terminar
+#   las peticiones en curso antes de que se lo mate
+# - WORKER_TIMEOUT: segundos sin responder al proceso principal tras los que
+#   un worker se reinicia
+
+import os
+from time import perf_counter
+
+# Comienzo del arranque del proceso principal
+_started = perf_counter()
+
+
+# CPUs que puede usar el proceso (respeta los límites del contenedor por afinidad)
+def available_cpus() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "0")) or available_cpus()
+worker_class = "uvicorn_worker.UvicornWorker"
+preload_app = True
+# Al recibir SIGTERM, los workers dejan de aceptar conexiones, terminan las
+# peticiones en curso y ejecutan el cierre del lifespan
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+keepalive = 5
+accesslog = "-"
+
+
+# Con la aplicación ya importada, y antes de crear los workers, abrimos las
+# tablas del solver para que todos los workers las hereden
+def when_ready(server):
+    from scramble import get_tables
+
+    get_tables()
+    server.log.info("Application preloaded in %.2f s, starting %d workers", perf_counter() - _started, workers)
+
+
+# En cada worker nuevo: empezamos a medir su arranque y descartamos las
+# conexiones heredadas del proceso principal (sin cerrarlas, porque el socket
+# es compartido), para que cada worker abra las suyas
+def post_fork(server, worker):
+    import startup
+    from database import engine, async_engine
+
+    startup.forked()
+    engine.dispose(close=False)
+    async_engine.sync_engine.dispose(close=False)
@@ -0,0 +1,121 @@
+# Lectura de exportaciones de otros timers para la carga masiva de solves
+
+# Formatos soportados:
+# - Respaldo JSON de csTimer: {"session1": [[[penalización, ms], scramble, comentario, timestamp], ...], ...}
+# - CSV de una sesión de csTimer: "No.;Time;Comment;Scramble;Date;P.1" (separado por ";")
+# - CSV genérico con encabezados "date,time,scramble" (separado por ",")
+
+import csv
+import io
+import json
+from datetime import datetime
+
+from database import Penalty
+
+# Penalizaciones de csTimer
+CSTIMER_DNF = -1
+CSTIMER_PLUS_TWO = 2000
+
+
+# Error de formato al leer un archivo importado
+class ImportFormatError(ValueError):
+    pass
+
+
+# Función para leer un tiempo escrito como "12.34", "1:02.34", "12.34+" o
+# "DNF(12.34)". Devuelve (ms, penalty) con el tiempo medido sin la
+# penalización; un "DNF" sin tiempo da ms = None. csTimer escribe los +2 con
+# la penalización ya sumada ("14.34+" es un solve de 12.34 con +2)
+def parse_time_text(text: str):
+    text = text.strip()
+    penalty = Penalty.OK
+    if text.upper().startswith("DNF"):
+        penalty = Penalty.DNF
+        text = text[3:].strip("() ")
+        if not text:
+            return None, penalty
+    elif text.endswith("+"):
+        penalty = Penalty.PLUS_TWO
+        text = text.rstrip("+")
+    seconds = 0.0
+    for part in text.split(":"):
+        seconds = seconds * 60 + float(part)
+    ms = round(seconds * 1000)
+    if penalty == Penalty.PLUS_TWO:
+        ms -= CSTIMER_PLUS_TWO
+        if ms < 0:
+            raise ValueError("+2 time shorter than its penalty")
+    return ms, penalty
+
+
+# Lee el respaldo JSON de csTimer y devuelve (date, ms, penalty, scramble) por
+# solve, con el tiempo medido sin la penalización
+def parse_cstimer_json(data: bytes):
+    try:
+        backup = json.loads(data)
+    except ValueError:
+        raise ImportFormatError("Invalid JSON file")
+    if not isinstance(backup, dict):
+        raise ImportFormatError("Invalid csTimer backup")
+    for key, solves in backup.items():
+        if not key.startswith("session"):
+            continue
+        # Las versiones antiguas guardan cada sesión como texto JSON
+        if isinstance(solves, str):
+            try:
+                solves = json.loads(solves)
+            except ValueError:
+                raise ImportFormatError(f"Invalid csTimer session {key}")
+        if not isinstance(solves, list):
+            raise ImportFormatError(f"Invalid csTimer session {key}")
+        for solve in solves:
+            try:
+                (penalty, ms), scramble, _, timestamp = solve[:4]
+                if penalty == CSTIMER_DNF:
+                    penalty = Penalty.DNF
+                elif penalty == CSTIMER_PLUS_TWO:
+                    penalty = Penalty.PLUS_TWO
+                else:
+                    # Otras penalizaciones de csTimer (por ejemplo, +4) se suman al tiempo
+                    ms += penalty
+                    penalty = Penalty.OK
+                date = datetime.fromtimestamp(timestamp)
+                if "\0" in scramble:
+                    raise ValueError("NUL in scramble")
+            except (TypeError, ValueError, KeyError, OverflowError, OSError):
+                raise ImportFormatError(f"Invalid csTimer solve in {key}")
+            yield date, ms, penalty, scramble
+
+
+# Lee un CSV de csTimer o un CSV genérico y devuelve (date, ms, penalty, scramble) por solve
+def parse_csv(data: bytes):
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise ImportFormatError("CSV must be UTF-8 text")
+    delimiter = ";" if text.split("\n", 1)[0].count(";") > 0 else ","
+    reader = csv.DictReader(io.StringIO(text), delimiter=delimiter)
+    try:
+        fields = {name.lower(): name for name in reader.fieldnames or []}
+        if not {"date", "time", "scramble"} <= fields.keys():
+            raise ImportFormatError("CSV must have date, time and scramble columns")
+        for row in reader:
+            # A las filas cortas les faltan columnas (quedan en None)
+            date, time, scramble = row[fields["date"]], row[fields["time"]], row[fields["scramble"]]
+            if date is None or time is None or scramble is None or "\0" in scramble:
+                raise ImportFormatError(f"Invalid CSV row {reader.line_num}")
+            try:
+                date = datetime.fromisoformat(date.strip())
+                ms, penalty = parse_time_text(time)
+            except ValueError:
+                raise ImportFormatError(f"Invalid CSV row {reader.line_num}")
+            yield date, ms, penalty, scramble.strip()
+    except csv.Error:
+        raise ImportFormatError(f"Invalid CSV row {reader.line_num}")
+
+
+# Elige el lector según la extensión o el contenido del archivo
+def parse_import(filename: str, data: bytes):
+    if (filename or "").lower().endswith(".json") or data.lstrip()[:1] == b"{":
+        return parse_cstimer_json(data)
+    return parse_csv(data)
@@ -0,0 +1,564 @@
+# Rankings de mejores tiempos por tipo de cubo
+
+# Para cada tipo de cubo y métrica (mejor single, mejor ao5 y mejor ao12) se
+# mantiene en memoria una lista ordenada de (valor, id_user) con el mejor valor
+# de cada usuario. Así la posición de un usuario se obtiene con una búsqueda
+# binaria (O(log n)) y una página del ranking es un corte de la lista (O(k)),
+# sin ORDER BY sobre toda la tabla de solves.
+#
+# Para cada grupo (usuario, tipo de cubo) también se guarda qué solves forman
+# su mejor ventana en cada métrica. Un cambio en un solve sólo modifica las
+# ventanas que lo incluyen: si la mejor ventana no es una de ellas, el nuevo
+# mejor valor sale de comparar el anterior con las ventanas alrededor del
+# solve, para lo que basta con leer sus 11 vecinos de cada lado. Si lo es, o
+# si el grupo todavía no se conoce, se lee el grupo entero.
+#
+# Los cambios se calculan dentro de la transacción y se aplican a los
+# rankings al confirmarla (como las estadísticas de stats.py); si se deshace,
+# se descartan. Si otra transacción del worker cambió el mismo grupo mientras
+# tanto, el grupo se vuelve a leer entero en su próximo cambio.
+#
+# Los rankings se reconstruyen desde la base de datos una sola vez, en
+# segundo plano al iniciar la aplicación (sin demorar el arranque: mientras
+# tanto, los grupos se leen enteros la primera vez que cambian). La
+# reconstrucción se combina con los rankings actuales: los grupos que
+# cambiaron en el worker mientras se reconstruía conservan su valor, que es
+# más reciente. Los solves de las sesiones archivadas se leen de sus archivos
+# (ver archive.py).
+#
+# Las escrituras hechas en otros workers se leen del registro de cambios
+# (change_log, ver changes.py) cada LEADERBOARD_POLL_INTERVAL segundos, como
+# en relay.py, y sólo se recalculan los grupos afectados: un solve nuevo (de
+# id mayor que los ya vistos) como cualquier solve agregado en el worker,
+# leyendo sus vecinos; los usuarios con solves editados o eliminados, con
+# sesiones eliminadas o con muchos solves nuevos (una carga masiva), leyendo
+# enteros sus grupos. La edición de un cubo (que puede cambiar su tipo)
+# recalcula los grupos de los usuarios que lo usan, también en el worker que
+# la hizo. Si se acumulan más de LEADERBOARD_POLL_LIMIT cambios se reconstruye todo.
+
+import asyncio
+import os
+import traceback
+from threading import RLock
+
+import numpy as np
+from sqlalchemy import and_, event, func, or_, select, union_all
+from sqlalchemy.orm import Session
+
+from archive import NULL, archived_sessions, archived_solves, max_archived_id, merge_series, to_timestamps
+from changes import CUBE, DELETE, SOLVE, UPSERT, change_log, versions
+from database import SessionLocal, Change, Cube, Session as SessionModel, Solve
+from stats import SortedList, result_ms, solve_ms
+from user_stats import results_column, rolling_trimmed_means
+
+# Métricas de los rankings y cantidad de solves de cada una
+METRIC_SIZES = {"single": 1, "ao5": 5, "ao12": 12}
+METRICS = tuple(METRIC_SIZES)
+# Vecinos de cada lado que se leen al cambiar un solve: los que pueden
+# compartir una ventana con él
+NEIGHBORS = max(METRIC_SIZES.values()) - 1
+# Segundos entre lecturas del registro de cambios
+LEADERBOARD_POLL_INTERVAL = float(os.getenv("LEADERBOARD_POLL_INTERVAL", "2"))
+# Cambios que se leen como mucho en cada lectura (si hay más, se reconstruye todo)
+LEADERBOARD_POLL_LIMIT = 5000
+# Solves nuevos de un usuario a partir de los cuales se leen enteros sus grupos
+LEADERBOARD_RELOAD_AFTER = 20
+# Filas leídas por bloque al reconstruir
+REBUILD_BATCH_SIZE = 5000
+# Clave de db.info con los grupos recalculados en la transacción en curso
+PENDING_GROUPS = "leaderboard_pending_groups"
+
+
+# Ranking de una métrica en un tipo de cubo
+class Ranking:
+    def __init__(self):
+        self.entries = SortedList()
+        self.values = {}
+
+    # Guardamos el valor de un usuario (None lo quita del ranking)
+    def set(self, id_user, value):
+        old = self.values.pop(id_user, None)
+        if old is not None:
+            self.entries.remove((old, id_user))
+        if value is not None:
+            self.values[id_user] = value
+            self.entries.add((value, id_user))
+
+    # Posición de un usuario (los empates comparten posición)
+    def rank(self, id_user):
+        value = self.values.get(id_user)
+        if value is None:
+            return None
+        return self.entries.bisect_left((value,)) + 1
+
+    # Página del ranking: lista de (posición, id_user, valor)
+    def page(self, offset, limit):
+        page = []
+        for value, id_user in self.entries[offset:offset + limit]:
+            # Con empates, la posición es la del primero con el mismo valor
+            if page and page[-1][2] == value:
+                position = page[-1][0]
+            else:
+                position = self.entries.bisect_left((value,)) + 1
+            page.append((position, id_user, value))
+        return page
+
+    def __len__(self):
+        return len(self.entries)
+
+
+# Mejores valores (single, ao5, ao12) de una serie cronológica de solves (ids,
+# fechas en milisegundos y tiempos) y, para cada métrica, la clave (fecha, id)
+# del primer y del último solve de su mejor ventana. Los DNF (y las medias que
+# valen DNF) no se clasifican: su valor y su ventana son None
+def best_values(ids: np.ndarray, timestamps: np.ndarray, ms: np.ndarray):
+    values, windows = {}, {}
+    for metric, size in METRIC_SIZES.items():
+        means = ms if size == 1 else rolling_trimmed_means(ms, size)
+        if not len(means) or not np.isfinite(means.min()):
+            values[metric] = windows[metric] = None
+            continue
+        first = int(np.argmin(means))
+        last = first + size - 1
+        values[metric] = int(means[first])
+        windows[metric] = ((int(timestamps[first]), int(ids[first])), (int(timestamps[last]), int(ids[last])))
+    return values, windows
+
+
+# Columnas (ids, fechas en milisegundos y tiempos) de filas de group_solves_query
+def solve_columns(rows):
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    _, _, ids, dates, results = zip(*rows)
+    return np.array(ids, dtype=np.int64), to_timestamps(dates), results_column(results)
+
+
+# Consulta de los solves de usuarios y tipos de cubo: (fk_user, fk_cube_type,
+# id_solve, date, tiempo con la penalización o NULL si es DNF)
+def group_solves_query():
+    return (
+        select(SessionModel.fk_user, Cube.fk_cube_type, Solve.id_solve, Solve.date, result_ms)
+        .select_from(Solve)
+        .join(SessionModel, Solve.fk_session == SessionModel.id_session)
+        .join(Cube, Solve.fk_cube == Cube.id_cube)
+        .where(SessionModel.fk_user.is_not(None), Cube.fk_cube_type.is_not(None))
+    )
+
+
+# Series archivadas (ids, timestamps, tiempos) por (id_user, fk_cube_type)
+# de los usuarios indicados, o de todos
+def archived_groups(db: Session, user_ids=None) -> dict:
+    groups = {}
+    for fk_user, columns in archived_solves(db, user_ids).items():
+        cube_types = columns["fk_cube_type"]
+        for fk_cube_type in np.unique(cube_types[cube_types != NULL]).tolist():
+            mask = cube_types == fk_cube_type
+            groups[(fk_user, fk_cube_type)] = (columns["id_solve"][mask], columns["date"][mask], columns["result"][mask])
+    return groups
+
+
+# Mejores valores de un grupo a partir de sus solves de la tabla (ids, fechas
+# y tiempos, en orden cronológico) y, si tiene, de su serie archivada
+def group_values(ids, timestamps, ms, archived=None):
+    if archived is not None:
+        ids, timestamps, ms = merge_series((ids, timestamps, ms), archived)
+    return best_values(ids, timestamps, ms)
+
+
+# Registro de los rankings, compartido por todos los routers
+class Leaderboards:
+    def __init__(self):
+        self._rankings = {}
+        # Valores y mejores ventanas de los grupos conocidos, y cuántas veces
+        # cambió cada grupo (para detectar transacciones que se cruzan)
+        self._groups = {}
+        self._versions = {}
+        # Grupos que cambiaron durante la reconstrucción en curso
+        self._touched = None
+        # Última versión leída del registro de cambios, versiones confirmadas
+        # por este proceso aún no leídas y mayor id de solve visto
+        self.version = None
+        self._local = set()
+        self._last_solve = 0
+        self._lock = RLock()
+        self.task = None
+        change_log.listeners.append(self.committed)
+
+    def ranking(self, fk_cube_type: int, metric: str) -> Ranking:
+        return self._rankings.get((fk_cube_type, metric)) or Ranking()
+
+    def cube_types(self):
+        return sorted({fk_cube_type for fk_cube_type, _ in self._rankings})
+
+    # Guardamos el estado (valores y ventanas) de un grupo; None lo quita
+    def _store(self, group, state):
+        fk_user, fk_cube_type = group
+        values = state[0] if state is not None else {}
+        for metric in METRICS:
+            ranking = self._rankings.get((fk_cube_type, metric))
+            if ranking is None:
+                if values.get(metric) is None:
+                    continue
+                ranking = self._rankings[(fk_cube_type, metric)] = Ranking()
+            ranking.set(fk_user, values.get(metric))
+        if state is None or all(value is None for value in values.values()):
+            self._groups.pop(group, None)
+        else:
+            self._groups[group] = state
+        self._versions[group] = self._versions.get(group, 0) + 1
+
+    # Leemos enteros unos grupos (id_user, fk_cube_type) y devolvemos su
+    # estado. `archived` son las series archivadas de sus usuarios, si ya se leyeron
+    def _load_groups(self, db: Session, groups, archived=None) -> dict:
+        if archived is None:
+            archived = archived_groups(db, {fk_user for fk_user, _ in groups})
+        rows = db.execute(
+            group_solves_query()
+            .where(or_(*[
+                and_(SessionModel.fk_user == fk_user, Cube.fk_cube_type == fk_cube_type)
+                for fk_user, fk_cube_type in groups
+            ]))
+            .order_by(Solve.date, Solve.id_solve)
+        ).all()
+        ids, timestamps, ms = solve_columns(rows)
+        users, cube_types = (np.array(column, dtype=np.int64) for column in (list(zip(*rows))[:2] or ([], [])))
+        states = {}
+        for fk_user, fk_cube_type in groups:
+            mask = (users == fk_user) & (cube_types == fk_cube_type)
+            states[(fk_user, fk_cube_type)] = group_values(
+                ids[mask], timestamps[mask], ms[mask], archived.get((fk_user, fk_cube_type)))
+        return states
+
+    # Estado de un grupo para la transacción en curso (el que ya calculó, si
+    # lo cambió antes) y la versión del grupo sobre la que se calcula
+    def _state(self, db: Session, group):
+        pending = db.info.get(PENDING_GROUPS, {})
+        if group in pending:
+            return pending[group]
+        with self._lock:
+            return self._versions.get(group, 0), self._groups.get(group)
+
+    # Dejamos el nuevo estado de un grupo pendiente de la confirmación
+    def _pend(self, db: Session, group, version, state):
+        db.info.setdefault(PENDING_GROUPS, {})[group] = (version, state)
+
+    # Recalculamos enteros los grupos indicados
+    def _reload(self, db: Session, groups, archived=None):
+        groups = {group for group in groups if group[0] is not None and group[1] is not None}
+        if not groups:
+            return
+        db.flush()
+        for group, state in self._load_groups(db, groups, archived).items():
+            self._pend(db, group, self._state(db, group)[0], state)
+
+    # Vecinos de un solve en su grupo: hasta NEIGHBORS solves de cada lado,
+    # de la tabla y, si el usuario tiene sesiones archivadas, de sus archivos
+    def _neighbors(self, db: Session, group, date, id_solve):
+        fk_user, fk_cube_type = group
+        query = group_solves_query().where(
+            SessionModel.fk_user == fk_user, Cube.fk_cube_type == fk_cube_type, Solve.id_solve != id_solve)
+        before = (
+            query.where(or_(Solve.date < date, and_(Solve.date == date, Solve.id_solve < id_solve)))
+            .order_by(Solve.date.desc(), Solve.id_solve.desc())
+            .limit(NEIGHBORS)
+            .subquery()
+        )
+        after = (
+            query.where(or_(Solve.date > date, and_(Solve.date == date, Solve.id_solve > id_solve)))
+            .order_by(Solve.date, Solve.id_solve)
+            .limit(NEIGHBORS)
+            .subquery()
+        )
+        rows = db.execute(union_all(select(before), select(after))).all()
+        split = sum(1 for row in rows if (row[3], row[2]) < (date, id_solve))
+        rows.sort(key=lambda row: (row[3], row[2]))
+        before, after = solve_columns(rows[:split]), solve_columns(rows[split:])
+        if archived_sessions(db, [fk_user]):
+            archived = archived_groups(db, [fk_user]).get(group)
+            if archived is not None:
+                ids, timestamps, ms = merge_series(archived)
+                timestamp = int(to_timestamps([date])[0])
+                left = (timestamps < timestamp) | ((timestamps == timestamp) & (ids < id_solve))
+                right = (timestamps > timestamp) | ((timestamps == timestamp) & (ids > id_solve))
+                before = tuple(c[-NEIGHBORS:] for c in merge_series(before, tuple(c[left] for c in (ids, timestamps, ms))))
+                after = tuple(c[:NEIGHBORS] for c in merge_series(after, tuple(c[right] for c in (ids, timestamps, ms))))
+        return before, after
+
+    # Registramos el cambio de un solve (el agregado, eliminado o editado en
+    # la fecha `date` con id `id_solve`) en un grupo. `db_solve` es el solve
+    # tal como queda, o None si ya no está en el grupo
+    def _change(self, db: Session, group, date, id_solve, db_solve):
+        if group[0] is None or group[1] is None:
+            return
+        db.flush()
+        version, state = self._state(db, group)
+        key = (int(to_timestamps([date])[0]), id_solve)
+        if state is None or any(window is not None and window[0] <= key <= window[1] for window in state[1].values()):
+            # El grupo no se conoce o el solve está en una de sus mejores ventanas
+            self._reload(db, [group])
+            return
+        before, after = self._neighbors(db, group, date, id_solve)
+        series = [before, after]
+        if db_solve is not None:
+            series.append((
+                np.array([id_solve], dtype=np.int64), np.array([key[0]], dtype=np.int64),
+                np.array([solve_ms(db_solve.time_ms, db_solve.penalty)], dtype=np.float64),
+            ))
+        # Las ventanas alrededor del solve, comparadas con las mejores anteriores
+        local_values, local_windows = best_values(*merge_series(*series))
+        values, windows = dict(state[0]), dict(state[1])
+        for metric in METRICS:
+            if local_values[metric] is not None and (values[metric] is None or local_values[metric] < values[metric]):
+                values[metric] = local_values[metric]
+                windows[metric] = local_windows[metric]
+        self._pend(db, group, version, (values, windows))
+
+    # Reconstruimos todos los rankings desde la base de datos. Los grupos se
+    # leen seguidos (ordenados por usuario y tipo de cubo) y cada uno se
+    # resume con NumPy en cuanto termina. El resultado se combina con los
+    # rankings actuales (ver merge)
+    def rebuild(self):
+        with self._lock:
+            self._touched = set()
+        states = {}
+        db = SessionLocal()
+        try:
+            # Los cambios posteriores a esta versión se leerán del registro
+            # (los que la reconstrucción ya incluye se vuelven a aplicar sin efecto)
+            version = versions(db)[0]
+            last_solve = max(db.scalar(select(func.max(Solve.id_solve))) or 0, max_archived_id())
+            archived = archived_groups(db)
+            rows = db.execute(
+                group_solves_query()
+                .order_by(SessionModel.fk_user, Cube.fk_cube_type, Solve.date, Solve.id_solve)
+                .execution_options(stream_results=True, yield_per=REBUILD_BATCH_SIZE)
+            )
+            group, solves = None, []
+            for row in rows:
+                if (row[0], row[1]) != group:
+                    if solves:
+                        states[group] = group_values(*solve_columns(solves), archived.pop(group, None))
+                    group, solves = (row[0], row[1]), []
+                solves.append(row)
+            if solves:
+                states[group] = group_values(*solve_columns(solves), archived.pop(group, None))
+            # Grupos que sólo tienen solves archivados
+            for group, series in archived.items():
+                states[group] = best_values(*merge_series(series))
+        except Exception:
+            with self._lock:
+                self._touched = None
+            raise
+        finally:
+            db.close()
+        self.merge(states)
+        with self._lock:
+            self._advance(version)
+            self._last_solve = max(self._last_solve, last_solve)
+
+    # Combinamos el resultado de una reconstrucción con los rankings: los
+    # grupos que cambiaron en el worker mientras tanto conservan su estado
+    # (salvo los que quedaron sin conocer), y el resto toma el reconstruido
+    def merge(self, states: dict):
+        with self._lock:
+            touched, self._touched = self._touched or set(), None
+            groups = set(self._groups) | set(states) | {
+                (id_user, fk_cube_type)
+                for (fk_cube_type, _), ranking in self._rankings.items()
+                for id_user in ranking.values
+            }
+            for group in groups:
+                if group in touched and group in self._groups:
+                    continue
+                state = states.get(group)
+                if group not in self._groups or state != self._groups[group]:
+                    self._store(group, state)
+
+    # Aplicamos a los rankings los grupos recalculados en una transacción
+    # confirmada. Si otra transacción cambió un grupo después de que esta lo
+    # leyera, el estado calculado puede no incluir ese cambio: el grupo queda
+    # sin conocer y se vuelve a leer entero en su próximo cambio
+    def commit(self, pending: dict):
+        with self._lock:
+            for group, (version, state) in pending.items():
+                if self._touched is not None:
+                    self._touched.add(group)
+                if self._versions.get(group, 0) == version:
+                    self._store(group, state)
+                else:
+                    self._groups.pop(group, None)
+                    self._versions[group] = self._versions.get(group, 0) + 1
+
+    # Registramos un solve nuevo a partir de su clave de user_stats
+    # (id_user, fk_cube_type, fk_solve_type)
+    def solve_added(self, db: Session, db_solve: Solve, key):
+        if key is not None:
+            self._change(db, (key[0], key[1]), db_solve.date, db_solve.id_solve, db_solve)
+
+    # Registramos la eliminación de un solve, a partir de su clave de user_stats
+    def solve_removed(self, db: Session, db_solve: Solve, key):
+        if key is not None:
+            self._change(db, (key[0], key[1]), db_solve.date, db_solve.id_solve, None)
+
+    # Registramos la edición de un solve, con su clave de user_stats y su
+    # fecha anteriores. Si cambió de fecha dentro del mismo grupo, el grupo se
+    # lee entero; si cambió de grupo, sale de uno y entra en el otro
+    def solve_updated(self, db: Session, db_solve: Solve, old_key, old_date, key):
+        old_group = (old_key[0], old_key[1]) if old_key is not None else None
+        group = (key[0], key[1]) if key is not None else None
+        if old_group == group:
+            if group is None:
+                return
+            if old_date == db_solve.date:
+                self._change(db, group, db_solve.date, db_solve.id_solve, db_solve)
+            else:
+                self._reload(db, [group])
+            return
+        if old_group is not None:
+            self._change(db, old_group, old_date, db_solve.id_solve, None)
+        if group is not None:
+            self._change(db, group, db_solve.date, db_solve.id_solve, db_solve)
+
+    # Recalculamos todos los tipos de cubo de unos usuarios (por ejemplo, tras
+    # una carga masiva o al eliminar una sesión)
+    def users_changed(self, db: Session, user_ids):
+        user_ids = set(user_ids) - {None}
+        if not user_ids:
+            return
+        with self._lock:
+            groups = {
+                (id_user, fk_cube_type)
+                for (fk_cube_type, metric), ranking in self._rankings.items()
+                for id_user in user_ids if id_user in ranking.values
+            }
+        db.flush()
+        groups |= set(db.execute(
+            select(SessionModel.fk_user, Cube.fk_cube_type)
+            .select_from(Solve)
+            .join(SessionModel, Solve.fk_session == SessionModel.id_session)
+            .join(Cube, Solve.fk_cube == Cube.id_cube)
+            .where(SessionModel.fk_user.in_(list(user_ids)))
+            .distinct()
+        ).all())
+        archived = archived_groups(db, user_ids)
+        self._reload(db, [tuple(group) for group in groups | set(archived)], archived)
+
+    # Versiones confirmadas por este proceso (desde el evento after_commit)
+    def committed(self, recorded):
+        with self._lock:
+            if self.version is not None:
+                self._local.update(version for version in recorded if version > self.version)
+
+    # Avanzamos hasta `version`, olvidando las versiones propias ya leídas
+    def _advance(self, version):
+        with self._lock:
+            self.version = version
+            self._local = {local for local in self._local if local > version}
+
+    # Usuarios con solves en unos cubos
+    def _cube_users(self, db: Session, id_cubes) -> set:
+        return set(db.scalars(
+            select(SessionModel.fk_user)
+            .select_from(Solve)
+            .join(SessionModel, Solve.fk_session == SessionModel.id_session)
+            .where(Solve.fk_cube.in_(list(id_cubes)))
+            .distinct()
+        )) - {None}
+
+    # Aplicamos los cambios confirmados desde la última lectura del registro
+    # (en un hilo, con su propia conexión). Los cambios de solves y sesiones
+    # que confirmó este proceso ya se aplicaron al escribirlos
+    def poll(self):
+        db = SessionLocal()
+        try:
+            rows = db.execute(
+                select(Change.version, Change.entity, Change.entity_id, Change.op, Change.fk_user)
+                .where(Change.version > self.version)
+                .order_by(Change.version, Change.id_change)
+                .limit(LEADERBOARD_POLL_LIMIT + 1)
+            ).all()
+            if not rows:
+                return
+            if len(rows) > LEADERBOARD_POLL_LIMIT:
+                db.close()
+                self.rebuild()
+                return
+            with self._lock:
+                local, last_solve = set(self._local), self._last_solve
+            added, users, cubes = {}, set(), set()
+            for row in rows:
+                if row.entity == CUBE:
+                    cubes.add(row.entity_id)
+                    continue
+                if row.version in local or row.fk_user is None:
+                    continue
+                if row.entity == SOLVE and row.op == UPSERT and row.entity_id > last_solve:
+                    added.setdefault(row.fk_user, set()).add(row.entity_id)
+                elif row.entity == SOLVE or row.op == DELETE:
+                    users.add(row.fk_user)
+            users |= {id_user for id_user, ids in added.items() if len(ids) > LEADERBOARD_RELOAD_AFTER}
+            ids = [id_solve for id_user, solves in added.items() if id_user not in users for id_solve in solves]
+            if ids:
+                solves = db.execute(
+                    select(SessionModel.fk_user, Cube.fk_cube_type, Solve.id_solve, Solve.date,
+                           Solve.time_ms, Solve.penalty)
+                    .select_from(Solve)
+                    .join(SessionModel, Solve.fk_session == SessionModel.id_session)
+                    .join(Cube, Solve.fk_cube == Cube.id_cube)
+                    .where(Solve.id_solve.in_(ids))
+                    .order_by(Solve.date, Solve.id_solve)
+                ).all()
+                for solve in solves:
+                    if solve.fk_user not in users:
+                        self._change(db, (solve.fk_user, solve.fk_cube_type), solve.date, solve.id_solve, solve)
+            if cubes:
+                users |= self._cube_users(db, cubes)
+            self.users_changed(db, users)
+            db.commit()
+            with self._lock:
+                self._advance(rows[-1].version)
+                self._last_solve = max([self._last_solve] + [
+                    row.entity_id for row in rows if row.entity == SOLVE and row.op == UPSERT])
+        finally:
+            db.close()
+
+    # Reconstrucción inicial en segundo plano y, después, lectura periódica
+    # del registro de cambios, en un hilo para no bloquear el arranque ni el event loop
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        step = self.rebuild
+        while True:
+            try:
+                await loop.run_in_executor(None, step)
+                step = self.poll
+            except Exception:
+                # Conservamos los rankings actuales y lo intentamos en la próxima vuelta
+                traceback.print_exc()
+            await asyncio.sleep(LEADERBOARD_POLL_INTERVAL)
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+
+# Instancia global de los rankings
+leaderboards = Leaderboards()
+
+
+# Al confirmar una transacción aplicamos sus grupos recalculados
+@event.listens_for(Session, "after_commit")
+def apply_groups(db: Session):
+    pending = db.info.pop(PENDING_GROUPS, None)
+    if pending:
+        leaderboards.commit(pending)
+
+
+# Si se deshace, los descartamos
+@event.listens_for(Session, "after_rollback")
+def discard_groups(db: Session):
+    db.info.pop(PENDING_GROUPS, None)
@@ -0,0 +1,208 @@
+# Métricas de las peticiones y de las consultas SQL
+
+# MetricsMiddleware mide cada petición HTTP y la agrupa por método y plantilla
+# de ruta ("/session/{id}/solve/", no "/session/7/solve/"): histograma de
+# latencias, cantidad de peticiones por código de estado, y cantidad de
+# consultas SQL y tiempo dentro de ellas. Las consultas se cuentan con los
+# eventos de los engines de SQLAlchemy (ver watch_queries en database.py) y se
+# asignan a la petición en curso mediante una variable de contexto, que
+# también llega a los hilos del threadpool y al código async de SQLAlchemy.
+#
+# Las peticiones que superan QUERY_BUDGET consultas se cuentan aparte y se
+# avisan por la salida de errores. Todas las respuestas llevan la cabecera
+# X-Query-Count. Todo se expone en formato de texto de Prometheus en /metrics.
+
+import os
+import sys
+from contextvars import ContextVar
+from threading import Lock
+from time import perf_counter
+
+from sqlalchemy import event
+from starlette.routing import Match
+
+# Cantidad de consultas SQL a partir de la cual una petición se considera excesiva
+QUERY_BUDGET = int(os.getenv("QUERY_BUDGET", "20"))
+
+# Límites (en segundos) de los intervalos de los histogramas de latencia
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Límites de los intervalos del histograma de consultas por petición
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+# Consultas de la petición en curso
+class RequestQueries:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+current_queries = ContextVar("current_queries", default=None)
+
+
+# Histograma acumulativo al estilo de Prometheus
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        index = 0
+        while index < len(self.buckets) and value > self.buckets[index]:
+            index += 1
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+# Registro de métricas del proceso
+class Metrics:
+    def __init__(self):
+        self._lock = Lock()
+        self.latency = {}
+        self.queries = {}
+        self.requests = {}
+        self.background_queries = 0
+        self.background_seconds = 0.0
+        self.request_sql_seconds = {}
+        self.over_budget = {}
+
+    # Registramos una petición terminada
+    def observe_request(self, method, route, status, seconds, queries: RequestQueries):
+        key = (method, route)
+        with self._lock:
+            self.latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(seconds)
+            self.queries.setdefault(key, Histogram(QUERY_BUCKETS)).observe(queries.count)
+            status_key = (method, route, str(status))
+            self.requests[status_key] = self.requests.get(status_key, 0) + 1
+            self.request_sql_seconds[key] = self.request_sql_seconds.get(key, 0.0) + queries.seconds
+            if queries.count > QUERY_BUDGET:
+                self.over_budget[key] = self.over_budget.get(key, 0) + 1
+
+    # Registramos una consulta SQL en la petición en curso (o, si no la hay,
+    # en las consultas de tareas de fondo)
+    def observe_query(self, seconds):
+        queries = current_queries.get()
+        if queries is not None:
+            queries.count += 1
+            queries.seconds += seconds
+            return
+        with self._lock:
+            self.background_queries += 1
+            self.background_seconds += seconds
+
+    # Texto en formato de Prometheus. `extra` son líneas adicionales (por ejemplo, del pool)
+    def render(self, extra=()) -> str:
+        lines = []
+        with self._lock:
+            lines += histogram_lines(
+                "http_request_duration_seconds", "Latencia de las peticiones HTTP por ruta", self.latency)
+            lines += histogram_lines(
+                "http_request_sql_queries", "Consultas SQL por petición HTTP", self.queries)
+            lines += ["# HELP http_requests_total Peticiones HTTP por ruta y código de estado",
+                      "# TYPE http_requests_total counter"]
+            lines += [
+                f'http_requests_total{{method="{method}",route="{route}",status="{status}"}} {value}'
+                for (method, route, status), value in sorted(self.requests.items())
+            ]
+            lines += ["# HELP http_request_sql_seconds_total Tiempo en consultas SQL de las peticiones HTTP por ruta",
+                      "# TYPE http_request_sql_seconds_total counter"]
+            lines += [
+                f'http_request_sql_seconds_total{{method="{method}",route="{route}"}} {value:.6f}'
+                for (method, route), value in sorted(self.request_sql_seconds.items())
+            ]
+            lines += ["# HELP http_requests_over_query_budget_total Peticiones con más consultas SQL que QUERY_BUDGET",
+                      "# TYPE http_requests_over_query_budget_total counter"]
+            lines += [
+                f'http_requests_over_query_budget_total{{method="{method}",route="{route}"}} {value}'
+                for (method, route), value in sorted(self.over_budget.items())
+            ]
+            lines += ["# HELP sql_background_queries_total Consultas SQL fuera de las peticiones HTTP",
+                      "# TYPE sql_background_queries_total counter"]
+            lines += [f"sql_background_queries_total {self.background_queries}"]
+            lines += ["# HELP sql_background_seconds_total Tiempo en consultas SQL fuera de las peticiones HTTP",
+                      "# TYPE sql_background_seconds_total counter"]
+            lines += [f"sql_background_seconds_total {self.background_seconds:.6f}"]
+        lines += list(extra)
+        return "\n".join(lines) + "\n"
+
+
+# Líneas de Prometheus de un grupo de histogramas por (método, ruta)
+def histogram_lines(name, description, histograms) -> list:
+    lines = [f"# HELP {name} {description}", f"# TYPE {name} histogram"]
+    for (method, route), histogram in sorted(histograms.items()):
+        labels = f'method="{method}",route="{route}"'
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+        lines.append(f"{name}_sum{{{labels}}} {histogram.sum:.6f}")
+        lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+    return lines
+
+
+# Instancia global de las métricas
+metrics = Metrics()
+
+
+# Función para contar las consultas SQL de un engine
+def watch_queries(engine):
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        metrics.observe_query(perf_counter() - conn.info["query_start"].pop())
+
+
+# Plantilla de la ruta de una petición ("/session/{id}"). Las versiones
+# recientes de Starlette la dejan en scope["route"]; si no, se busca
+def route_template(scope) -> str:
+    route = scope.get("route")
+    if route is None:
+        for candidate in getattr(scope.get("app"), "routes", ()):
+            if candidate.matches(scope)[0] == Match.FULL:
+                route = candidate
+                break
+    return getattr(route, "path", None) or "unmatched"
+
+
+# Middleware ASGI que mide cada petición HTTP
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        queries = RequestQueries()
+        token = current_queries.set(queries)
+        status = 500
+        began = perf_counter()
+
+        async def send_with_headers(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"x-query-count", str(queries.count).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            current_queries.reset(token)
+            route = route_template(scope)
+            metrics.observe_request(scope["method"], route, status, perf_counter() - began, queries)
+            if queries.count > QUERY_BUDGET:
+                print(
+                    f"Query budget exceeded: {scope['method']} {route} ran {queries.count} queries "
+                    f"({queries.seconds * 1000:.1f} ms in SQL, budget {QUERY_BUDGET})",
+                    file=sys.stderr,
+                )
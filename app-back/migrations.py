@@ -0,0 +1,184 @@
+# Migraciones del esquema de la base de datos
+
+# Cada migración tiene un número de versión y se aplica una sola vez; las
+# versiones aplicadas quedan registradas en la tabla "schema_migrations".
+# Las migraciones son idempotentes (comprueban si el índice, la columna o la
+# tabla ya existen), porque la migración inicial crea el esquema completo de
+# los modelos actuales en las instalaciones nuevas.
+#
+# Uso: python migrations.py
+
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, Time, bindparam, column, inspect, select, table, text, update
+
+from database import Base, engine, CatalogVersion, Change, ChangeVersion, Penalty, Session as SessionModel, Solve, UserStats
+from archive import reserve_ids
+from user_stats import mark_users_stale
+
+# Lista ordenada de migraciones: (versión, descripción, función)
+MIGRATIONS = []
+
+# Tabla donde se registran las migraciones aplicadas
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("description", String(200)),
+    Column("applied_at", DateTime),
+)
+
+
+# Decorador para registrar una migración
+def migration(version: int, description: str):
+    def register(function):
+        MIGRATIONS.append((version, description, function))
+        return function
+    return register
+
+
+# Función auxiliar para crear un índice si todavía no existe
+def create_index(connection, index):
+    names = {existing["name"] for existing in inspect(connection).get_indexes(index.table.name)}
+    if index.name not in names:
+        index.create(connection)
+
+
+# Función auxiliar para obtener un índice declarado en los modelos
+def model_index(model, name):
+    return next(index for index in model.__table__.indexes if index.name == name)
+
+
+# Función auxiliar para obtener los nombres de las columnas de una tabla
+def column_names(connection, table_name):
+    return {existing["name"] for existing in inspect(connection).get_columns(table_name)}
+
+
+# Función auxiliar para añadir una columna de un modelo si todavía no existe.
+# `definition` completa la definición (por ejemplo, "NOT NULL DEFAULT 0")
+def add_column(connection, model_column, definition=""):
+    if model_column.name in column_names(connection, model_column.table.name):
+        return
+    quote = connection.dialect.identifier_preparer.quote
+    column_type = model_column.type.compile(dialect=connection.dialect)
+    connection.execute(text(
+        f"ALTER TABLE {quote(model_column.table.name)} ADD COLUMN {quote(model_column.name)} {column_type} {definition}"
+    ))
+
+
+@migration(1, "Esquema inicial")
+def initial_schema(connection):
+    Base.metadata.create_all(connection)
+
+
+@migration(2, "Índices para las consultas de solves y sesiones")
+def solve_session_indexes(connection):
+    create_index(connection, model_index(Solve, "ix_solve_session_date"))
+    create_index(connection, model_index(Solve, "ix_solve_date"))
+    create_index(connection, model_index(SessionModel, "ix_session_user"))
+
+
+@migration(3, "Tabla de estadísticas por usuario")
+def user_stats_table(connection):
+    UserStats.__table__.create(connection, checkfirst=True)
+    # Las filas de los solves existentes se crean en la migración 4, que
+    # también las recalcula con las penalizaciones
+
+
+# Columna "time" (TIME) de los solves, reemplazada en la migración 4
+legacy_solve = table("solve", column("id_solve", Integer), column("time", Time), column("time_ms", Integer))
+# Filas que se convierten por bloque al migrar fuera de MySQL
+BACKFILL_BATCH_SIZE = 5000
+
+
+@migration(4, "Tiempos de los solves en milisegundos con penalización")
+def solve_time_ms(connection):
+    quote = connection.dialect.identifier_preparer.quote
+    add_column(connection, Solve.__table__.c.time_ms)
+    add_column(connection, Solve.__table__.c.penalty, f"NOT NULL DEFAULT '{Penalty.OK.value}'")
+    add_column(connection, UserStats.__table__.c.dnf, "NOT NULL DEFAULT 0")
+    # mark_users_stale también escribe la revisión (ver la migración 8)
+    add_column(connection, UserStats.__table__.c.revision, "NOT NULL DEFAULT 0")
+    if "time" in column_names(connection, "solve"):
+        # Copiamos los tiempos existentes (que no tienen penalización) a time_ms
+        if connection.dialect.name == "mysql":
+            connection.execute(text(
+                "UPDATE solve SET time_ms = TIME_TO_SEC(`time`) * 1000 + MICROSECOND(`time`) DIV 1000 "
+                "WHERE `time` IS NOT NULL"
+            ))
+        else:
+            rows = connection.execute(
+                select(legacy_solve.c.id_solve, legacy_solve.c.time).where(legacy_solve.c.time.is_not(None))
+            ).all()
+            for start in range(0, len(rows), BACKFILL_BATCH_SIZE):
+                connection.execute(
+                    update(legacy_solve).where(legacy_solve.c.id_solve == bindparam("id")).values(time_ms=bindparam("ms")),
+                    [{"id": id_solve, "ms": time_to_ms(value)} for id_solve, value in rows[start:start + BACKFILL_BATCH_SIZE]],
+                )
+        connection.execute(update(legacy_solve).where(legacy_solve.c.time_ms.is_(None)).values(time_ms=0))
+        connection.execute(text(f"ALTER TABLE solve DROP COLUMN {quote('time')}"))
+        # SQLite no permite cambiar la nulabilidad de una columna existente
+        if connection.dialect.name == "mysql":
+            connection.execute(text("ALTER TABLE solve MODIFY time_ms INTEGER NOT NULL"))
+    create_index(connection, model_index(Solve, "ix_solve_session_time"))
+    # Recalculamos los contadores (ahora con los DNF) y los resúmenes de todos los usuarios
+    mark_users_stale(connection, archived=False)
+
+
+# Función para convertir un datetime.time a milisegundos
+def time_to_ms(value):
+    return (value.hour * 3600 + value.minute * 60 + value.second) * 1000 + value.microsecond // 1000
+
+
+@migration(5, "Marca de sesiones archivadas (ver archive.py)")
+def session_archived(connection):
+    add_column(connection, SessionModel.__table__.c.archived, "NOT NULL DEFAULT 0")
+
+
+@migration(6, "Registro de cambios para la sincronización (ver changes.py)")
+def change_log_tables(connection):
+    Change.__table__.create(connection, checkfirst=True)
+    ChangeVersion.__table__.create(connection, checkfirst=True)
+    if connection.scalar(select(ChangeVersion.id).where(ChangeVersion.id == 1)) is None:
+        connection.execute(ChangeVersion.__table__.insert().values(id=1, version=0, pruned=0))
+
+
+@migration(7, "Revisión de las sesiones (ver stats.py)")
+def session_revision(connection):
+    add_column(connection, SessionModel.__table__.c.revision, "NOT NULL DEFAULT 0")
+
+
+@migration(8, "Revisión de las estadísticas por usuario (ver user_stats.py)")
+def user_stats_revision(connection):
+    add_column(connection, UserStats.__table__.c.revision, "NOT NULL DEFAULT 0")
+
+
+@migration(9, "Versiones de los catálogos (ver cache.py)")
+def catalog_versions(connection):
+    CatalogVersion.__table__.create(connection, checkfirst=True)
+    existing = set(connection.scalars(select(CatalogVersion.name)))
+    for name in ("cube_type", "solve_type", "cube"):
+        if name not in existing:
+            connection.execute(CatalogVersion.__table__.insert().values(name=name, version=0))
+
+
+# Aplicamos, en orden, las migraciones pendientes
+def upgrade(bind=engine):
+    schema_migrations.create(bind, checkfirst=True)
+    with bind.connect() as connection:
+        applied = set(connection.scalars(select(schema_migrations.c.version)))
+    for version, description, function in sorted(MIGRATIONS, key=lambda item: item[0]):
+        if version in applied:
+            continue
+        with bind.begin() as connection:
+            function(connection)
+            connection.execute(schema_migrations.insert().values(
+                version=version, description=description, applied_at=datetime.utcnow()))
+        print(f"Migración {version} aplicada: {description}")
+
+
+if __name__ == "__main__":
+    upgrade()
+    # El contador de id_solve se pierde al reiniciarse MySQL 5.7 (ver archive.py)
+    with engine.begin() as connection:
+        reserve_ids(connection)
@@ -0,0 +1,103 @@
+# Pool de conexiones de la base de datos con métricas
+
+# Las opciones del pool se leen de variables de entorno para poder ajustarlo
+# a la cantidad de workers de uvicorn sin tocar el código:
+# - DB_POOL_SIZE: conexiones que se mantienen abiertas por proceso
+# - DB_MAX_OVERFLOW: conexiones extra permitidas en momentos de carga
+# - DB_POOL_TIMEOUT: segundos de espera máxima por una conexión libre
+# - DB_POOL_RECYCLE: segundos tras los que se renueva una conexión; debe ser
+#   menor que el wait_timeout de MySQL para no usar conexiones ya cerradas
+# - DB_POOL_PRE_PING: "1" para comprobar cada conexión antes de usarla
+
+import os
+from threading import Lock
+from time import perf_counter
+
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+
+# Función para obtener las opciones del pool desde el entorno
+def pool_options() -> dict:
+    return {
+        "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+        "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+        "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "30")),
+        "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+        "pool_pre_ping": os.getenv("DB_POOL_PRE_PING", "1") == "1",
+    }
+
+
+# Métricas de espera al obtener conexiones del pool
+class PoolMetrics:
+    def __init__(self):
+        self._lock = Lock()
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.invalidated = 0
+
+    def record_wait(self, seconds: float):
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += seconds
+            self.wait_max = max(self.wait_max, seconds)
+
+    def record_invalidated(self):
+        with self._lock:
+            self.invalidated += 1
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "wait_avg_ms": round(self.wait_total / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "wait_max_ms": round(self.wait_max * 1000, 3),
+                "invalidated": self.invalidated,
+            }
+
+
+# Mezcla que mide cuánto se espera por cada conexión (incluye abrir una nueva)
+class TimedPoolMixin:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self):
+        start = perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            self.metrics.record_wait(perf_counter() - start)
+
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+# Registramos las conexiones descartadas (por ejemplo, cerradas por el servidor
+# y detectadas por pre_ping)
+def watch_invalidations(engine):
+    @event.listens_for(engine, "invalidate")
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        engine.pool.metrics.record_invalidated()
+
+
+# Estado actual de un pool: conexiones en uso, libres, overflow y esperas.
+# SQLAlchemy cuenta el overflow desde -pool_size (es negativo mientras el pool
+# no se llenó); se devuelven sólo las conexiones abiertas por encima de pool_size
+def pool_status(pool) -> dict:
+    status = {
+        "size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "idle": pool.checkedin(),
+        "overflow": max(0, pool.overflow()),
+    }
+    metrics = getattr(pool, "metrics", None)
+    if metrics is not None:
+        status.update(metrics.as_dict())
+    return status
@@ -0,0 +1,91 @@
+# Comprobación de los planes de ejecución de las consultas más frecuentes
+
+# Ejecuta EXPLAIN sobre las consultas de los endpoints más usados y falla si
+# alguna deja de usar el índice esperado (por ejemplo, tras cambiar un modelo
+# o una migración). Pensado para ejecutarse después de "python migrations.py".
+#
+# Uso: python query_plans.py
+
+import sys
+
+from sqlalchemy import func, select, text
+
+from database import engine, Session as SessionModel, Solve, User
+from stats import result_ms
+
+# Consultas a comprobar: (nombre, consulta, índices aceptados)
+HOT_QUERIES = [
+    (
+        "solves de una sesión (GET /session/{id}/solve/)",
+        select(Solve).where(Solve.fk_session == 1).order_by(Solve.date, Solve.id_solve).limit(100),
+        {"ix_solve_session_date"},
+    ),
+    (
+        "estadísticas de una sesión",
+        select(Solve.id_solve, Solve.date, Solve.time_ms, Solve.penalty).where(Solve.fk_session == 1).order_by(Solve.date, Solve.id_solve),
+        {"ix_solve_session_date"},
+    ),
+    (
+        "agregados de los tiempos de una sesión (MIN, AVG)",
+        select(func.count(), func.min(result_ms), func.avg(result_ms)).where(Solve.fk_session == 1),
+        {"ix_solve_session_time"},
+    ),
+    (
+        "listado global de solves (GET /solve/)",
+        select(Solve).order_by(Solve.date, Solve.id_solve).limit(100),
+        {"ix_solve_date"},
+    ),
+    (
+        "sesiones de un usuario (GET /session/?user_id=)",
+        select(SessionModel).where(SessionModel.fk_user == 1),
+        {"ix_session_user"},
+    ),
+    (
+        "usuario por username (get_current_user, login)",
+        select(User).where(User.username == "user"),
+        {"username", "sqlite_autoindex_user"},
+    ),
+]
+
+
+# Índices usados según el EXPLAIN de MySQL (columnas "key" y "possible_keys")
+def mysql_indexes(connection, sql):
+    indexes = set()
+    for row in connection.execute(text(f"EXPLAIN {sql}")).mappings():
+        for column in ("key", "possible_keys"):
+            if row.get(column):
+                indexes.update(row[column].split(","))
+    return indexes
+
+
+# Índices usados según el EXPLAIN QUERY PLAN de SQLite
+def sqlite_indexes(connection, sql):
+    indexes = set()
+    for row in connection.execute(text(f"EXPLAIN QUERY PLAN {sql}")):
+        detail = row[-1]
+        if "INDEX" in detail:
+            indexes.add(detail.split("INDEX", 1)[1].split()[0])
+    return indexes
+
+
+# Comprobamos cada consulta y devolvemos la lista de las que no usan índice
+def check_query_plans(bind=engine):
+    explain = mysql_indexes if bind.dialect.name == "mysql" else sqlite_indexes
+    failures = []
+    with bind.connect() as connection:
+        for name, query, expected in HOT_QUERIES:
+            sql = query.compile(bind, compile_kwargs={"literal_binds": True})
+            used = explain(connection, sql)
+            # El índice de una restricción unique tiene nombres distintos según el motor
+            if not any(index == wanted or wanted in index for index in used for wanted in expected):
+                failures.append((name, expected, used))
+    return failures
+
+
+if __name__ == "__main__":
+    failures = check_query_plans()
+    for name, expected, used in failures:
+        print(f"ERROR: {name} no usa {sorted(expected)} (usa {sorted(used) or 'ninguno'})")
+    if failures:
+        sys.exit(1)
+    print(f"Las {len(HOT_QUERIES)} consultas usan sus índices")
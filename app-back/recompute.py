@@ -0,0 +1,176 @@
+# Cola de recálculos en segundo plano con agrupación de ráfagas
+
+# Las escrituras encolan la clave de lo que hay que recalcular (por ejemplo,
+# una sesión) y una tarea del event loop la procesa cuando deja de recibir
+# escrituras durante RECOMPUTE_DELAY segundos, o a más tardar
+# RECOMPUTE_MAX_DELAY segundos después de la primera, para que una escritura
+# continua no la posponga para siempre. Una clave que se encola varias veces
+# mientras espera se recalcula una sola vez: diez solves seguidos en una
+# sesión producen un único recálculo.
+#
+# El trabajo se ejecuta en el threadpool, fuera del camino de las peticiones,
+# por lotes de hasta RECOMPUTE_BATCH_SIZE claves. La profundidad de la cola y
+# el retraso (desde la primera escritura hasta el recálculo) se exponen en
+# /health/recompute y en /metrics. Al detener la aplicación se procesa lo
+# pendiente.
+
+import asyncio
+import os
+import traceback
+from threading import Lock
+from time import monotonic
+
+# Segundos sin escrituras tras los que se recalcula y espera máxima desde la primera
+RECOMPUTE_DELAY = float(os.getenv("RECOMPUTE_DELAY", "0.5"))
+RECOMPUTE_MAX_DELAY = float(os.getenv("RECOMPUTE_MAX_DELAY", "5"))
+# Claves que se recalculan como mucho en cada lote
+RECOMPUTE_BATCH_SIZE = 100
+
+
+class DebouncedQueue:
+    # `handler` recibe una lista de claves y se ejecuta en un hilo
+    def __init__(self, name: str, handler):
+        self.name = name
+        self.handler = handler
+        # Claves pendientes: {clave: [primera escritura, última escritura]}
+        self._pending = {}
+        self._lock = Lock()
+        self._wakeup = None
+        self.loop = None
+        self.task = None
+        self.scheduled = 0
+        self.coalesced = 0
+        self.processed = 0
+        self.failed = 0
+        self.batches = 0
+        self.lag_total = 0.0
+        self.lag_max = 0.0
+        self.last_lag = 0.0
+
+    # Encolamos una clave (desde cualquier hilo). Sin la tarea en marcha (en
+    # los scripts, por ejemplo) se recalcula en el momento
+    def schedule(self, key):
+        now = monotonic()
+        if self.loop is None:
+            self._process([(key, now)])
+            return
+        with self._lock:
+            times = self._pending.get(key)
+            if times is None:
+                self._pending[key] = [now, now]
+            else:
+                times[1] = now
+                self.coalesced += 1
+            self.scheduled += 1
+        self.loop.call_soon_threadsafe(self._wakeup.set)
+
+    def pending(self, key) -> bool:
+        with self._lock:
+            return key in self._pending
+
+    # Sacamos las claves listas para recalcular y devolvemos también cuándo
+    # lo estará la próxima (None si no quedan)
+    def _take_ready(self, everything=False):
+        now = monotonic()
+        ready, next_due = [], None
+        with self._lock:
+            for key, (first, last) in list(self._pending.items()):
+                due = min(last + RECOMPUTE_DELAY, first + RECOMPUTE_MAX_DELAY)
+                if (everything or due <= now) and len(ready) < RECOMPUTE_BATCH_SIZE:
+                    ready.append((key, first))
+                    del self._pending[key]
+                elif next_due is None or due < next_due:
+                    next_due = due
+        return ready, next_due
+
+    # Recalculamos un lote (en un hilo) y registramos el retraso de cada clave
+    def _process(self, ready):
+        try:
+            self.handler([key for key, _ in ready])
+        except Exception:
+            traceback.print_exc()
+            with self._lock:
+                self.failed += len(ready)
+            return
+        now = monotonic()
+        with self._lock:
+            self.batches += 1
+            for _, first in ready:
+                lag = now - first
+                self.processed += 1
+                self.lag_total += lag
+                self.lag_max = max(self.lag_max, lag)
+                self.last_lag = lag
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Se limpia antes de mirar la cola, para no perder un aviso que llegue mientras tanto
+            self._wakeup.clear()
+            ready, next_due = self._take_ready()
+            if ready:
+                await loop.run_in_executor(None, self._process, ready)
+                continue
+            # Esperamos a una escritura nueva o a que venza la próxima clave
+            timeout = None if next_due is None else max(0.0, next_due - monotonic())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self.task = asyncio.create_task(self._run())
+
+    # Detenemos la tarea y procesamos lo pendiente, para no perder recálculos
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        self.loop = None
+        loop = asyncio.get_running_loop()
+        while True:
+            ready, _ = self._take_ready(everything=True)
+            if not ready:
+                break
+            await loop.run_in_executor(None, self._process, ready)
+
+    def metrics(self) -> dict:
+        now = monotonic()
+        with self._lock:
+            oldest = min((first for first, _ in self._pending.values()), default=None)
+            return {
+                "depth": len(self._pending),
+                "oldest_seconds": round(now - oldest, 3) if oldest is not None else 0.0,
+                "scheduled": self.scheduled,
+                "coalesced": self.coalesced,
+                "processed": self.processed,
+                "failed": self.failed,
+                "batches": self.batches,
+                "lag_avg_ms": round(self.lag_total / self.processed * 1000, 3) if self.processed else 0.0,
+                "lag_max_ms": round(self.lag_max * 1000, 3),
+                "lag_last_ms": round(self.last_lag * 1000, 3),
+            }
+
+    # Líneas de Prometheus de la cola
+    def metrics_lines(self) -> list:
+        values = self.metrics()
+        label = f'queue="{self.name}"'
+        lines = []
+        for name, kind, description, value in (
+            ("recompute_queue_depth", "gauge", "Claves pendientes de recalcular", values["depth"]),
+            ("recompute_oldest_pending_seconds", "gauge", "Antigüedad de la clave pendiente más antigua",
+             values["oldest_seconds"]),
+            ("recompute_scheduled_total", "counter", "Claves encoladas", values["scheduled"]),
+            ("recompute_coalesced_total", "counter", "Claves encoladas que ya estaban pendientes", values["coalesced"]),
+            ("recompute_processed_total", "counter", "Claves recalculadas", values["processed"]),
+            ("recompute_failed_total", "counter", "Claves cuyo recálculo falló", values["failed"]),
+            ("recompute_lag_seconds_sum", "counter", "Suma de los retrasos desde la primera escritura hasta el recálculo",
+             self.lag_total),
+            ("recompute_lag_max_seconds", "gauge", "Mayor retraso desde la primera escritura hasta el recálculo",
+             self.lag_max),
+        ):
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}", f"{name}{{{label}}} {value}"]
+        return lines
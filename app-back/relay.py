@@ -0,0 +1,177 @@
+# Retransmisión entre procesos de los eventos en vivo
+
+# broadcast.py difunde cada escritura a los clientes conectados al proceso
+# que la hizo, pero con varios workers (ver gunicorn.conf.py) el cliente de
+# una sesión puede estar conectado a otro proceso. Por eso cada proceso lee
+# cada LIVE_POLL_INTERVAL segundos el registro de cambios (change_log, ver
+# changes.py) a partir de la última versión leída y difunde los cambios de
+# las sesiones que escuchan sus clientes. Sin clientes conectados sólo se lee
+# la versión actual.
+#
+# Las versiones que confirmó el propio proceso se saltean, porque ya se
+# difundieron al escribirlas. Si el proceso lee una antes de marcarla (justo
+# después de confirmarla), el cliente recibe el evento dos veces, lo que no
+# cambia su estado: los eventos reemplazan o quitan el solve por su id.
+#
+# Eventos retransmitidos, con las estadísticas de la sesión:
+# - solve_updated con el solve, para uno creado o editado (el cliente lo
+#   agrega si no lo tenía)
+# - solve_removed con {"id_solve": id}, en las demás sesiones escuchadas del
+#   mismo usuario, para un solve eliminado o movido a otra sesión
+# - resync, para una sesión con más de LIVE_RESYNC_AFTER cambios (una carga
+#   masiva) o para todas si se acumularon más de LIVE_POLL_LIMIT cambios
+# - session_deleted, al eliminarse la sesión
+
+import asyncio
+import os
+import traceback
+from threading import Lock
+
+from sqlalchemy import select
+
+from broadcast import broadcaster
+from changes import change_log, versions, DELETE, SESSION, SOLVE, UPSERT
+from database import SessionLocal, Change, Session as SessionModel, Solve
+from routers.solve import SOLVE_COLUMNS, solve_to_dict
+from stats import stats_engine
+
+# Segundos entre lecturas del registro de cambios
+LIVE_POLL_INTERVAL = float(os.getenv("LIVE_POLL_INTERVAL", "0.5"))
+# Cambios que se leen como mucho en cada lectura
+LIVE_POLL_LIMIT = 1000
+# Cambios de una sesión a partir de los cuales se envía un único resync
+LIVE_RESYNC_AFTER = 20
+
+
+# Retransmisor del proceso
+class ChangeRelay:
+    def __init__(self):
+        # Última versión leída del registro (None hasta la primera lectura)
+        self.version = None
+        # Versiones confirmadas por este proceso aún no leídas
+        self._local = set()
+        self._lock = Lock()
+        self.task = None
+        self.polls = 0
+        self.relayed = 0
+        self.skipped = 0
+        self.failed = 0
+        change_log.listeners.append(self.committed)
+
+    # Versiones confirmadas por este proceso (desde el evento after_commit)
+    def committed(self, recorded):
+        with self._lock:
+            if self.version is not None:
+                self._local.update(version for version in recorded if version > self.version)
+
+    # Avanzamos hasta `version`, olvidando las versiones propias ya leídas
+    def _advance(self, version):
+        with self._lock:
+            self.version = version
+            self._local = {local for local in self._local if local > version}
+
+    # Leemos los cambios nuevos y preparamos los eventos de las sesiones
+    # escuchadas. Devuelve [(canal, evento)] (en un hilo, con su propia conexión)
+    def poll(self, id_sessions) -> list:
+        db = SessionLocal()
+        try:
+            if self.version is None or not id_sessions:
+                self._advance(versions(db)[0])
+                return []
+            rows = db.execute(
+                select(Change.version, Change.entity, Change.entity_id, Change.op, Change.fk_user)
+                .where(Change.version > self.version, Change.entity.in_([SOLVE, SESSION]))
+                .order_by(Change.version, Change.id_change)
+                .limit(LIVE_POLL_LIMIT + 1)
+            ).all()
+            if len(rows) > LIVE_POLL_LIMIT:
+                # Demasiados cambios: los clientes vuelven a pedir los datos por la API
+                self._advance(versions(db)[0])
+                return [(("session", id_session), {"type": "resync"}) for id_session in id_sessions]
+            if not rows:
+                return []
+            with self._lock:
+                local = set(self._local)
+            self._advance(rows[-1].version)
+            self.skipped += sum(1 for row in rows if row.version in local)
+            return self._events(db, [row for row in rows if row.version not in local], id_sessions)
+        finally:
+            db.close()
+
+    # Eventos de unos cambios para las sesiones escuchadas
+    def _events(self, db, rows, id_sessions) -> list:
+        sessions = {
+            db_session.id_session: db_session
+            for db_session in db.query(SessionModel).filter(SessionModel.id_session.in_(list(id_sessions)))
+        }
+        by_user = {}
+        for db_session in sessions.values():
+            by_user.setdefault(db_session.fk_user, []).append(db_session.id_session)
+        ids = [row.entity_id for row in rows if row.entity == SOLVE and row.op == UPSERT and row.fk_user in by_user]
+        solves = {
+            solve.id_solve: solve for solve in db.execute(select(*SOLVE_COLUMNS).where(Solve.id_solve.in_(ids)))
+        } if ids else {}
+        # Último evento de cada solve por sesión: {id_session: {id_solve: (tipo, datos)}}
+        changed = {}
+        events = []
+        for row in rows:
+            if row.entity == SESSION:
+                if row.op == DELETE and row.entity_id in id_sessions:
+                    events.append((("session", row.entity_id), {"type": "session_deleted"}))
+                continue
+            solve = solves.get(row.entity_id) if row.op == UPSERT else None
+            for id_session in by_user.get(row.fk_user, ()):
+                if solve is not None and solve.fk_session == id_session:
+                    changed.setdefault(id_session, {})[row.entity_id] = ("solve_updated", solve_to_dict(solve))
+                else:
+                    changed.setdefault(id_session, {})[row.entity_id] = ("solve_removed", {"id_solve": row.entity_id})
+        for id_session, solve_events in changed.items():
+            stats = stats_engine.summary(db, sessions[id_session])
+            channel = ("session", id_session)
+            if len(solve_events) > LIVE_RESYNC_AFTER:
+                events.append((channel, {"type": "resync", "stats": stats}))
+                continue
+            for event_type, data in solve_events.values():
+                events.append((channel, {"type": event_type, "solve": data, "stats": stats}))
+        return events
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            id_sessions = {key for kind, key in list(broadcaster.channels) if kind == "session"}
+            try:
+                events = await loop.run_in_executor(None, self.poll, id_sessions)
+            except Exception:
+                traceback.print_exc()
+                self.failed += 1
+                events = []
+            self.polls += 1
+            for channel, event in events:
+                broadcaster.publish(channel, event)
+                self.relayed += 1
+            await asyncio.sleep(LIVE_POLL_INTERVAL)
+
+    def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    def metrics(self) -> dict:
+        with self._lock:
+            pending = len(self._local)
+        return {
+            "version": self.version,
+            "polls": self.polls,
+            "relayed": self.relayed,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "local_pending": pending,
+        }
+
+
+# Instancia global del retransmisor
+relay = ChangeRelay()
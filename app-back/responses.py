@@ -0,0 +1,29 @@
+# Serialización rápida de respuestas JSON
+
+# Si está instalado, se usa orjson (escrito en Rust): serializa datetime, time
+# y listas grandes varias veces más rápido que el módulo json y sin espacios
+# sobrantes. Sin orjson se usa el módulo json con separadores compactos
+
+import json
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Función para serializar un valor a JSON en bytes
+if orjson is not None:
+    def dumps(content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+else:
+    def dumps(content) -> bytes:
+        return json.dumps(content, separators=(",", ":")).encode()
+
+
+# Clase de respuesta por defecto de la aplicación
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return dumps(content)
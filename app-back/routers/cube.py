@@ -1,8 +1,12 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from pydantic import BaseModel
-from database import get_db, Cube
-from typing import List
+from fastapi import APIRouter, Depends, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import BaseModel, ConfigDict
+from database import get_async_db, Cube
+from cache import cached_json, invalidate_catalog
+from changes import change_log
+from routers.cube_type import CubeTypeOut
+from typing import List, Optional
 
 router = APIRouter()
 
@@ -15,47 +19,73 @@ class CubeBase(BaseModel):
     fk_cube_type: int
     magnetic: bool
 
+# Definimos un modelo para las respuestas con instancias de Cube, con su tipo
+# de cubo (la relación Cube.cube_type debe venir cargada en la consulta)
+class CubeOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id_cube: int
+    brand: Optional[str]
+    model: Optional[str]
+    fk_cube_type: Optional[int]
+    magnetic: Optional[bool]
+    cube_type: Optional[CubeTypeOut]
+
 # Definimos un endpoint POST en la ruta "/cube/"
 @router.post("/cube/", tags=["Cube"])
-def post_cube(cube: CubeBase, db: Session = Depends(get_db)):
+async def post_cube(cube: CubeBase, db: AsyncSession = Depends(get_async_db)):
     db_cube = Cube(**cube.dict())
     db.add(db_cube)
-    db.commit()
-    db.refresh(db_cube)
+    await db.run_sync(change_log.cube_saved, db_cube)
+    # Invalidamos las respuestas del catálogo guardadas en caché (en todos los workers)
+    await invalidate_catalog(db, "cube")
+    await db.commit()
+    await db.refresh(db_cube)
     return db_cube
 
 # Definimos un endpoint GET en la ruta "/cube/{id}"
 @router.get("/cube/{id}", tags=["Cube"])
-def get_cube(id: int, db: Session = Depends(get_db)):
-    db_cube = db.query(Cube).filter(Cube.id_cube == id).first()
-    return db_cube
+async def get_cube(id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
+    async def load():
+        return await db.scalar(select(Cube).where(Cube.id_cube == id))
+    return await cached_json(request, db, ("cube", id), load)
 
 # Definimos un endpoint GET en la ruta "/cube/"
 @router.get("/cube/", response_model=List[CubeBase], tags=["Cube"])
-def get_cubes(db: Session = Depends(get_db)):
-    db_cubes = db.query(Cube).all()
-    return db_cubes
+async def get_cubes(request: Request, db: AsyncSession = Depends(get_async_db)):
+    async def load():
+        db_cubes = (await db.scalars(select(Cube))).all()
+        return [CubeBase(brand=c.brand, model=c.model, fk_cube_type=c.fk_cube_type, magnetic=c.magnetic) for c in db_cubes]
+    # Devolvemos la lista de cubos desde el caché, con ETag
+    return await cached_json(request, db, ("cube", "all"), load)
 
 # Definimos un endpoint PUT en la ruta "/cube/{id}"
 @router.put("/cube/{id}", tags=["Cube"])
-def put_cube(id: int, cube: CubeBase, db: Session = Depends(get_db)):
-    db_cube = db.query(Cube).filter(Cube.id_cube == id).first()
+async def put_cube(id: int, cube: CubeBase, db: AsyncSession = Depends(get_async_db)):
+    db_cube = await db.scalar(select(Cube).where(Cube.id_cube == id))
     db_cube.brand = cube.brand
     db_cube.model = cube.model
     db_cube.fk_cube_type = cube.fk_cube_type
     db_cube.magnetic = cube.magnetic
-    db.commit()
-    db.refresh(db_cube)
+    await db.run_sync(change_log.cube_saved, db_cube)
+    # Invalidamos las respuestas del catálogo guardadas en caché (en todos los workers)
+    await invalidate_catalog(db, "cube")
+    await db.commit()
+    await db.refresh(db_cube)
     return db_cube
 
 # Definimos un endpoint DELETE en la ruta "/cube/{id}"
 @router.delete("/cube/{id}", tags=["Cube"])
-def delete_cube(id: int, db: Session = Depends(get_db)):
+async def delete_cube(id: int, db: AsyncSession = Depends(get_async_db)):
     # Obtenemos la instancia de Cube con el id proporcionado
-    db_cube = db.query(Cube).filter(Cube.id_cube == id).first()
+    db_cube = await db.scalar(select(Cube).where(Cube.id_cube == id))
     # Eliminamos la instancia de Cube de la sesión de la base de datos
-    db.delete(db_cube)
+    await db.delete(db_cube)
+    # Registramos el cambio para la sincronización de los clientes (ver changes.py)
+    await db.run_sync(change_log.cube_removed, db_cube)
+    # Invalidamos las respuestas del catálogo guardadas en caché (en todos los workers)
+    await invalidate_catalog(db, "cube")
     # Confirmamos la transacción para guardar los cambios en la base de datos
-    db.commit()
+    await db.commit()
     # Devolvemos la instancia de Cube eliminada
     return db_cube
@@ -1,7 +1,10 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from pydantic import BaseModel
-from database import get_db, CubeType
+from fastapi import APIRouter, Depends, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import BaseModel, ConfigDict
+from database import get_async_db, CubeType
+from cache import cached_json, invalidate_catalog
+from typing import Optional
 
 router = APIRouter()
 
@@ -11,56 +14,73 @@ router = APIRouter()
 class CubeTypeBase(BaseModel):
     cube_type: str
 
+# Definimos un modelo para las respuestas con instancias de CubeType
+class CubeTypeOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id_cube_type: int
+    cube_type: Optional[str]
+
 # Definimos un endpoint POST en la ruta "/cube_type/"
 @router.post("/cube_type/", tags=["CubeType"])
-def post_cube_type(cube_type: CubeTypeBase, db: Session = Depends(get_db)):
+async def post_cube_type(cube_type: CubeTypeBase, db: AsyncSession = Depends(get_async_db)):
+    # Convertimos el modelo de Pydantic a una instancia de la clase CubeType de SQLAlchemy
+    db_cube_type = CubeType(**cube_type.dict())
     # Añadimos la nueva instancia de CubeType a la sesión de la base de datos
-    db.add(cube_type)
+    db.add(db_cube_type)
+    # Invalidamos las respuestas del catálogo guardadas en caché (en todos los workers)
+    await invalidate_catalog(db, "cube_type", "cube")
     # Confirmamos la transacción para guardar los cambios en la base de datos
-    db.commit()
+    await db.commit()
     # Refrescamos la instancia de CubeType para obtener los datos actualizados desde la base de datos
-    db.refresh(cube_type)
+    await db.refresh(db_cube_type)
     # Devolvemos la instancia de CubeType creada
-    return cube_type
+    return db_cube_type
 
 # Definimos un endpoint GET en la ruta "/cube_type/{id}"
 @router.get("/cube_type/{id}", tags=["CubeType"])
-def get_cube_type(id: int, db: Session = Depends(get_db)):
+async def get_cube_type(id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
     # Obtenemos la instancia de CubeType con el id proporcionado
-    db_cube_type = db.query(CubeType).filter(CubeType.id_cube_type == id).first()
-    # Devolvemos la instancia de CubeType
-    return db_cube_type
+    async def load():
+        return await db.scalar(select(CubeType).where(CubeType.id_cube_type == id))
+    # Devolvemos la instancia de CubeType (desde el caché, con ETag)
+    return await cached_json(request, db, ("cube_type", id), load)
 
 # Definimos un endpoint GET en la ruta "/cube_type/"
 @router.get("/cube_type/", tags=["CubeType"])
-def get_cube_types(db: Session = Depends(get_db)):
+async def get_cube_types(request: Request, db: AsyncSession = Depends(get_async_db)):
     # Obtenemos todas las instancias de CubeType
-    db_cube_types = db.query(CubeType).all()
-    # Devolvemos la lista de instancias de CubeType
-    return db_cube_types
+    async def load():
+        return (await db.scalars(select(CubeType))).all()
+    # Devolvemos la lista de instancias de CubeType (desde el caché, con ETag)
+    return await cached_json(request, db, ("cube_type", "all"), load)
 
 # Definimos un endpoint DELETE en la ruta "/cube_type/{id}"
 @router.delete("/cube_type/{id}", tags=["CubeType"])
-def delete_cube_type(id: int, db: Session = Depends(get_db)):
+async def delete_cube_type(id: int, db: AsyncSession = Depends(get_async_db)):
     # Obtenemos la instancia de CubeType con el id proporcionado
-    db_cube_type = db.query(CubeType).filter(CubeType.id_cube_type == id).first()
+    db_cube_type = await db.scalar(select(CubeType).where(CubeType.id_cube_type == id))
     # Eliminamos la instancia de CubeType de la sesión de la base de datos
-    db.delete(db_cube_type)
+    await db.delete(db_cube_type)
+    # Invalidamos las respuestas del catálogo guardadas en caché (en todos los workers)
+    await invalidate_catalog(db, "cube_type", "cube")
     # Confirmamos la transacción para guardar los cambios en la base de datos
-    db.commit()
+    await db.commit()
     # Devolvemos la instancia de CubeType eliminada
     return db_cube_type
 
 # Definimos un endpoint PUT en la ruta "/cube_type/{id}"
 @router.put("/cube_type/{id}", tags=["CubeType"])
-def put_cube_type(id: int, cube_type: CubeTypeBase, db: Session = Depends(get_db)):
+async def put_cube_type(id: int, cube_type: CubeTypeBase, db: AsyncSession = Depends(get_async_db)):
     # Obtenemos la instancia de CubeType con el id proporcionado
-    db_cube_type = db.query(CubeType).filter(CubeType.id_cube_type == id).first()
+    db_cube_type = await db.scalar(select(CubeType).where(CubeType.id_cube_type == id))
     # Actualizamos los campos de la instancia de CubeType con los valores proporcionados
     db_cube_type.cube_type = cube_type.cube_type
+    # Invalidamos las respuestas del catálogo guardadas en caché (en todos los workers)
+    await invalidate_catalog(db, "cube_type", "cube")
     # Confirmamos la transacción para guardar los cambios en la base de datos
-    db.commit()
+    await db.commit()
     # Refrescamos la instancia de CubeType para obtener los datos actualizados desde la base de datos
-    db.refresh(db_cube_type)
+    await db.refresh(db_cube_type)
     # Devolvemos la instancia de CubeType actualizada
     return db_cube_type
@@ -0,0 +1,102 @@
+from fastapi import APIRouter, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from archive import open_archive
+from database import SessionLocal, Session as SessionModel, Solve
+from routers.solve import iter_solves, solve_to_dict
+import csv
+import heapq
+import io
+import json
+import zlib
+
+router = APIRouter()
+
+# Exportación del historial de solves
+
+# Columnas del CSV exportado
+EXPORT_COLUMNS = ["id_solve", "date", "time_ms", "penalty", "scramble", "fk_cube", "fk_solve_type", "fk_session"]
+# Tamaño aproximado (en bytes) de cada bloque que se envía al cliente
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+# Generador de los solves archivados (ver archive.py) de las sesiones que
+# devuelve `sessions`, una consulta de (fk_user, id_session), en orden cronológico
+def archived_rows(sessions):
+    db = SessionLocal()
+    try:
+        by_user = {}
+        for fk_user, id_session in db.execute(sessions.where(SessionModel.archived.is_(True))):
+            by_user.setdefault(fk_user, []).append(id_session)
+    finally:
+        db.close()
+    archives = [(open_archive(fk_user), id_sessions) for fk_user, id_sessions in by_user.items()]
+    yield from heapq.merge(*[
+        archive.rows(archive.sessions_index(id_sessions)) for archive, id_sessions in archives if archive is not None
+    ], key=row_key)
+
+# Clave de orden de un solve exportado (la fecha en ISO 8601 se ordena como texto)
+def row_key(row):
+    return (row["date"] or "", row["id_solve"])
+
+# Generador que serializa los solves en CSV o NDJSON, agrupando las líneas en
+# bloques. Los solves de la tabla se intercalan con los archivados
+def serialize_solves(filters, sessions, format: str):
+    buffer = io.StringIO()
+    if format == "csv":
+        writer = csv.DictWriter(buffer, fieldnames=EXPORT_COLUMNS)
+        writer.writeheader()
+    rows = (solve_to_dict(db_solve) for db_solve in iter_solves(filters))
+    for row in heapq.merge(archived_rows(sessions), rows, key=row_key):
+        if format == "csv":
+            writer.writerow(row)
+        else:
+            buffer.write(json.dumps(row) + "\n")
+        if buffer.tell() >= EXPORT_CHUNK_SIZE:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+# Generador que comprime con gzip los bloques a medida que se producen
+def gzip_chunks(chunks):
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+# Función para crear la respuesta de la exportación
+def export_response(filters, sessions, filename: str, format: str, gzip: bool):
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    filename = f"{filename}.{format}"
+    chunks = serialize_solves(filters, sessions, format)
+    if gzip:
+        chunks = gzip_chunks(chunks)
+        media_type = "application/gzip"
+        filename += ".gz"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    return StreamingResponse(chunks, media_type=media_type, headers=headers)
+
+# Definimos un endpoint GET en la ruta "/user/{id}/export"
+@router.get("/user/{id}/export", tags=["Export"])
+def export_user_solves(
+    id: int,
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    gzip: bool = False,
+):
+    # Exportamos los solves de todas las sesiones del usuario
+    sessions = select(SessionModel.id_session).where(SessionModel.fk_user == id)
+    archived = select(SessionModel.fk_user, SessionModel.id_session).where(SessionModel.fk_user == id)
+    return export_response([Solve.fk_session.in_(sessions)], archived, f"user-{id}-solves", format, gzip)
+
+# Definimos un endpoint GET en la ruta "/session/{id}/export"
+@router.get("/session/{id}/export", tags=["Export"])
+def export_session_solves(
+    id: int,
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    gzip: bool = False,
+):
+    # Exportamos los solves de la sesión
+    archived = select(SessionModel.fk_user, SessionModel.id_session).where(SessionModel.id_session == id)
+    return export_response([Solve.fk_session == id], archived, f"session-{id}-solves", format, gzip)
@@ -0,0 +1,71 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from database import engine, async_engine, ENGINE_OPTIONS, ASYNC_ENGINE_OPTIONS
+from pool import pool_status
+from storage import backend_status
+from scramble.pool import scramble_pools
+from cache import catalog_cache
+from routers.user import user_cache
+from broadcast import broadcaster
+from relay import relay
+from metrics import metrics
+from stats import stats_engine
+import startup
+import os
+
+router = APIRouter()
+
+# Endpoints de estado del servicio
+
+# Definimos un endpoint GET en la ruta "/health/db"
+@router.get("/health/db", tags=["Health"])
+def get_db_health():
+    # Devolvemos el motor en uso, las opciones con que se crearon los engines
+    # síncrono y asíncrono y el estado de sus pools
+    return {
+        "backend": backend_status(engine),
+        "config": {"sync": ENGINE_OPTIONS, "async": ASYNC_ENGINE_OPTIONS},
+        "sync": pool_status(engine.pool),
+        "async": pool_status(async_engine.sync_engine.pool),
+    }
+
+# Definimos un endpoint GET en la ruta "/health/scramble"
+@router.get("/health/scramble", tags=["Health"])
+def get_scramble_health():
+    # Devolvemos el estado de las reservas de scrambles por tipo de cubo
+    return scramble_pools.metrics()
+
+# Definimos un endpoint GET en la ruta "/health/cache"
+@router.get("/health/cache", tags=["Health"])
+def get_cache_health():
+    # Devolvemos los aciertos y fallos de los cachés en memoria
+    return {"user": user_cache.stats(), "catalog": catalog_cache.stats()}
+
+# Definimos un endpoint GET en la ruta "/health/live"
+@router.get("/health/live", tags=["Health"])
+def get_live_health():
+    # Devolvemos los canales, suscriptores y eventos pendientes o descartados de
+    # los WebSocket, y la retransmisión de los cambios de los demás workers
+    return {**broadcaster.metrics(), "relay": relay.metrics()}
+
+# Definimos un endpoint GET en la ruta "/health/recompute"
+@router.get("/health/recompute", tags=["Health"])
+def get_recompute_health():
+    # Devolvemos la profundidad y el retraso de la cola de estadísticas de las sesiones
+    return stats_engine.queue.metrics()
+
+# Definimos un endpoint GET en la ruta "/metrics"
+@router.get("/metrics", response_class=PlainTextResponse, tags=["Health"])
+def get_metrics():
+    # Devolvemos las métricas de las peticiones en formato de Prometheus, junto
+    # con el estado de los pools de conexiones y el arranque. Con varios
+    # workers, cada respuesta corresponde al worker que atendió la petición
+    extra = ["# HELP app_worker_pid Proceso del worker que atendió la petición",
+             "# TYPE app_worker_pid gauge", f"app_worker_pid {os.getpid()}"]
+    extra += startup.metrics_lines()
+    extra += stats_engine.queue.metrics_lines()
+    for name, description in (("checked_out", "Conexiones en uso"), ("idle", "Conexiones libres"), ("overflow", "Conexiones por encima de pool_size")):
+        extra += [f"# HELP db_pool_{name} {description}", f"# TYPE db_pool_{name} gauge"]
+        for label, pool in (("sync", engine.pool), ("async", async_engine.sync_engine.pool)):
+            extra.append(f'db_pool_{name}{{pool="{label}"}} {pool_status(pool)[name]}')
+    return PlainTextResponse(metrics.render(extra), media_type="text/plain; version=0.0.4")
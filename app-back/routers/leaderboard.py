@@ -0,0 +1,81 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db, CubeType, User
+from leaderboard import leaderboards
+
+router = APIRouter()
+
+# Rankings de mejores tiempos (en milisegundos) por tipo de cubo
+
+# Tamaño de página por defecto y máximo de los rankings
+DEFAULT_LEADERBOARD_SIZE = 10
+MAX_LEADERBOARD_SIZE = 100
+
+# Métrica del ranking: mejor single, mejor ao5 o mejor ao12
+METRIC_PATTERN = "^(single|ao5|ao12)$"
+
+# Función para convertir una página del ranking en una lista con los nombres de usuario
+async def page_entries(db: AsyncSession, page: list) -> list:
+    usernames = dict((await db.execute(
+        select(User.id_user, User.username).where(User.id_user.in_([id_user for _, id_user, _ in page]))
+    )).all()) if page else {}
+    return [
+        {"rank": rank, "id_user": id_user, "username": usernames.get(id_user), "value": value}
+        for rank, id_user, value in page
+    ]
+
+# Definimos un endpoint GET en la ruta "/leaderboard/"
+@router.get("/leaderboard/", tags=["Leaderboard"])
+async def get_leaderboards(
+    metric: str = Query("single", pattern=METRIC_PATTERN),
+    limit: int = Query(DEFAULT_LEADERBOARD_SIZE, ge=1, le=MAX_LEADERBOARD_SIZE),
+    db: AsyncSession = Depends(get_async_db),
+):
+    # Devolvemos los primeros puestos del ranking de cada tipo de cubo
+    names = dict((await db.execute(select(CubeType.id_cube_type, CubeType.cube_type))).all())
+    result = []
+    for fk_cube_type in leaderboards.cube_types():
+        ranking = leaderboards.ranking(fk_cube_type, metric)
+        result.append({
+            "fk_cube_type": fk_cube_type,
+            "cube_type": names.get(fk_cube_type),
+            "total": len(ranking),
+            "entries": await page_entries(db, ranking.page(0, limit)),
+        })
+    return {"metric": metric, "leaderboards": result}
+
+# Definimos un endpoint GET en la ruta "/leaderboard/{fk_cube_type}"
+@router.get("/leaderboard/{fk_cube_type}", tags=["Leaderboard"])
+async def get_leaderboard(
+    fk_cube_type: int,
+    metric: str = Query("single", pattern=METRIC_PATTERN),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(DEFAULT_LEADERBOARD_SIZE, ge=1, le=MAX_LEADERBOARD_SIZE),
+    db: AsyncSession = Depends(get_async_db),
+):
+    # Devolvemos una página del ranking del tipo de cubo
+    ranking = leaderboards.ranking(fk_cube_type, metric)
+    return {
+        "fk_cube_type": fk_cube_type,
+        "metric": metric,
+        "total": len(ranking),
+        "entries": await page_entries(db, ranking.page(offset, limit)),
+    }
+
+# Definimos un endpoint GET en la ruta "/leaderboard/{fk_cube_type}/user/{id_user}"
+@router.get("/leaderboard/{fk_cube_type}/user/{id_user}", tags=["Leaderboard"])
+async def get_leaderboard_rank(fk_cube_type: int, id_user: int, metric: str = Query("single", pattern=METRIC_PATTERN)):
+    # Devolvemos la posición del usuario en el ranking del tipo de cubo
+    ranking = leaderboards.ranking(fk_cube_type, metric)
+    rank = ranking.rank(id_user)
+    if rank is None:
+        raise HTTPException(status_code=404, detail="User not ranked")
+    return {
+        "fk_cube_type": fk_cube_type,
+        "metric": metric,
+        "id_user": id_user,
+        "rank": rank,
+        "value": ranking.values[id_user],
+        "total": len(ranking),
+    }
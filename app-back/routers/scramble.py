@@ -0,0 +1,18 @@
+from fastapi import APIRouter, HTTPException
+from scramble.pool import ScrambleUnavailable, scramble_pools
+
+router = APIRouter()
+
+# Generación de scrambles
+
+# Definimos un endpoint GET en la ruta "/scramble/{cube_type}"
+@router.get("/scramble/{cube_type}", tags=["Scramble"])
+async def get_scramble(cube_type: str):
+    # Sacamos un scramble pregenerado de la reserva del tipo de cubo
+    try:
+        scramble = await scramble_pools.get(cube_type)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Unsupported cube type")
+    except ScrambleUnavailable as error:
+        raise HTTPException(status_code=503, detail=str(error))
+    return {"cube_type": cube_type, "scramble": scramble}
@@ -1,7 +1,19 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from pydantic import BaseModel
-from database import get_db, Session as SessionModel, Solve
+from fastapi import APIRouter, Depends, HTTPException, Query, WebSocket
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from pydantic import BaseModel, ConfigDict
+from database import get_async_db, AsyncSessionLocal, Session as SessionModel, Solve, Cube
+from routers.solve import SolveOut
+from routers.cube import CubeOut
+from routers.solve_type import SolveTypeOut
+from stats import stats_engine
+from user_stats import mark_users_stale
+from leaderboard import leaderboards
+from broadcast import broadcaster
+from changes import change_log
+import asyncio
+from typing import List, Optional, Union
 
 router = APIRouter()
 
@@ -16,79 +28,217 @@ class SessionBase(BaseModel):
     qty: int
     fk_user: int
 
+# Definimos un modelo para las respuestas con instancias de Session. La
+# columna name es Integer en la tabla, por lo que puede volver como número
+class SessionOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id_session: int
+    name: Optional[Union[str, int]]
+    avg: Optional[int]
+    ao5: Optional[int]
+    ao12: Optional[int]
+    qty: Optional[int]
+    fk_user: Optional[int]
+    # Los solves de una sesión archivada se leen de sus archivos (ver archive.py)
+    archived: Optional[bool] = None
+
+# Columnas que se leen en los listados de sesiones
+SESSION_COLUMNS = (
+    SessionModel.id_session,
+    SessionModel.name,
+    SessionModel.avg,
+    SessionModel.ao5,
+    SessionModel.ao12,
+    SessionModel.qty,
+    SessionModel.fk_user,
+    SessionModel.archived,
+)
+
+# Cantidad máxima de solves que devuelve la vista completa de una sesión
+MAX_SESSION_FULL_SOLVES = 1000
+
+# Definimos un modelo para la vista completa de una sesión: los cubos y tipos
+# de solve se devuelven una sola vez, y cada solve los referencia por su id
+class SessionFullOut(BaseModel):
+    session: SessionOut
+    stats: dict
+    solves: List[SolveOut]
+    has_more: bool
+    cubes: List[CubeOut]
+    solve_types: List[SolveTypeOut]
+
+# Cubos y tipos de solve (sin repetir) de una lista de solves con esas relaciones cargadas
+def solves_catalog(db_solves) -> dict:
+    cubes = {db_solve.cube.id_cube: db_solve.cube for db_solve in db_solves if db_solve.cube is not None}
+    solve_types = {
+        db_solve.solve_type.id_solve_type: db_solve.solve_type
+        for db_solve in db_solves if db_solve.solve_type is not None
+    }
+    return {
+        "cubes": [cubes[key] for key in sorted(cubes)],
+        "solve_types": [solve_types[key] for key in sorted(solve_types)],
+    }
+
+# Opciones para cargar, junto con los solves, sus cubos (con el tipo de cubo)
+# y sus tipos de solve: una consulta por relación, sin importar cuántos solves haya
+SOLVE_RELATIONS = (
+    selectinload(Solve.cube).selectinload(Cube.cube_type),
+    selectinload(Solve.solve_type),
+)
+
 # Definimos un endpoint POST en la ruta "/session/"
-@router.post("/session/", tags=["Session"])
-def post_session(session: SessionBase, db: Session = Depends(get_db)):
+@router.post("/session/", response_model=SessionOut, tags=["Session"])
+async def post_session(session: SessionBase, db: AsyncSession = Depends(get_async_db)):
     # Convertimos el modelo de Pydantic a una instancia de la clase Session de SQLAlchemy
     db_session = SessionModel(**session.dict())
     # Añadimos la nueva instancia de Session a la sesión de la base de datos
     db.add(db_session)
+    # Registramos el cambio para la sincronización de los clientes (ver changes.py)
+    await db.run_sync(change_log.session_saved, db_session)
     # Confirmamos la transacción para guardar los cambios en la base de datos
-    db.commit()
+    await db.commit()
     # Refrescamos la instancia de Session para obtener los datos actualizados desde la base de datos
-    db.refresh(db_session)
+    await db.refresh(db_session)
     # Devolvemos la instancia de Session creada
     return db_session
 
 # Definimos un endpoint GET en la ruta "/session/{id}"
-@router.get("/session/{id}", tags=["Session"])
-def get_session(id: int, db: Session = Depends(get_db)):
+@router.get("/session/{id}", response_model=Optional[SessionOut], tags=["Session"])
+async def get_session(id: int, db: AsyncSession = Depends(get_async_db)):
     # Obtenemos la instancia de Session con el id proporcionado
-    db_session = db.query(SessionModel).filter(SessionModel.id_session == id).first()
+    db_session = (await db.execute(select(*SESSION_COLUMNS).where(SessionModel.id_session == id))).first()
     # Devolvemos la instancia de Session
     return db_session
 
 # Definimos un endpoint GET en la ruta "/session/"
-@router.get("/session/", tags=["Session"])
-def get_sessions(user_id: int, db: Session = Depends(get_db)):
+@router.get("/session/", response_model=List[SessionOut], tags=["Session"])
+async def get_sessions(user_id: int, db: AsyncSession = Depends(get_async_db)):
     # Obtenemos todas las instancias de Session del usuario correspondiente
-    db_sessions = db.query(SessionModel).filter(SessionModel.fk_user == user_id).all()
+    db_sessions = (await db.execute(select(*SESSION_COLUMNS).where(SessionModel.fk_user == user_id))).all()
     # Devolvemos la lista de instancias de Session
     return db_sessions
 
 # Definimos un endpoint DELETE en la ruta "/session/{id}"
-@router.delete("/session/{id}", tags=["Session"])
-def delete_session(id: int, db: Session = Depends(get_db)):
+@router.delete("/session/{id}", response_model=SessionOut, tags=["Session"])
+async def delete_session(id: int, db: AsyncSession = Depends(get_async_db)):
     # Obtenemos la instancia de Session con el id proporcionado
-    db_session = db.query(SessionModel).filter(SessionModel.id_session == id).first()
+    db_session = await db.scalar(select(SessionModel).where(SessionModel.id_session == id))
     # Eliminamos la instancia de Session de la sesión de la base de datos
-    db.delete(db_session)
+    await db.delete(db_session)
+    # Descartamos las estadísticas en memoria de la sesión
+    stats_engine.forget(id)
+    # Recalculamos las estadísticas y los rankings del usuario sin los solves de la sesión
+    await db.flush()
+    if db_session.fk_user is not None:
+        await db.run_sync(mark_users_stale, [db_session.fk_user])
+        await db.run_sync(leaderboards.users_changed, [db_session.fk_user])
+    # Registramos el cambio para la sincronización de los clientes
+    await db.run_sync(change_log.session_removed, db_session)
     # Confirmamos la transacción para guardar los cambios en la base de datos
-    db.commit()
+    await db.commit()
+    # Avisamos a los clientes conectados a la sesión
+    broadcaster.publish(("session", id), {"type": "session_deleted"})
     # Devolvemos la instancia de Session eliminada
     return db_session
 
 # Definimos un endpoint PUT en la ruta "/session/{id}"
-@router.put("/session/{id}", tags=["Session"])
-def put_session(id: int, session: SessionBase, db: Session = Depends(get_db)):
+@router.put("/session/{id}", response_model=SessionOut, tags=["Session"])
+async def put_session(id: int, session: SessionBase, db: AsyncSession = Depends(get_async_db)):
     # Obtenemos la instancia de Session con el id proporcionado
-    db_session = db.query(SessionModel).filter(SessionModel.id_session == id).first()
-    
-    # Obtenemos todas las solves de la sesión
-    solves = db.query(Solve).filter(Solve.fk_session == id).all()
-    
-    # Calculamos los tiempos en segundos
-    times = [solve.time.hour * 3600 + solve.time.minute * 60 + solve.time.second + solve.time.microsecond / 1e6 for solve in solves]
-    
-    # Calculamos avg, ao5 y ao12
-    if times:
-        db_session.avg = sum(times) / len(times)
-        db_session.ao5 = sum(sorted(times)[:5]) / 5 if len(times) >= 5 else None
-        db_session.ao12 = sum(sorted(times)[:12]) / 12 if len(times) >= 12 else None
-    else:
-        db_session.avg = None
-        db_session.ao5 = None
-        db_session.ao12 = None
+    db_session = await db.scalar(select(SessionModel).where(SessionModel.id_session == id))
     
-    # Actualizamos la cantidad de solves
-    db_session.qty = len(solves)
+    # Copiamos avg, ao5, ao12 y qty desde el motor de estadísticas, que las
+    # mantiene al día de forma incremental con cada escritura de un solve
+    await db.run_sync(stats_engine.store, db_session)
     
     # Actualizamos el nombre de la sesión
     db_session.name = session.name
     
+    # Registramos el cambio para la sincronización de los clientes (ver changes.py)
+    await db.run_sync(change_log.session_saved, db_session)
+    
     # Confirmamos la transacción para guardar los cambios en la base de datos
-    db.commit()
+    await db.commit()
     # Refrescamos la instancia de Session para obtener los datos actualizados desde la base de datos
-    db.refresh(db_session)
+    await db.refresh(db_session)
     # Devolvemos la instancia de Session actualizada
-    return db_session
\ No newline at end of file
+    return db_session
+
+# Definimos un endpoint GET en la ruta "/session/{id}/stats"
+@router.get("/session/{id}/stats", tags=["Session"])
+async def get_session_stats(id: int, db: AsyncSession = Depends(get_async_db)):
+    # Obtenemos la instancia de Session con el id proporcionado
+    db_session = await db.scalar(select(SessionModel).where(SessionModel.id_session == id))
+    if db_session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    # Devolvemos el resumen completo (tiempos en milisegundos): media, mejor
+    # single, ao5/ao12/ao50/ao100 actuales y mejores
+    return await db.run_sync(stats_engine.summary, db_session)
+
+# Definimos un endpoint GET en la ruta "/session/{id}/full"
+@router.get("/session/{id}/full", response_model=SessionFullOut, tags=["Session"])
+async def get_session_full(
+    id: int,
+    limit: int = Query(MAX_SESSION_FULL_SOLVES, ge=1, le=MAX_SESSION_FULL_SOLVES),
+    db: AsyncSession = Depends(get_async_db),
+):
+    # Obtenemos la instancia de Session con el id proporcionado
+    db_session = await db.scalar(select(SessionModel).where(SessionModel.id_session == id))
+    if db_session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    # Obtenemos los últimos `limit` solves de la sesión (uno más para saber si
+    # quedan otros) con sus cubos, tipos de cubo y tipos de solve
+    db_solves = (await db.scalars(
+        select(Solve)
+        .where(Solve.fk_session == id)
+        .order_by(Solve.date.desc(), Solve.id_solve.desc())
+        .limit(limit + 1)
+        .options(*SOLVE_RELATIONS)
+    )).all()
+    has_more = len(db_solves) > limit
+    # Devolvemos los solves en orden cronológico
+    db_solves = db_solves[:limit][::-1]
+    return {
+        "session": db_session,
+        "stats": await db.run_sync(stats_engine.summary, db_session),
+        "solves": db_solves,
+        "has_more": has_more,
+        **solves_catalog(db_solves),
+    }
+
+# Definimos un endpoint WebSocket en la ruta "/session/{id}/live"
+@router.websocket("/session/{id}/live")
+async def session_live(websocket: WebSocket, id: int):
+    # Enviamos primero las estadísticas actuales de la sesión; la sesión de la
+    # base de datos se cierra enseguida para no retener una conexión del pool
+    async with AsyncSessionLocal() as db:
+        db_session = await db.scalar(select(SessionModel).where(SessionModel.id_session == id))
+        stats = await db.run_sync(stats_engine.summary, db_session) if db_session is not None else None
+    if db_session is None:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    channel = ("session", id)
+    subscriber = broadcaster.subscribe(channel)
+
+    # Enviamos los eventos (solve_added, solve_updated, solve_removed, resync,
+    # session_deleted) a medida que se publican
+    async def send():
+        await websocket.send_json({"type": "stats", "stats": stats})
+        while True:
+            await websocket.send_text(await subscriber.get())
+
+    # Leemos (e ignoramos) los mensajes del cliente para detectar la desconexión
+    async def receive():
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    tasks = [asyncio.ensure_future(send()), asyncio.ensure_future(receive())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        broadcaster.unsubscribe(channel, subscriber)
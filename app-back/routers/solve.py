@@ -1,135 +1,475 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Query, Response, UploadFile
+from fastapi.responses import StreamingResponse
+from sqlalchemy import and_, func, insert, or_, select
 from sqlalchemy.orm import Session
-from pydantic import BaseModel
-from database import get_db, Solve
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+from database import get_db, get_async_db, SessionLocal, Penalty, Solve, Cube, CubeType
+from stats import stats_engine
+from user_stats import user_stats
+from leaderboard import leaderboards
+from broadcast import broadcaster
+from changes import change_log
+from importers import ImportFormatError, parse_import
+from responses import dumps
+from scramble.state import InvalidScramble, cube_size, simulator
+from typing import List, Optional
+
+from datetime import datetime
 
 router = APIRouter()
 
-from datetime import datetime, time
+# Columnas que se leen en los listados: se consultan como filas (no como
+# objetos del ORM), lo que evita crear y rastrear una instancia por solve
+SOLVE_COLUMNS = (
+    Solve.id_solve,
+    Solve.date,
+    Solve.time_ms,
+    Solve.penalty,
+    Solve.scramble,
+    Solve.fk_cube,
+    Solve.fk_solve_type,
+    Solve.fk_session,
+)
+
+# Definimos un modelo para las respuestas con instancias de Solve
+class SolveOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id_solve: int
+    date: Optional[datetime]
+    time_ms: Optional[int]
+    penalty: Optional[Penalty]
+    scramble: Optional[str]
+    fk_cube: Optional[int]
+    fk_solve_type: Optional[int]
+    fk_session: Optional[int]
+
+# Paginación de los listados de solves
+
+# Tamaño de página por defecto y máximo para los listados en JSON
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+# Cantidad de filas que se leen de la base de datos por bloque al transmitir
+STREAM_BATCH_SIZE = 500
+
+# Función para convertir un Solve en un diccionario serializable
+def solve_to_dict(db_solve) -> dict:
+    return {
+        "id_solve": db_solve.id_solve,
+        "date": db_solve.date.isoformat() if db_solve.date else None,
+        "time_ms": db_solve.time_ms,
+        "penalty": db_solve.penalty.value if db_solve.penalty else None,
+        "scramble": db_solve.scramble,
+        "fk_cube": db_solve.fk_cube,
+        "fk_solve_type": db_solve.fk_solve_type,
+        "fk_session": db_solve.fk_session,
+    }
+
+# Función para crear el cursor que apunta al solve indicado
+def encode_cursor(db_solve) -> str:
+    return f"{db_solve.date.isoformat()},{db_solve.id_solve}"
+
+# Función para leer un cursor y obtener la condición de los solves siguientes,
+# ordenados por (date, id_solve)
+def cursor_filter(cursor: str):
+    try:
+        date, id_solve = cursor.rsplit(",", 1)
+        date, id_solve = datetime.fromisoformat(date), int(id_solve)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return or_(Solve.date > date, and_(Solve.date == date, Solve.id_solve > id_solve))
+
+# Generador que recorre los solves a medida que se leen de la base de datos,
+# con un cursor del lado del servidor. Usa su propia sesión porque se ejecuta
+# mientras se transmite la respuesta, después de que la dependencia de la sesión haya terminado
+def iter_solves(filters):
+    db = SessionLocal()
+    try:
+        query = (
+            db.query(*SOLVE_COLUMNS)
+            .filter(*filters)
+            .order_by(Solve.date, Solve.id_solve)
+            .execution_options(stream_results=True)
+            .yield_per(STREAM_BATCH_SIZE)
+        )
+        for db_solve in query:
+            yield db_solve
+    finally:
+        db.close()
+
+# Generador que transmite los solves en NDJSON
+def stream_solves(filters):
+    for db_solve in iter_solves(filters):
+        yield dumps(solve_to_dict(db_solve)) + b"\n"
+
+# Función para listar solves paginados por cursor. En JSON devuelve una página
+# y el cursor de la siguiente en la cabecera "X-Next-Cursor"; en NDJSON
+# transmite todos los solves desde el cursor, sin cargarlos a la vez en memoria
+async def list_solves(db: AsyncSession, response: Response, filters: list, cursor: Optional[str], limit: Optional[int], format: str):
+    if cursor:
+        filters = filters + [cursor_filter(cursor)]
+    if format == "ndjson":
+        return StreamingResponse(stream_solves(filters), media_type="application/x-ndjson")
+    limit = min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+    db_solves = (await db.execute(
+        select(*SOLVE_COLUMNS)
+        .where(*filters)
+        .order_by(Solve.date, Solve.id_solve)
+        .limit(limit)
+    )).all()
+    if len(db_solves) == limit:
+        response.headers["X-Next-Cursor"] = encode_cursor(db_solves[-1])
+    return db_solves
+
+# Función para avisar a los clientes conectados a una sesión (ver
+# /session/{id}/live) de un cambio en sus solves, con las estadísticas nuevas
+def publish_solve(event_type: str, db_solve, id_session):
+    channel = ("session", id_session)
+    if broadcaster.has_subscribers(channel):
+        broadcaster.publish(channel, {
+            "type": event_type,
+            "solve": solve_to_dict(db_solve),
+            "stats": stats_engine.cached_summary(id_session),
+        })
 
 ## Operaciones CRUD para la tabla Solve
 
+# Largo máximo de un scramble (el de la columna solve.scramble)
+SCRAMBLE_MAX_LENGTH = Solve.__table__.c.scramble.type.length
+
 # Definimos un modelo para la creación de instancias de Solve
+# (el tiempo medido va en milisegundos, sin sumar la penalización)
 class SolveBase(BaseModel):
     date: datetime
-    time: time
-    scramble: str
+    time_ms: int = Field(ge=0)
+    penalty: Penalty = Penalty.OK
+    scramble: str = Field(max_length=SCRAMBLE_MAX_LENGTH)
     fk_cube: int
     fk_solve_type: int
-    fk_solve_session: int
+    fk_session: int
+
+# Validación de scrambles
+
+# Consulta del tipo de cubo de cada uno de los cubos indicados
+def cube_types_query(fk_cubes):
+    return (
+        select(Cube.id_cube, CubeType.cube_type)
+        .join(CubeType, Cube.fk_cube_type == CubeType.id_cube_type)
+        .where(Cube.id_cube.in_(list(fk_cubes)))
+    )
+
+# Función para rechazar un scramble con notación inválida para su cubo. Los
+# scrambles de cubos que no son NxN (o sin tipo conocido) no se comprueban
+async def validate_scramble(db: AsyncSession, solve: SolveBase):
+    for _, cube_type in await db.execute(cube_types_query([solve.fk_cube])):
+        size = cube_size(cube_type)
+        if size and solve.scramble:
+            try:
+                simulator(size).parse(solve.scramble)
+            except InvalidScramble as error:
+                raise HTTPException(status_code=422, detail=str(error))
+
+# Función para validar en lote los scrambles de muchos solves. Simula todos
+# los scrambles de cada tamaño de cubo de una vez y devuelve los grupos de
+# solves (por su posición en la lista) que llevan al mismo estado del cubo
+def analyze_scrambles(db: Session, solves: List[SolveBase]) -> list:
+    sizes = {
+        id_cube: cube_size(cube_type)
+        for id_cube, cube_type in db.execute(cube_types_query({solve.fk_cube for solve in solves}))
+    }
+    groups = {}
+    for position, solve in enumerate(solves):
+        size = sizes.get(solve.fk_cube)
+        if size and solve.scramble:
+            groups.setdefault(size, []).append(position)
+    errors, duplicates = {}, []
+    for size, positions in groups.items():
+        _, group_errors, group_duplicates = simulator(size).analyze([solves[p].scramble for p in positions])
+        errors.update({positions[i]: error for i, error in group_errors.items()})
+        duplicates.extend([positions[i] for i in group] for group in group_duplicates)
+    if errors:
+        raise HTTPException(status_code=422, detail=[
+            {"index": position, "msg": error} for position, error in sorted(errors.items())
+        ])
+    return duplicates
 
 # Definimos un endpoint POST en la ruta "/solve/"
-@router.post("/solve/", tags=["Solve"])
-def post_solve(solve: SolveBase, db: Session = Depends(get_db)):
+@router.post("/solve/", response_model=SolveOut, tags=["Solve"])
+async def post_solve(solve: SolveBase, db: AsyncSession = Depends(get_async_db)):
+    # Comprobamos que el scramble sea válido para el cubo
+    await validate_scramble(db, solve)
     # Convertimos el objeto SolveCreate en un diccionario y lo desempaquetamos para crear una instancia de Solve
     db_solve = Solve(**solve.dict())
     # Añadimos la nueva instancia de Solve a la sesión de la base de datos
     db.add(db_solve)
+    # Obtenemos el id del solve y actualizamos las estadísticas de su sesión y de su usuario, y los rankings
+    await db.flush()
+    await db.run_sync(stats_engine.solve_added, db_solve)
+    key = await db.run_sync(user_stats.solve_added, db_solve)
+    await db.run_sync(leaderboards.solve_added, db_solve, key)
+    # Registramos el cambio para la sincronización de los clientes (ver changes.py)
+    await db.run_sync(change_log.solve_saved, db_solve)
     # Confirmamos la transacción para guardar los cambios en la base de datos
-    db.commit()
+    await db.commit()
     # Refrescamos la instancia de Solve para obtener los datos actualizados desde la base de datos
-    db.refresh(db_solve)
+    await db.refresh(db_solve)
+    # Avisamos a los clientes conectados a la sesión
+    publish_solve("solve_added", db_solve, db_solve.fk_session)
     # Devolvemos la instancia de Solve creada
     return db_solve
 
 # Definimos un endpoint GET en la ruta "/solve/{id}"
-@router.get("/solve/{id}", tags=["Solve"])
-def get_solve(id: int, db: Session = Depends(get_db)):
+@router.get("/solve/{id}", response_model=Optional[SolveOut], tags=["Solve"])
+async def get_solve(id: int, db: AsyncSession = Depends(get_async_db)):
     # Obtenemos la instancia de Solve con el id proporcionado
-    db_solve = db.query(Solve).filter(Solve.id_solve == id).first()
+    db_solve = (await db.execute(select(*SOLVE_COLUMNS).where(Solve.id_solve == id))).first()
     # Devolvemos la instancia de Solve
     return db_solve
 
 # Definimos un endpoint GET en la ruta "/solve/"
-@router.get("/solve/", tags=["Solve"])
-def get_solves(db: Session = Depends(get_db)):
-    # Obtenemos todas las instancias de Solve
-    db_solves = db.query(Solve).all()
-    # Devolvemos la lista de instancias de Solve
-    return db_solves
+@router.get("/solve/", response_model=List[SolveOut], tags=["Solve"])
+async def get_solves(
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    # Devolvemos las instancias de Solve paginadas por (date, id_solve)
+    return await list_solves(db, response, [], cursor, limit, format)
 
 # Definimos un endpoint DELETE en la ruta "/solve/{id}"
-@router.delete("/solve/{id}", tags=["Solve"])
-def delete_solve(id: int, db: Session = Depends(get_db)):
+@router.delete("/solve/{id}", response_model=SolveOut, tags=["Solve"])
+async def delete_solve(id: int, db: AsyncSession = Depends(get_async_db)):
     # Obtenemos la instancia de Solve con el id proporcionado
-    db_solve = db.query(Solve).filter(Solve.id_solve == id).first()
+    db_solve = await db.scalar(select(Solve).where(Solve.id_solve == id))
+    # Quitamos el solve de las estadísticas de su sesión y de su usuario
+    await db.run_sync(stats_engine.solve_removed, db_solve)
+    key = await db.run_sync(user_stats.solve_removed, db_solve)
     # Eliminamos la instancia de Solve de la sesión de la base de datos
-    db.delete(db_solve)
+    await db.delete(db_solve)
+    # Quitamos el solve de los rankings del usuario
+    await db.run_sync(leaderboards.solve_removed, db_solve, key)
+    # Registramos el cambio para la sincronización de los clientes (ver changes.py)
+    await db.run_sync(change_log.solve_removed, db_solve)
     # Confirmamos la transacción para guardar los cambios en la base de datos
-    db.commit()
+    await db.commit()
+    # Avisamos a los clientes conectados a la sesión
+    publish_solve("solve_removed", db_solve, db_solve.fk_session)
     # Devolvemos la instancia de Solve eliminada
     return db_solve
 
 # Definimos un endpoint PUT en la ruta "/solve/{id}"
-@router.put("/solve/{id}", tags=["Solve"])
-def put_solve(id: int, solve: SolveBase, db: Session = Depends(get_db)):
+@router.put("/solve/{id}", response_model=SolveOut, tags=["Solve"])
+async def put_solve(id: int, solve: SolveBase, db: AsyncSession = Depends(get_async_db)):
+    # Comprobamos que el scramble sea válido para el cubo
+    await validate_scramble(db, solve)
     # Obtenemos la instancia de Solve con el id proporcionado
-    db_solve = db.query(Solve).filter(Solve.id_solve == id).first()
+    db_solve = await db.scalar(select(Solve).where(Solve.id_solve == id))
+    old_session = db_solve.fk_session
+    old_key = await db.run_sync(user_stats.solve_key, db_solve)
+    old_date = db_solve.date
     # Actualizamos los campos de la instancia de Solve con los valores proporcionados
     db_solve.date = solve.date
-    db_solve.time = solve.time
+    db_solve.time_ms = solve.time_ms
+    db_solve.penalty = solve.penalty
     db_solve.scramble = solve.scramble
     db_solve.fk_cube = solve.fk_cube
     db_solve.fk_solve_type = solve.fk_solve_type
     db_solve.fk_session = solve.fk_session
+    # Actualizamos las estadísticas de la sesión (o de ambas, si cambió de sesión), del usuario y los rankings
+    await db.run_sync(stats_engine.solve_updated, db_solve, old_session)
+    key = await db.run_sync(user_stats.solve_updated, db_solve, old_key)
+    await db.run_sync(leaderboards.solve_updated, db_solve, old_key, old_date, key)
+    # Registramos el cambio para la sincronización de los clientes (ver changes.py)
+    await db.run_sync(change_log.solve_saved, db_solve, old_session)
     # Confirmamos la transacción para guardar los cambios en la base de datos
-    db.commit()
+    await db.commit()
     # Refrescamos la instancia de Solve para obtener los datos actualizados desde la base de datos
-    db.refresh(db_solve)
+    await db.refresh(db_solve)
+    # Avisamos a los clientes conectados a la sesión (o a ambas, si cambió de sesión)
+    if old_session != db_solve.fk_session:
+        publish_solve("solve_removed", db_solve, old_session)
+        publish_solve("solve_added", db_solve, db_solve.fk_session)
+    else:
+        publish_solve("solve_updated", db_solve, db_solve.fk_session)
     # Devolvemos la instancia de Solve actualizada
     return db_solve
 
 # Session Solve
 
 # Definimos un endpoint POST en la ruta "/session/{id}/solve/"
-@router.post("/session/{id}/solve/", tags=["Solve"])
-def post_session_solve(id: int, solve: SolveBase, db: Session = Depends(get_db)):
+@router.post("/session/{id}/solve/", response_model=SolveOut, tags=["Solve"])
+async def post_session_solve(id: int, solve: SolveBase, db: AsyncSession = Depends(get_async_db)):
+    # Comprobamos que el scramble sea válido para el cubo
+    await validate_scramble(db, solve)
     # Convertimos el objeto SolveCreate en un diccionario y lo desempaquetamos para crear una instancia de Solve
     db_solve = Solve(**solve.dict())
     db_solve.fk_session = id
     # Añadimos la nueva instancia de Solve a la sesión de la base de datos
     db.add(db_solve)
+    # Obtenemos el id del solve y actualizamos las estadísticas de su sesión y de su usuario, y los rankings
+    await db.flush()
+    await db.run_sync(stats_engine.solve_added, db_solve)
+    key = await db.run_sync(user_stats.solve_added, db_solve)
+    await db.run_sync(leaderboards.solve_added, db_solve, key)
+    # Registramos el cambio para la sincronización de los clientes (ver changes.py)
+    await db.run_sync(change_log.solve_saved, db_solve)
     # Confirmamos la transacción para guardar los cambios en la base de datos
-    db.commit()
+    await db.commit()
     # Refrescamos la instancia de Solve para obtener los datos actualizados desde la base de datos
-    db.refresh(db_solve)
+    await db.refresh(db_solve)
+    # Avisamos a los clientes conectados a la sesión
+    publish_solve("solve_added", db_solve, db_solve.fk_session)
     # Devolvemos la instancia de Solve creada
     return db_solve
 
 # Definimos un endpoint GET en la ruta "/session/{id}/solve/"
-@router.get("/session/{id}/solve/", tags=["Solve"])
-def get_session_solves(id: int, db: Session = Depends(get_db)):
-    # Obtenemos todas las instancias de Solve de la sesión correspondiente
-    db_solves = db.query(Solve).filter(Solve.fk_session == id).all()
-    # Devolvemos la lista de instancias de Solve
-    return db_solves
+@router.get("/session/{id}/solve/", response_model=List[SolveOut], tags=["Solve"])
+async def get_session_solves(
+    id: int,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    format: str = Query("json", pattern="^(json|ndjson)$"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    # Devolvemos las instancias de Solve de la sesión, paginadas por (date, id_solve)
+    return await list_solves(db, response, [Solve.fk_session == id], cursor, limit, format)
 
 # Definimos un endpoint DELETE en la ruta "/session/{id}/solve/{id_solve}"
-@router.delete("/session/{id}/solve/{id_solve}", tags=["Solve"])
-def delete_session_solve(id: int, id_solve: int, db: Session = Depends(get_db)):
+@router.delete("/session/{id}/solve/{id_solve}", response_model=SolveOut, tags=["Solve"])
+async def delete_session_solve(id: int, id_solve: int, db: AsyncSession = Depends(get_async_db)):
     # Obtenemos la instancia de Solve con el id proporcionado
-    db_solve = db.query(Solve).filter(Solve.id_solve == id_solve).first()
+    db_solve = await db.scalar(select(Solve).where(Solve.id_solve == id_solve))
+    # Quitamos el solve de las estadísticas de su sesión y de su usuario
+    await db.run_sync(stats_engine.solve_removed, db_solve)
+    key = await db.run_sync(user_stats.solve_removed, db_solve)
     # Eliminamos la instancia de Solve de la sesión de la base de datos
-    db.delete(db_solve)
+    await db.delete(db_solve)
+    # Quitamos el solve de los rankings del usuario
+    await db.run_sync(leaderboards.solve_removed, db_solve, key)
+    # Registramos el cambio para la sincronización de los clientes (ver changes.py)
+    await db.run_sync(change_log.solve_removed, db_solve)
     # Confirmamos la transacción para guardar los cambios en la base de datos
-    db.commit()
+    await db.commit()
+    # Avisamos a los clientes conectados a la sesión
+    publish_solve("solve_removed", db_solve, db_solve.fk_session)
     # Devolvemos la instancia de Solve eliminada
     return db_solve
 
 # Definimos un endpoint PUT en la ruta "/session/{id}/solve/{id_solve}"
-@router.put("/session/{id}/solve/{id_solve}", tags=["Solve"])
-def put_session_solve(id: int, id_solve: int, solve: SolveBase, db: Session = Depends(get_db)):
+@router.put("/session/{id}/solve/{id_solve}", response_model=SolveOut, tags=["Solve"])
+async def put_session_solve(id: int, id_solve: int, solve: SolveBase, db: AsyncSession = Depends(get_async_db)):
+    # Comprobamos que el scramble sea válido para el cubo
+    await validate_scramble(db, solve)
     # Obtenemos la instancia de Solve con el id proporcionado
-    db_solve = db.query(Solve).filter(Solve.id_solve == id_solve).first()
+    db_solve = await db.scalar(select(Solve).where(Solve.id_solve == id_solve))
+    old_key = await db.run_sync(user_stats.solve_key, db_solve)
+    old_date = db_solve.date
     # Actualizamos los campos de la instancia de Solve con los valores proporcionados
     db_solve.date = solve.date
-    db_solve.time = solve.time
+    db_solve.time_ms = solve.time_ms
+    db_solve.penalty = solve.penalty
     db_solve.scramble = solve.scramble
     db_solve.fk_cube = solve.fk_cube
     db_solve.fk_solve_type = solve.fk_solve_type
+    # Actualizamos las estadísticas de la sesión, del usuario y los rankings
+    await db.run_sync(stats_engine.solve_updated, db_solve, db_solve.fk_session)
+    key = await db.run_sync(user_stats.solve_updated, db_solve, old_key)
+    await db.run_sync(leaderboards.solve_updated, db_solve, old_key, old_date, key)
+    # Registramos el cambio para la sincronización de los clientes (ver changes.py)
+    await db.run_sync(change_log.solve_saved, db_solve)
     # Confirmamos la transacción para guardar los cambios en la base de datos
-    db.commit()
+    await db.commit()
     # Refrescamos la instancia de Solve para obtener los datos actualizados desde la base de datos
-    db.refresh(db_solve)
+    await db.refresh(db_solve)
+    # Avisamos a los clientes conectados a la sesión
+    publish_solve("solve_updated", db_solve, db_solve.fk_session)
     # Devolvemos la instancia de Solve actualizada
-    return db_solve
\ No newline at end of file
+    return db_solve
+
+# Carga masiva de solves
+
+# Cantidad máxima de solves por petición y tamaño de los bloques de inserción
+MAX_BULK_SOLVES = 50000
+BULK_CHUNK_SIZE = 1000
+
+# Función para insertar muchos solves en una sola transacción, en bloques
+# (executemany), recalculando una única vez las estadísticas de cada sesión.
+# Devuelve la cantidad insertada y los grupos de solves con el mismo estado.
+# Estos endpoints son síncronos a propósito: la validación y la lectura de
+# archivos usan CPU y se ejecutan en el threadpool para no bloquear el event loop
+def bulk_insert_solves(db: Session, solves: List[SolveBase]) -> dict:
+    if len(solves) > MAX_BULK_SOLVES:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BULK_SOLVES} solves per request")
+    duplicates = analyze_scrambles(db, solves)
+    rows = [solve.dict() for solve in solves]
+    # Los solves insertados son los de id mayor que el último actual
+    after_id = db.scalar(select(func.max(Solve.id_solve)))
+    for start in range(0, len(rows), BULK_CHUNK_SIZE):
+        db.execute(insert(Solve), rows[start:start + BULK_CHUNK_SIZE])
+    id_sessions = {row["fk_session"] for row in rows}
+    stats_engine.sessions_changed(db, id_sessions)
+    leaderboards.users_changed(db, user_stats.sessions_changed(db, id_sessions))
+    change_log.solves_inserted(db, id_sessions, after_id)
+    db.commit()
+    # Pedimos a los clientes conectados a las sesiones que vuelvan a cargar los solves
+    for id_session in id_sessions:
+        broadcaster.publish_threadsafe(("session", id_session), {
+            "type": "resync",
+            "stats": stats_engine.cached_summary(id_session),
+        })
+    return {"inserted": len(rows), "duplicates": duplicates}
+
+# Definimos un endpoint POST en la ruta "/solve/bulk"
+@router.post("/solve/bulk", tags=["Solve"])
+def post_solves_bulk(solves: List[SolveBase], db: Session = Depends(get_db)):
+    # Insertamos todos los solves y devolvemos la cantidad insertada
+    return bulk_insert_solves(db, solves)
+
+# Definimos un endpoint POST en la ruta "/session/{id}/solve/bulk"
+@router.post("/session/{id}/solve/bulk", tags=["Solve"])
+def post_session_solves_bulk(id: int, solves: List[SolveBase], db: Session = Depends(get_db)):
+    # Asignamos todos los solves a la sesión indicada en la ruta
+    for solve in solves:
+        solve.fk_session = id
+    return bulk_insert_solves(db, solves)
+
+# Definimos un endpoint POST en la ruta "/session/{id}/solve/import"
+@router.post("/session/{id}/solve/import", tags=["Solve"])
+def import_session_solves(
+    id: int,
+    file: UploadFile = File(...),
+    fk_cube: int = Form(...),
+    fk_solve_type: int = Form(...),
+    db: Session = Depends(get_db),
+):
+    # Leemos el archivo exportado (respaldo JSON o CSV de csTimer, o CSV genérico)
+    solves = []
+    skipped = 0
+    try:
+        for number, (date, ms, penalty, scramble) in enumerate(parse_import(file.filename, file.file.read()), 1):
+            # Los DNF sin tiempo registrado se omiten
+            if ms is None:
+                skipped += 1
+                continue
+            # SolveBase rechaza, entre otros, los scrambles más largos que la columna
+            try:
+                solves.append(SolveBase(
+                    date=date,
+                    time_ms=ms,
+                    penalty=penalty,
+                    scramble=scramble,
+                    fk_cube=fk_cube,
+                    fk_solve_type=fk_solve_type,
+                    fk_session=id,
+                ))
+            except ValidationError as error:
+                message = error.errors()[0]
+                field = ".".join(str(part) for part in message["loc"])
+                raise ImportFormatError(f"Solve {number}: invalid {field} ({message['msg']})")
+    except ImportFormatError as error:
+        raise HTTPException(status_code=400, detail=str(error))
+    return {**bulk_insert_solves(db, solves), "skipped": skipped}
\ No newline at end of file
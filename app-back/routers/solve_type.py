@@ -1,7 +1,10 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from pydantic import BaseModel
-from database import get_db, SolveType
+from fastapi import APIRouter, Depends, Request
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from pydantic import BaseModel, ConfigDict
+from database import get_async_db, SolveType
+from cache import cached_json, invalidate_catalog
+from typing import Optional
 
 router = APIRouter()
 
@@ -11,56 +14,73 @@ router = APIRouter()
 class SolveTypeBase(BaseModel):
     solve_type: str
 
+# Definimos un modelo para las respuestas con instancias de SolveType
+class SolveTypeOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id_solve_type: int
+    solve_type: Optional[str]
+
 # Definimos un endpoint POST en la ruta "/solve_type/"
 @router.post("/solve_type/", tags=["SolveType"])
-def post_solve_type(solve_type: SolveTypeBase, db: Session = Depends(get_db)):
+async def post_solve_type(solve_type: SolveTypeBase, db: AsyncSession = Depends(get_async_db)):
+    # Convertimos el modelo de Pydantic a una instancia de la clase SolveType de SQLAlchemy
+    db_solve_type = SolveType(**solve_type.dict())
     # Añadimos la nueva instancia de SolveType a la sesión de la base de datos
-    db.add(solve_type)
+    db.add(db_solve_type)
+    # Invalidamos las respuestas del catálogo guardadas en caché (en todos los workers)
+    await invalidate_catalog(db, "solve_type")
     # Confirmamos la transacción para guardar los cambios en la base de datos
-    db.commit()
+    await db.commit()
     # Refrescamos la instancia de SolveType para obtener los datos actualizados desde la base de datos
-    db.refresh(solve_type)
+    await db.refresh(db_solve_type)
     # Devolvemos la instancia de SolveType creada
-    return solve_type
+    return db_solve_type
 
 # Definimos un endpoint GET en la ruta "/solve_type/{id}"
 @router.get("/solve_type/{id}", tags=["SolveType"])
-def get_solve_type(id: int, db: Session = Depends(get_db)):
+async def get_solve_type(id: int, request: Request, db: AsyncSession = Depends(get_async_db)):
     # Obtenemos la instancia de SolveType con el id proporcionado
-    db_solve_type = db.query(SolveType).filter(SolveType.id_solve_type == id).first()
-    # Devolvemos la instancia de SolveType
-    return db_solve_type
+    async def load():
+        return await db.scalar(select(SolveType).where(SolveType.id_solve_type == id))
+    # Devolvemos la instancia de SolveType (desde el caché, con ETag)
+    return await cached_json(request, db, ("solve_type", id), load)
 
 # Definimos un endpoint GET en la ruta "/solve_type/"
 @router.get("/solve_type/", tags=["SolveType"])
-def get_solve_types(db: Session = Depends(get_db)):
+async def get_solve_types(request: Request, db: AsyncSession = Depends(get_async_db)):
     # Obtenemos todas las instancias de SolveType
-    db_solve_types = db.query(SolveType).all()
-    # Devolvemos la lista de instancias de SolveType
-    return db_solve_types
+    async def load():
+        return (await db.scalars(select(SolveType))).all()
+    # Devolvemos la lista de instancias de SolveType (desde el caché, con ETag)
+    return await cached_json(request, db, ("solve_type", "all"), load)
 
 # Definimos un endpoint DELETE en la ruta "/solve_type/{id}"
 @router.delete("/solve_type/{id}", tags=["SolveType"])
-def delete_solve_type(id: int, db: Session = Depends(get_db)):
+async def delete_solve_type(id: int, db: AsyncSession = Depends(get_async_db)):
     # Obtenemos la instancia de SolveType con el id proporcionado
-    db_solve_type = db.query(SolveType).filter(SolveType.id_solve_type == id).first()
+    db_solve_type = await db.scalar(select(SolveType).where(SolveType.id_solve_type == id))
     # Eliminamos la instancia de SolveType de la sesión de la base de datos
-    db.delete(db_solve_type)
+    await db.delete(db_solve_type)
+    # Invalidamos las respuestas del catálogo guardadas en caché (en todos los workers)
+    await invalidate_catalog(db, "solve_type")
     # Confirmamos la transacción para guardar los cambios en la base de datos
-    db.commit()
+    await db.commit()
     # Devolvemos la instancia de SolveType eliminada
     return db_solve_type
 
 # Definimos un endpoint PUT en la ruta "/solve_type/{id}"
 @router.put("/solve_type/{id}", tags=["SolveType"])
-def put_solve_type(id: int, solve_type: SolveTypeBase, db: Session = Depends(get_db)):
+async def put_solve_type(id: int, solve_type: SolveTypeBase, db: AsyncSession = Depends(get_async_db)):
     # Obtenemos la instancia de SolveType con el id proporcionado
-    db_solve_type = db.query(SolveType).filter(SolveType.id_solve_type == id).first()
+    db_solve_type = await db.scalar(select(SolveType).where(SolveType.id_solve_type == id))
     # Actualizamos los campos de la instancia de SolveType con los valores proporcionados
     db_solve_type.solve_type = solve_type.solve_type
+    # Invalidamos las respuestas del catálogo guardadas en caché (en todos los workers)
+    await invalidate_catalog(db, "solve_type")
     # Confirmamos la transacción para guardar los cambios en la base de datos
-    db.commit()
+    await db.commit()
     # Refrescamos la instancia de SolveType para obtener los datos actualizados desde la base de datos
-    db.refresh(db_solve_type)
+    await db.refresh(db_solve_type)
     # Devolvemos la instancia de SolveType actualizada
     return db_solve_type
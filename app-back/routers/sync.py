@@ -0,0 +1,66 @@
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db, Cube, Session as SessionModel, Solve
+from changes import change_log, versions, CUBE, DELETE, SESSION, SOLVE, UPSERT
+from routers.solve import SOLVE_COLUMNS, solve_to_dict
+from routers.session import SESSION_COLUMNS
+
+router = APIRouter()
+
+# Sincronización incremental para clientes con varios dispositivos
+
+# Cantidad de cambios por respuesta, por defecto y como máximo
+DEFAULT_SYNC_LIMIT = 500
+MAX_SYNC_LIMIT = 5000
+
+# Columnas que se devuelven de los cubos
+CUBE_COLUMNS = (Cube.id_cube, Cube.brand, Cube.model, Cube.fk_cube_type, Cube.magnetic)
+
+# Consulta de los datos actuales de cada entidad, por id
+ENTITY_QUERIES = {
+    SOLVE: (lambda ids: select(*SOLVE_COLUMNS).where(Solve.id_solve.in_(ids)), "id_solve"),
+    SESSION: (lambda ids: select(*SESSION_COLUMNS).where(SessionModel.id_session.in_(ids)), "id_session"),
+    CUBE: (lambda ids: select(*CUBE_COLUMNS).where(Cube.id_cube.in_(ids)), "id_cube"),
+}
+
+# Función para convertir una fila en un diccionario serializable
+def entity_to_dict(entity: str, row) -> dict:
+    return solve_to_dict(row) if entity == SOLVE else dict(row._mapping)
+
+# Definimos un endpoint GET en la ruta "/sync"
+@router.get("/sync", tags=["Sync"])
+async def get_sync(
+    user_id: int,
+    since: int = Query(0, ge=0),
+    limit: int = Query(DEFAULT_SYNC_LIMIT, ge=1, le=MAX_SYNC_LIMIT),
+    db: AsyncSession = Depends(get_async_db),
+):
+    # Si los cambios posteriores a `since` ya se purgaron, el cliente debe
+    # volver a descargar las listas completas y seguir desde `version`
+    current, pruned = await db.run_sync(versions)
+    if since < pruned:
+        return {"version": current, "reset": True, "has_more": False, "changes": []}
+    # Obtenemos el último cambio de cada solve, sesión o cubo desde `since`
+    rows, has_more = await db.run_sync(change_log.since, user_id, since, limit)
+    # Leemos los datos actuales de las entidades creadas o modificadas (una
+    # consulta por tipo de entidad); las que ya no existen se informan como eliminadas
+    data = {}
+    for entity, (query, key) in ENTITY_QUERIES.items():
+        ids = [row.entity_id for row in rows if row.entity == entity and row.op == UPSERT]
+        if ids:
+            for found in await db.execute(query(ids)):
+                data[(entity, getattr(found, key))] = entity_to_dict(entity, found)
+    changes = []
+    for row in rows:
+        values = data.get((row.entity, row.entity_id)) if row.op == UPSERT else None
+        changes.append({
+            "entity": row.entity,
+            "id": row.entity_id,
+            "op": UPSERT if values is not None else DELETE,
+            "version": row.version,
+            "data": values,
+        })
+    # El cliente guarda `version` y la envía como `since` en la próxima petición
+    version = max(row.version for row in rows) if has_more else max(current, since)
+    return {"version": version, "reset": False, "has_more": has_more, "changes": changes}
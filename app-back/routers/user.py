@@ -1,9 +1,21 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from pydantic import BaseModel
-from database import get_db, User
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, selectinload
+from pydantic import BaseModel, ConfigDict
+from database import get_async_db, get_db, User, Session as SessionModel, Solve, CubeType, SolveType, UserStats
+from routers.session import SessionOut, SOLVE_RELATIONS, solves_catalog
+from routers.solve import SolveOut
+from routers.cube import CubeOut
+from routers.solve_type import SolveTypeOut
+from cache import TTLCache
+from user_stats import user_stats
 from passlib.context import CryptContext
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+from typing import List, Optional
 import jwt
+import os
 from datetime import datetime, timedelta
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
 
@@ -28,6 +40,17 @@ def hash_password(password: str) -> str:
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
+# bcrypt tarda ~100 ms por llamada, así que se ejecuta en un executor propio y
+# acotado (AUTH_WORKERS hilos; bcrypt libera el GIL). Una ráfaga de logins
+# hace cola aquí sin ocupar el threadpool ni el event loop del resto de endpoints
+auth_executor = ThreadPoolExecutor(max_workers=int(os.getenv("AUTH_WORKERS", "2")), thread_name_prefix="bcrypt")
+
+async def hash_password_async(password: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(auth_executor, hash_password, password)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await asyncio.get_running_loop().run_in_executor(auth_executor, verify_password, plain_password, hashed_password)
+
 # Función para crear un token JWT
 def create_access_token(data: dict, expires_delta: timedelta = timedelta(hours=1)):
     to_encode = data.copy()
@@ -35,17 +58,46 @@ def create_access_token(data: dict, expires_delta: timedelta = timedelta(hours=1
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
+# Definimos un modelo para las respuestas con instancias de User: nunca
+# incluye el hash de la contraseña
+class UserOut(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id_user: int
+    name: str
+    username: str
+    email: str
+
+# Columnas que se leen al consultar usuarios (todas menos password)
+USER_COLUMNS = (User.id_user, User.name, User.username, User.email)
+
+# Datos del usuario autenticado
+class CurrentUser(UserOut):
+    pass
+
+# Caché de usuarios por username (el "sub" del token). put_user y delete_user
+# lo invalidan; en despliegues con varios workers el TTL acota cuánto puede
+# durar un dato desactualizado en los demás procesos
+user_cache = TTLCache(
+    maxsize=int(os.getenv("USER_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("USER_CACHE_TTL", "60")),
+)
+
 # Función para obtener el usuario actual desde el token
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username = payload.get("sub")
         if username is None:
             raise HTTPException(status_code=401, detail="Invalid token")
-        db_user = db.query(User).filter(User.username == username).first()
-        if db_user is None:
-            raise HTTPException(status_code=401, detail="User not found")
-        return db_user
+        current_user = user_cache.get(username)
+        if current_user is None:
+            db_user = (await db.execute(select(*USER_COLUMNS).where(User.username == username))).first()
+            if db_user is None:
+                raise HTTPException(status_code=401, detail="User not found")
+            current_user = CurrentUser.model_validate(db_user)
+            user_cache.set(username, current_user)
+        return current_user
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
     except jwt.PyJWTError:
@@ -65,12 +117,12 @@ class UserBase(BaseModel):
     
 # Enpoint POST para crear un nuevo usuario
 @router.post("/user/", tags=["User"])
-def post_user(user: UserBase, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.username == user.username).first()
+async def post_user(user: UserBase, db: AsyncSession = Depends(get_async_db)):
+    db_user = await db.scalar(select(User).where(User.username == user.username))
     if db_user:
         raise HTTPException(status_code=400, detail="Username already registered")
     # Hashear la contraseña antes de guardarla
-    hashed_password = hash_password(user.password)
+    hashed_password = await hash_password_async(user.password)
     db_user = User(
         name=user.name,
         username=user.username,
@@ -78,59 +130,154 @@ def post_user(user: UserBase, db: Session = Depends(get_db)):
         email=user.email,  # Asegurarse de guardar el email
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.commit()
+    await db.refresh(db_user)
     return {"message": "User created successfully"}
 
 # Definimos un endpoint GET en la ruta "/user/{id}"
-@router.get("/user/{id}", tags=["User"])
-def get_user(id: int, db: Session = Depends(get_db)):
+@router.get("/user/{id}", response_model=Optional[UserOut], tags=["User"])
+async def get_user(id: int, db: AsyncSession = Depends(get_async_db)):
     # Obtenemos la instancia de User con el id proporcionado
-    db_user = db.query(User).filter(User.id_user == id).first()
+    db_user = (await db.execute(select(*USER_COLUMNS).where(User.id_user == id))).first()
     # Devolvemos la instancia de User
     return db_user
 
 # Definimos un endpoint GET en la ruta "/user/"
-@router.get("/user/", tags=["User"])
-def get_users(db: Session = Depends(get_db)):
+@router.get("/user/", response_model=List[UserOut], tags=["User"])
+async def get_users(db: AsyncSession = Depends(get_async_db)):
     # Obtenemos todas las instancias de User
-    db_users = db.query(User).all()
+    db_users = (await db.execute(select(*USER_COLUMNS))).all()
     # Devolvemos la lista de instancias de User
     return db_users
 
 # Definimos un endpoint DELETE en la ruta "/user/{id}"
-@router.delete("/user/{id}", tags=["User"])
-def delete_user(id: int, db: Session = Depends(get_db)):
+@router.delete("/user/{id}", response_model=UserOut, tags=["User"])
+async def delete_user(id: int, db: AsyncSession = Depends(get_async_db)):
     # Obtenemos la instancia de User con el id proporcionado
-    db_user = db.query(User).filter(User.id_user == id).first()
+    db_user = await db.scalar(select(User).where(User.id_user == id))
     # Eliminamos la instancia de User de la sesión de la base de datos
-    db.delete(db_user)
+    await db.delete(db_user)
     # Confirmamos la transacción para guardar los cambios en la base de datos
-    db.commit()
+    await db.commit()
+    # Quitamos al usuario del caché de autenticación
+    user_cache.invalidate(db_user.username)
     # Devolvemos la instancia de User eliminada
     return db_user
 
 # Definimos un endpoint PUT en la ruta "/user/{id}"
-@router.put("/user/{id}", tags=["User"])
-def put_user(id: int, user: UserBase, db: Session = Depends(get_db)):
+@router.put("/user/{id}", response_model=UserOut, tags=["User"])
+async def put_user(id: int, user: UserBase, db: AsyncSession = Depends(get_async_db)):
     # Obtenemos la instancia de User con el id proporcionado
-    db_user = db.query(User).filter(User.id_user == id).first()
+    db_user = await db.scalar(select(User).where(User.id_user == id))
+    old_username = db_user.username
     # Actualizamos los campos de la instancia de User con los valores proporcionados
     db_user.name = user.name
     db_user.username = user.username
-    db_user.password = user.password
+    db_user.password = await hash_password_async(user.password)
     # Confirmamos la transacción para guardar los cambios en la base de datos
-    db.commit()
+    await db.commit()
+    # Quitamos al usuario del caché de autenticación (con su username anterior y el nuevo)
+    user_cache.invalidate(old_username)
+    user_cache.invalidate(db_user.username)
     # Refrescamos la instancia de User para obtener los datos actualizados desde la base de datos
-    db.refresh(db_user)
+    await db.refresh(db_user)
     # Devolvemos la instancia de User actual
     return db_user
 
+# Definimos un endpoint GET en la ruta "/user/{id}/stats"
+# El endpoint es síncrono a propósito: el recálculo con NumPy se ejecuta en el
+# threadpool en lugar de bloquear el event loop
+@router.get("/user/{id}/stats", tags=["User"])
+def get_user_stats(id: int, db: Session = Depends(get_db)):
+    if db.scalar(select(User.id_user).where(User.id_user == id)) is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    # Recalculamos (con NumPy) sólo los grupos con solves nuevos desde la última
+    # consulta y devolvemos las estadísticas por tipo de cubo y tipo de solve:
+    # PBs, percentiles, histograma, medias por hora del día y medias móviles
+    groups = user_stats.summary(db, id)
+    # Guardamos los resúmenes recalculados
+    db.commit()
+    return {"id_user": id, "groups": groups}
+
+# Cantidad de solves recientes que muestra el panel del usuario
+DASHBOARD_RECENT_SOLVES = 20
+
+# Definimos un modelo para los récords de un usuario por tipo de cubo y tipo
+# de solve. Salen de los contadores de user_stats sin recalcular nada; stale
+# indica que hay cambios pendientes de consolidar (ver /user/{id}/stats)
+class UserRecordOut(BaseModel):
+    fk_cube_type: Optional[int]
+    cube_type: Optional[str]
+    fk_solve_type: Optional[int]
+    solve_type: Optional[str]
+    qty: Optional[int]
+    dnf: Optional[int]
+    best_ms: Optional[int]
+    mean_ms: Optional[int]
+    stale: Optional[bool]
+
+# Definimos un modelo para el panel de un usuario
+class UserDashboardOut(BaseModel):
+    user: UserOut
+    sessions: List[SessionOut]
+    recent_solves: List[SolveOut]
+    cubes: List[CubeOut]
+    solve_types: List[SolveTypeOut]
+    records: List[UserRecordOut]
+
+# Definimos un endpoint GET en la ruta "/user/{id}/dashboard"
+@router.get("/user/{id}/dashboard", response_model=UserDashboardOut, tags=["User"])
+async def get_user_dashboard(id: int, db: AsyncSession = Depends(get_async_db)):
+    # Obtenemos el usuario junto con sus sesiones
+    db_user = await db.scalar(select(User).where(User.id_user == id).options(selectinload(User.sessions)))
+    if db_user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    # Obtenemos los últimos solves del usuario (de todas sus sesiones) con sus
+    # cubos, tipos de cubo y tipos de solve
+    db_solves = (await db.scalars(
+        select(Solve)
+        .join(SessionModel, Solve.fk_session == SessionModel.id_session)
+        .where(SessionModel.fk_user == id)
+        .order_by(Solve.date.desc(), Solve.id_solve.desc())
+        .limit(DASHBOARD_RECENT_SOLVES)
+        .options(*SOLVE_RELATIONS)
+    )).all()
+    # Obtenemos los récords del usuario con los nombres de los tipos de cubo y de solve
+    records = (await db.execute(
+        select(UserStats, CubeType.cube_type, SolveType.solve_type)
+        .outerjoin(CubeType, UserStats.fk_cube_type == CubeType.id_cube_type)
+        .outerjoin(SolveType, UserStats.fk_solve_type == SolveType.id_solve_type)
+        .where(UserStats.fk_user == id)
+        .order_by(UserStats.fk_cube_type, UserStats.fk_solve_type)
+    )).all()
+    return {
+        "user": db_user,
+        "sessions": db_user.sessions,
+        "recent_solves": db_solves,
+        **solves_catalog(db_solves),
+        "records": [
+            {
+                "fk_cube_type": row.fk_cube_type,
+                "cube_type": cube_type,
+                "fk_solve_type": row.fk_solve_type,
+                "solve_type": solve_type,
+                "qty": row.qty,
+                "dnf": row.dnf,
+                "best_ms": row.best_ms,
+                "mean_ms": round(row.total_ms / (row.qty - row.dnf)) if row.qty > row.dnf else None,
+                "stale": row.stale,
+            }
+            for row, cube_type, solve_type in records
+        ],
+    }
+
 # Endpoint para iniciar sesión
 @router.post("/login", tags=["Auth"])
-def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.username == form_data.username).first()
-    if not db_user or not verify_password(form_data.password, db_user.password):
+async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: AsyncSession = Depends(get_async_db)):
+    db_user = (await db.execute(
+        select(User.username, User.name, User.password).where(User.username == form_data.username)
+    )).first()
+    if not db_user or not await verify_password_async(form_data.password, db_user.password):
         raise HTTPException(status_code=400, detail="Invalid username or password")
     # Crear un token de acceso
     access_token = create_access_token(data={"sub": db_user.username})
@@ -139,5 +286,5 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
 # Ver como usar esto en un endpoint
 # Ejemplo de ruta protegida
 # @router.get("/protected-route", tags=["Auth"])
-# def protected_route(current_user: User = Depends(get_current_user)):
+# def protected_route(current_user: CurrentUser = Depends(get_current_user)):
 #     return {"message": f"Hello, {current_user.username}!"}
\ No newline at end of file
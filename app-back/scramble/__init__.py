@@ -0,0 +1,73 @@
+# Generación de scrambles
+
+# Para el 3x3 se generan scrambles de estado aleatorio (random-state, como
+# exige la WCA): se elige un estado uniforme entre todos los alcanzables, se
+# resuelve con el solver de dos fases y el scramble es el inverso de la solución.
+
+import random
+from threading import Lock
+
+from scramble.cubie import CubieCube, format_moves, invert_moves
+from scramble.search import SearchTimeout, Solver
+from scramble.tables import load_tables
+
+# Longitud máxima de los scrambles de 3x3
+MAX_LENGTH_333 = 24
+
+_tables = None
+_tables_lock = Lock()
+
+
+# Obtenemos las tablas del solver, abriéndolas la primera vez
+def get_tables() -> dict:
+    global _tables
+    with _tables_lock:
+        if _tables is None:
+            _tables = load_tables()
+        return _tables
+
+
+# Scramble de estado aleatorio para el 3x3
+def scramble_333(rng=random) -> str:
+    while True:
+        cube = CubieCube.random(rng)
+        # Un estado a menos de 2 movimientos no es un scramble válido
+        if cube == CubieCube() or any(cube == CubieCube().move(m) for m in range(18)):
+            continue
+        try:
+            # Cada llamada usa su propio solver porque guarda el estado de la búsqueda
+            solution = Solver(get_tables()).solve(cube, MAX_LENGTH_333)
+            return format_moves(invert_moves(solution))
+        except SearchTimeout:
+            continue
+
+
+# Generadores disponibles por tipo de cubo
+SCRAMBLERS = {
+    "3x3": scramble_333,
+}
+
+# Otros nombres aceptados en la API para cada tipo de cubo
+ALIASES = {
+    "333": "3x3",
+    "3x3x3": "3x3",
+}
+
+
+# Función para obtener el nombre canónico de un tipo de cubo
+def canonical_cube_type(cube_type: str) -> str:
+    cube_type = cube_type.lower()
+    cube_type = ALIASES.get(cube_type, cube_type)
+    if cube_type not in SCRAMBLERS:
+        raise KeyError(cube_type)
+    return cube_type
+
+
+# Función para generar un scramble del tipo de cubo indicado
+def generate_scramble(cube_type: str) -> str:
+    return SCRAMBLERS[canonical_cube_type(cube_type)]()
+
+
+# Función para generar varios scrambles (la ejecutan los procesos del pool)
+def generate_scrambles(cube_type: str, count: int) -> list:
+    return [generate_scramble(cube_type) for _ in range(count)]
@@ -0,0 +1,164 @@
+# Representación del cubo 3x3 a nivel de piezas (cubies) y sus coordenadas
+
+# Un estado se describe con la notación "es reemplazado por": cp[i] es la
+# esquina que ocupa la posición i y co[i] su orientación (0, 1 o 2); ep/eo
+# cumplen el mismo papel para las aristas.
+#
+# Esquinas: URF, UFL, ULB, UBR, DFR, DLF, DBL, DRB
+# Aristas:  UR, UF, UL, UB, DR, DF, DL, DB, FR, FL, BL, BR
+
+import random
+from math import comb
+
+N_TWIST = 2187       # 3^7 orientaciones de esquinas
+N_FLIP = 2048        # 2^11 orientaciones de aristas
+N_SLICE = 495        # C(12, 4) posiciones de las aristas del slice UD
+N_CORNERS = 40320    # 8! permutaciones de esquinas
+N_UD_EDGES = 40320   # 8! permutaciones de las aristas U/D (fase 2)
+N_SLICE_PERM = 24    # 4! permutaciones de las aristas del slice (fase 2)
+
+FACES = "URFDLB"
+N_MOVES = 18
+# Movimientos permitidos en la fase 2: U, U2, U', R2, F2, D, D2, D', L2, B2
+PHASE2_MOVES = (0, 1, 2, 4, 7, 9, 10, 11, 13, 16)
+
+# Movimientos básicos (un cuarto de vuelta horario) de cada cara
+BASIC_MOVES = {
+    "U": ((3, 0, 1, 2, 4, 5, 6, 7), (0, 0, 0, 0, 0, 0, 0, 0),
+          (3, 0, 1, 2, 4, 5, 6, 7, 8, 9, 10, 11), (0,) * 12),
+    "R": ((4, 1, 2, 0, 7, 5, 6, 3), (2, 0, 0, 1, 1, 0, 0, 2),
+          (8, 1, 2, 3, 11, 5, 6, 7, 4, 9, 10, 0), (0,) * 12),
+    "F": ((1, 5, 2, 3, 0, 4, 6, 7), (1, 2, 0, 0, 2, 1, 0, 0),
+          (0, 9, 2, 3, 4, 8, 6, 7, 1, 5, 10, 11), (0, 1, 0, 0, 0, 1, 0, 0, 1, 1, 0, 0)),
+    "D": ((0, 1, 2, 3, 5, 6, 7, 4), (0, 0, 0, 0, 0, 0, 0, 0),
+          (0, 1, 2, 3, 5, 6, 7, 4, 8, 9, 10, 11), (0,) * 12),
+    "L": ((0, 2, 6, 3, 4, 1, 5, 7), (0, 1, 2, 0, 0, 2, 1, 0),
+          (0, 1, 10, 3, 4, 5, 9, 7, 8, 2, 6, 11), (0,) * 12),
+    "B": ((0, 1, 3, 7, 4, 5, 2, 6), (0, 0, 1, 2, 0, 0, 2, 1),
+          (0, 1, 2, 11, 4, 5, 6, 10, 8, 9, 3, 7), (0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 1, 1)),
+}
+
+
+# Funciones para componer permutaciones y orientaciones
+def permute(perm, move_perm):
+    return tuple(perm[k] for k in move_perm)
+
+
+def orient(orientation, move_perm, move_orientation, modulo):
+    return tuple((orientation[k] + o) % modulo for k, o in zip(move_perm, move_orientation))
+
+
+# Calculamos los 18 movimientos (cara x potencia) componiendo el movimiento básico
+def _build_moves():
+    moves = []
+    for face in FACES:
+        cp, co, ep, eo = range(8), (0,) * 8, range(12), (0,) * 12
+        mcp, mco, mep, meo = BASIC_MOVES[face]
+        for _ in range(3):
+            cp, co = permute(cp, mcp), orient(co, mcp, mco, 3)
+            ep, eo = permute(ep, mep), orient(eo, mep, meo, 2)
+            moves.append((cp, co, ep, eo))
+    return moves
+
+
+MOVES = _build_moves()
+MOVE_NAMES = [face + suffix for face in FACES for suffix in ("", "2", "'")]
+
+
+# Rango de Lehmer de una permutación de 0..n-1
+def perm_rank(perm) -> int:
+    rank = 0
+    n = len(perm)
+    for i in range(n):
+        smaller = sum(1 for j in range(i + 1, n) if perm[j] < perm[i])
+        rank = rank * (n - i) + smaller
+    return rank
+
+
+def parity(perm) -> int:
+    return sum(1 for i in range(len(perm)) for j in range(i + 1, len(perm)) if perm[i] > perm[j]) % 2
+
+
+# Coordenadas: cada una depende sólo de la parte del estado que recibe
+def twist_coord(co) -> int:
+    value = 0
+    for o in co[:7]:
+        value = value * 3 + o
+    return value
+
+
+def flip_coord(eo) -> int:
+    value = 0
+    for o in eo[:11]:
+        value = value * 2 + o
+    return value
+
+
+def slice_coord(ep) -> int:
+    value, found = 0, 0
+    for j in range(11, -1, -1):
+        if ep[j] >= 8:
+            value += comb(11 - j, found + 1)
+            found += 1
+    return value
+
+
+def corners_coord(cp) -> int:
+    return perm_rank(cp)
+
+
+def ud_edges_coord(ep) -> int:
+    return perm_rank(ep[:8])
+
+
+def slice_perm_coord(ep) -> int:
+    return perm_rank([e - 8 for e in ep[8:]])
+
+
+# Estado del cubo a nivel de piezas
+class CubieCube:
+    def __init__(self, cp=tuple(range(8)), co=(0,) * 8, ep=tuple(range(12)), eo=(0,) * 12):
+        self.cp, self.co, self.ep, self.eo = tuple(cp), tuple(co), tuple(ep), tuple(eo)
+
+    # Aplicamos un movimiento (índice 0..17)
+    def move(self, m: int) -> "CubieCube":
+        mcp, mco, mep, meo = MOVES[m]
+        return CubieCube(
+            permute(self.cp, mcp), orient(self.co, mcp, mco, 3),
+            permute(self.ep, mep), orient(self.eo, mep, meo, 2),
+        )
+
+    def apply(self, moves) -> "CubieCube":
+        cube = self
+        for m in moves:
+            cube = cube.move(m)
+        return cube
+
+    def __eq__(self, other):
+        return (self.cp, self.co, self.ep, self.eo) == (other.cp, other.co, other.ep, other.eo)
+
+    # Estado aleatorio uniforme entre todos los estados alcanzables
+    @classmethod
+    def random(cls, rng=random) -> "CubieCube":
+        cp = list(range(8))
+        ep = list(range(12))
+        rng.shuffle(cp)
+        rng.shuffle(ep)
+        # La paridad de esquinas y aristas debe coincidir
+        if parity(cp) != parity(ep):
+            ep[0], ep[1] = ep[1], ep[0]
+        co = [rng.randrange(3) for _ in range(7)]
+        co.append(-sum(co) % 3)
+        eo = [rng.randrange(2) for _ in range(11)]
+        eo.append(sum(eo) % 2)
+        return cls(cp, co, ep, eo)
+
+
+# Función para convertir una lista de movimientos a notación estándar
+def format_moves(moves) -> str:
+    return " ".join(MOVE_NAMES[m] for m in moves)
+
+
+# Inverso de una secuencia de movimientos
+def invert_moves(moves):
+    return [m - m % 3 + 2 - m % 3 for m in reversed(moves)]
@@ -0,0 +1,190 @@
+# Pool de scrambles pregenerados
+
+# Cada tipo de cubo tiene una reserva de scrambles que se rellena en segundo
+# plano con un ProcessPoolExecutor. Cuando la reserva baja de la marca mínima
+# se generan scrambles hasta alcanzar la máxima, de modo que una petición sólo
+# saca un elemento de la cola (O(1)) y nunca bloquea el event loop. Si la
+# reserva está vacía, la petición espera al siguiente scramble generado.
+#
+# Si un lote falla (por ejemplo, si un proceso muere y el pool queda roto con
+# BrokenProcessPool), el pool de procesos se recrea, las peticiones que
+# esperaban fallan con ScrambleUnavailable y el relleno se reintenta tras una
+# pausa. Una petición tampoco espera más de SCRAMBLE_POOL_TIMEOUT segundos.
+#
+# Variables de entorno:
+# - SCRAMBLE_POOL_LOW / SCRAMBLE_POOL_HIGH: marcas mínima y máxima por tipo de cubo
+# - SCRAMBLE_POOL_WORKERS: procesos que generan scrambles
+# - SCRAMBLE_POOL_BATCH: scrambles que genera cada tarea enviada a un proceso
+# - SCRAMBLE_POOL_TIMEOUT: segundos que una petición espera un scramble
+
+import asyncio
+import multiprocessing
+import os
+import traceback
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from time import monotonic
+
+from scramble import SCRAMBLERS, canonical_cube_type, generate_scrambles
+
+POOL_LOW = int(os.getenv("SCRAMBLE_POOL_LOW", "20"))
+POOL_HIGH = int(os.getenv("SCRAMBLE_POOL_HIGH", "100"))
+POOL_WORKERS = int(os.getenv("SCRAMBLE_POOL_WORKERS", "1"))
+POOL_BATCH = int(os.getenv("SCRAMBLE_POOL_BATCH", "5"))
+POOL_TIMEOUT = float(os.getenv("SCRAMBLE_POOL_TIMEOUT", "10"))
+# Segundos de pausa antes de reintentar un lote que falló
+POOL_RETRY_DELAY = 1.0
+
+
+# No hay un scramble disponible: la generación falló o tardó demasiado
+class ScrambleUnavailable(RuntimeError):
+    pass
+
+
+# Reserva de scrambles de un tipo de cubo
+class ScramblePool:
+    def __init__(self, cube_type: str, pools: "ScramblePools", low: int = POOL_LOW, high: int = POOL_HIGH):
+        self.cube_type = cube_type
+        # Conjunto de reservas, dueño del pool de procesos (que puede recrearse)
+        self.pools = pools
+        self.low = low
+        self.high = high
+        self.scrambles = deque()
+        self.waiters = deque()
+        self.needed = asyncio.Event()
+        self.needed.set()
+        # Métricas
+        self.generated = 0
+        self.generation_time = 0.0
+        self.served = 0
+        self.waits = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.failures = 0
+
+    # Sacamos un scramble de la reserva, esperando si está vacía (como mucho
+    # POOL_TIMEOUT segundos)
+    async def get(self) -> str:
+        self.served += 1
+        if len(self.scrambles) - 1 < self.low:
+            self.needed.set()
+        if self.scrambles:
+            return self.scrambles.popleft()
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        start = monotonic()
+        try:
+            return await asyncio.wait_for(waiter, POOL_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise ScrambleUnavailable("Timed out waiting for a scramble")
+        finally:
+            wait = monotonic() - start
+            self.waits += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+    # Entregamos los scrambles nuevos: primero a las peticiones que esperan
+    def _deliver(self, scrambles):
+        for scramble in scrambles:
+            while self.waiters and self.waiters[0].done():
+                self.waiters.popleft()
+            if self.waiters:
+                self.waiters.popleft().set_result(scramble)
+            else:
+                self.scrambles.append(scramble)
+
+    # Hacemos fallar a las peticiones que esperan
+    def _fail(self, error: Exception):
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_exception(error)
+
+    # Tarea de fondo que rellena la reserva entre las marcas mínima y máxima
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.needed.wait()
+            while len(self.scrambles) < self.high or self.waiters:
+                # Enviamos un lote a cada proceso y entregamos los resultados
+                executor = self.pools.executor
+                start = monotonic()
+                try:
+                    batches = await asyncio.gather(*[
+                        loop.run_in_executor(executor, generate_scrambles, self.cube_type, POOL_BATCH)
+                        for _ in range(POOL_WORKERS)
+                    ])
+                except Exception as error:
+                    traceback.print_exc()
+                    self.failures += 1
+                    if isinstance(error, BrokenProcessPool):
+                        self.pools.restart(executor)
+                    self._fail(ScrambleUnavailable("Scramble generation failed"))
+                    await asyncio.sleep(POOL_RETRY_DELAY)
+                    continue
+                self.generation_time += monotonic() - start
+                for scrambles in batches:
+                    self.generated += len(scrambles)
+                    self._deliver(scrambles)
+            self.needed.clear()
+
+    def metrics(self) -> dict:
+        return {
+            "depth": len(self.scrambles),
+            "low": self.low,
+            "high": self.high,
+            "generated": self.generated,
+            "refill_rate": round(self.generated / self.generation_time, 2) if self.generation_time else 0.0,
+            "served": self.served,
+            "waits": self.waits,
+            "wait_avg_ms": round(self.wait_total / self.waits * 1000, 3) if self.waits else 0.0,
+            "wait_max_ms": round(self.wait_max * 1000, 3),
+            "failures": self.failures,
+        }
+
+
+# Conjunto de reservas, una por tipo de cubo, con su pool de procesos
+class ScramblePools:
+    def __init__(self):
+        self.executor = None
+        self.pools = {}
+        self.tasks = []
+
+    def _create_executor(self):
+        # "spawn" evita heredar los hilos y el event loop del proceso principal
+        return ProcessPoolExecutor(POOL_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+    # Iniciamos los procesos y las tareas de relleno (desde el lifespan de la app)
+    def start(self):
+        self.executor = self._create_executor()
+        for cube_type in SCRAMBLERS:
+            pool = ScramblePool(cube_type, self)
+            self.pools[cube_type] = pool
+            self.tasks.append(asyncio.create_task(pool.run()))
+
+    # Recreamos el pool de procesos si sigue siendo el que se rompió (varias
+    # reservas pueden detectar la misma rotura)
+    def restart(self, broken):
+        if self.executor is broken:
+            broken.shutdown(wait=False)
+            self.executor = self._create_executor()
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks.clear()
+        # Esperamos (en un hilo) a que los procesos terminen el lote en curso y
+        # salgan, para no dejarlos huérfanos al detener un worker
+        await asyncio.get_running_loop().run_in_executor(None, self.executor.shutdown)
+
+    async def get(self, cube_type: str) -> str:
+        return await self.pools[canonical_cube_type(cube_type)].get()
+
+    def metrics(self) -> dict:
+        return {cube_type: pool.metrics() for cube_type, pool in self.pools.items()}
+
+
+# Instancia global de las reservas de scrambles
+scramble_pools = ScramblePools()
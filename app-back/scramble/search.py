@@ -0,0 +1,123 @@
+# Solver de dos fases de Kociemba
+
+# Fase 1: lleva el cubo al subgrupo G1 = <U, D, R2, L2, F2, B2> (orientaciones
+# resueltas y aristas del slice UD dentro del slice). Fase 2: resuelve el cubo
+# dentro de G1. Ambas fases son búsquedas IDA* guiadas por las tablas de poda;
+# se devuelve la primera solución que no supere la longitud máxima.
+
+from time import perf_counter
+
+from scramble.cubie import (
+    N_FLIP, N_MOVES, N_TWIST, N_UD_EDGES, PHASE2_MOVES,
+    CubieCube, corners_coord, flip_coord, slice_coord, slice_perm_coord, twist_coord, ud_edges_coord,
+)
+
+# Movimientos que pueden terminar la fase 1: cuartos de vuelta de R, F, L y B.
+# Si terminara con un movimiento de G1, esa solución de fase 1 sería más corta
+# y ya se habría probado en una profundidad anterior
+PHASE1_LAST_MOVES = {3, 5, 6, 8, 12, 14, 15, 17}
+
+# Profundidad máxima de la fase 2: limitarla descarta rápido las soluciones de
+# fase 1 que llevan a posiciones difíciles de G1 (se prueba la siguiente)
+MAX_PHASE2_DEPTH = 12
+
+
+# Error cuando no se encuentra una solución dentro de los límites
+class SearchTimeout(Exception):
+    pass
+
+
+# Indica si se puede aplicar un movimiento de la cara `face` después de `last_face`:
+# no se repite la misma cara y las caras opuestas sólo se aceptan en un orden
+def allowed(face: int, last_face: int) -> bool:
+    return face != last_face and face != last_face - 3
+
+
+class Solver:
+    def __init__(self, tables: dict):
+        self.twist_move = tables["twist_move"]
+        self.flip_move = tables["flip_move"]
+        self.slice_move = tables["slice_move"]
+        self.corners_move = tables["corners_move"]
+        self.ud_edges_move = tables["ud_edges_move"]
+        self.slice_perm_move = tables["slice_perm_move"]
+        self.slice_twist_prune = tables["slice_twist_prune"]
+        self.slice_flip_prune = tables["slice_flip_prune"]
+        self.slice_corners_prune = tables["slice_corners_prune"]
+        self.slice_ud_edges_prune = tables["slice_ud_edges_prune"]
+
+    def _phase1_distance(self, twist, flip, slice_):
+        return max(self.slice_twist_prune[slice_ * N_TWIST + twist], self.slice_flip_prune[slice_ * N_FLIP + flip])
+
+    def _phase2_distance(self, corners, ud_edges, slice_perm):
+        return max(
+            self.slice_corners_prune[slice_perm * N_UD_EDGES + corners],
+            self.slice_ud_edges_prune[slice_perm * N_UD_EDGES + ud_edges],
+        )
+
+    # Resolvemos el cubo y devolvemos la lista de movimientos (índices 0..17)
+    def solve(self, cube: CubieCube, max_length: int = 24, timeout: float = 5.0):
+        self.cube = cube
+        self.max_length = max_length
+        self.deadline = perf_counter() + timeout
+        self.moves = []
+        self.solution = None
+        twist, flip, slice_ = twist_coord(cube.co), flip_coord(cube.eo), slice_coord(cube.ep)
+        for depth in range(self._phase1_distance(twist, flip, slice_), max_length + 1):
+            if self._phase1(twist, flip, slice_, depth, -1):
+                return self.solution
+        raise SearchTimeout("No solution within the maximum length")
+
+    def _phase1(self, twist, flip, slice_, depth, last_face):
+        if depth == 0:
+            if self.moves and self.moves[-1] not in PHASE1_LAST_MOVES:
+                return False
+            return self._start_phase2()
+        if perf_counter() > self.deadline:
+            raise SearchTimeout("Search timed out")
+        for m in range(N_MOVES):
+            face = m // 3
+            if not allowed(face, last_face):
+                continue
+            new_twist = self.twist_move[twist * N_MOVES + m]
+            new_flip = self.flip_move[flip * N_MOVES + m]
+            new_slice = self.slice_move[slice_ * N_MOVES + m]
+            if self._phase1_distance(new_twist, new_flip, new_slice) >= depth:
+                continue
+            self.moves.append(m)
+            if self._phase1(new_twist, new_flip, new_slice, depth - 1, face):
+                return True
+            self.moves.pop()
+        return False
+
+    # Al llegar a G1 calculamos las coordenadas de la fase 2 a partir de las piezas
+    def _start_phase2(self):
+        cube = self.cube.apply(self.moves)
+        corners, ud_edges, slice_perm = corners_coord(cube.cp), ud_edges_coord(cube.ep), slice_perm_coord(cube.ep)
+        last_face = self.moves[-1] // 3 if self.moves else -1
+        limit = min(self.max_length - len(self.moves), MAX_PHASE2_DEPTH)
+        phase1_length = len(self.moves)
+        for depth in range(self._phase2_distance(corners, ud_edges, slice_perm), limit + 1):
+            if self._phase2(corners, ud_edges, slice_perm, depth, last_face):
+                self.solution = list(self.moves)
+                return True
+            del self.moves[phase1_length:]
+        return False
+
+    def _phase2(self, corners, ud_edges, slice_perm, depth, last_face):
+        if depth == 0:
+            return corners == 0 and ud_edges == 0 and slice_perm == 0
+        for m in PHASE2_MOVES:
+            face = m // 3
+            if not allowed(face, last_face):
+                continue
+            new_corners = self.corners_move[corners * N_MOVES + m]
+            new_ud_edges = self.ud_edges_move[ud_edges * N_MOVES + m]
+            new_slice_perm = self.slice_perm_move[slice_perm * N_MOVES + m]
+            if self._phase2_distance(new_corners, new_ud_edges, new_slice_perm) >= depth:
+                continue
+            self.moves.append(m)
+            if self._phase2(new_corners, new_ud_edges, new_slice_perm, depth - 1, face):
+                return True
+            self.moves.pop()
+        return False
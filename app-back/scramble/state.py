@@ -0,0 +1,152 @@
+# Simulador vectorizado del estado de cubos NxN
+
+# Cada cubo se representa por sus 6·N² stickers y cada movimiento por una
+# permutación de esos stickers (un arreglo de NumPy). Un lote de scrambles se
+# aplica de una sola vez: en cada paso se hace una única indexación (gather)
+# sobre todas las filas del lote, así que el bucle en Python recorre la
+# longitud del scramble más largo y no la cantidad de scrambles.
+
+import hashlib
+import re
+from functools import lru_cache
+
+import numpy as np
+
+FACES = "URFDLB"
+# Normal y ejes (derecha, abajo) de cada cara, con x a la derecha, y arriba, z al frente
+FACE_AXES = {
+    "U": ((0, 1, 0), (1, 0, 0), (0, 0, 1)),
+    "R": ((1, 0, 0), (0, 0, -1), (0, -1, 0)),
+    "F": ((0, 0, 1), (1, 0, 0), (0, -1, 0)),
+    "D": ((0, -1, 0), (1, 0, 0), (0, 0, -1)),
+    "L": ((-1, 0, 0), (0, 0, 1), (0, -1, 0)),
+    "B": ((0, 0, -1), (-1, 0, 0), (0, -1, 0)),
+}
+# Notación WCA: [capas]Cara[w][2|'], por ejemplo R, U2, Fw', 3Rw2
+MOVE_PATTERN = re.compile(r"^(\d*)([URFDLB])(w?)(2'?|'?)$")
+# Tamaños de cubo soportados
+MIN_SIZE = 2
+MAX_SIZE = 7
+
+
+# Error de un scramble con notación inválida
+class InvalidScramble(ValueError):
+    pass
+
+
+# Función para obtener el tamaño N a partir del nombre del tipo de cubo
+# ("3x3", "4x4x4", "555"); devuelve None si no es un cubo NxN soportado
+def cube_size(cube_type: str):
+    match = re.fullmatch(r"(\d)(?:x\1(?:x\1)?|\1\1)", (cube_type or "").strip().lower())
+    if match is None:
+        return None
+    size = int(match.group(1))
+    return size if MIN_SIZE <= size <= MAX_SIZE else None
+
+
+class CubeSimulator:
+    def __init__(self, size: int):
+        self.size = size
+        n = size
+        # Posición y normal (coordenadas enteras) de cada sticker
+        stickers = []
+        for face in FACES:
+            normal, right, down = (np.array(v) for v in FACE_AXES[face])
+            for row in range(n):
+                for col in range(n):
+                    position = n * normal + (2 * col - (n - 1)) * right + (2 * row - (n - 1)) * down
+                    stickers.append((tuple(position), tuple(normal)))
+        self.n_stickers = len(stickers)
+        index = {sticker: i for i, sticker in enumerate(stickers)}
+        positions = np.array([p for p, _ in stickers])
+        normals = np.array([v for _, v in stickers])
+        # Permutaciones de cada movimiento; la 0 es la identidad (relleno)
+        self.tokens = {}
+        perms = [np.arange(self.n_stickers)]
+        for face in FACES:
+            axis = np.array(FACE_AXES[face][0])
+            for layers in range(1, n):
+                quarter = self._quarter_turn(axis, layers, positions, normals, index)
+                perm = np.arange(self.n_stickers)
+                for power, suffix in ((1, ""), (2, "2"), (3, "'")):
+                    perm = perm[quarter]
+                    perms.append(perm)
+                    for name in self._names(face, layers, suffix):
+                        self.tokens[name] = len(perms) - 1
+        dtype = np.int16 if self.n_stickers < 2 ** 15 else np.int32
+        self.perms = np.array(perms, dtype=dtype)
+        # Colores (caras) de cada sticker en el cubo resuelto
+        self.colors = (np.arange(self.n_stickers) // (n * n)).astype(np.uint8)
+
+    # Permutación de un cuarto de vuelta horario de las `layers` capas exteriores
+    def _quarter_turn(self, axis, layers, positions, normals, index):
+        n = self.size
+        perm = np.arange(self.n_stickers)
+        moving = positions @ axis >= n + 1 - 2 * layers
+        for i in np.nonzero(moving)[0]:
+            # Rotación de -90° alrededor del eje: v' = (v·a)a - a × v
+            position = (positions[i] @ axis) * axis - np.cross(axis, positions[i])
+            normal = (normals[i] @ axis) * axis - np.cross(axis, normals[i])
+            perm[index[(tuple(position), tuple(normal))]] = i
+        return perm
+
+    # Nombres aceptados para un movimiento (R, Rw, 3Rw, r, ...)
+    def _names(self, face, layers, suffix):
+        if layers == 1:
+            names = [face]
+        elif layers == 2:
+            names = [face + "w", "2" + face + "w", face.lower()]
+        else:
+            names = [f"{layers}{face}w"]
+        return [name + suffix for name in names] + ([name + "2'" for name in names] if suffix == "2" else [])
+
+    # Convertimos un scramble en la lista de índices de sus movimientos
+    def parse(self, scramble: str) -> list:
+        moves = []
+        for token in scramble.split():
+            move = self.tokens.get(token)
+            if move is None:
+                raise InvalidScramble(f"Invalid move {token!r} for a {self.size}x{self.size}")
+            moves.append(move)
+        return moves
+
+    # Aplicamos un lote de scrambles ya convertidos y devolvemos los colores de
+    # los stickers de cada estado final (una fila por scramble)
+    def apply(self, sequences) -> np.ndarray:
+        length = max((len(moves) for moves in sequences), default=0)
+        moves = np.zeros((len(sequences), length), dtype=np.int32)
+        for row, sequence in enumerate(sequences):
+            moves[row, :len(sequence)] = sequence
+        states = np.tile(np.arange(self.n_stickers, dtype=self.perms.dtype), (len(sequences), 1))
+        for step in range(length):
+            states = np.take_along_axis(states, self.perms[moves[:, step]], axis=1)
+        return self.colors[states]
+
+    # Hash canónico de los estados que producen los scrambles (None si el
+    # scramble es inválido) y grupos de scrambles que llevan al mismo estado
+    def analyze(self, scrambles):
+        sequences, valid, errors = [], [], {}
+        for position, scramble in enumerate(scrambles):
+            try:
+                sequences.append(self.parse(scramble))
+                valid.append(position)
+            except InvalidScramble as error:
+                errors[position] = str(error)
+        hashes = [None] * len(scrambles)
+        duplicates = []
+        if valid:
+            states = self.apply(sequences)
+            unique, inverse, counts = np.unique(states, axis=0, return_inverse=True, return_counts=True)
+            inverse = inverse.reshape(-1)
+            digests = [hashlib.blake2b(row.tobytes(), digest_size=8).hexdigest() for row in unique]
+            for row, position in enumerate(valid):
+                hashes[position] = digests[inverse[row]]
+            for group in np.nonzero(counts > 1)[0]:
+                duplicates.append([valid[row] for row in np.nonzero(inverse == group)[0]])
+        return hashes, errors, duplicates
+
+
+# Simulador para cada tamaño, construido una sola vez
+@lru_cache(maxsize=None)
+def simulator(size: int) -> CubeSimulator:
+    return CubeSimulator(size)
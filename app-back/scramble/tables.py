@@ -0,0 +1,140 @@
+# Tablas de movimientos y de poda del solver de dos fases
+
+# Las tablas se calculan una sola vez y se guardan como archivos .npy (uint16
+# para los movimientos, int8 para las profundidades de poda, unos 6 MB en
+# total). Al iniciar se abren con memoria mapeada, de modo que todos los
+# workers comparten las mismas páginas del caché del sistema operativo en
+# lugar de mantener cada uno su propia copia.
+#
+# Uso: python -m scramble.tables   (genera las tablas si no existen)
+
+import os
+from collections import deque
+
+import numpy as np
+
+from scramble.cubie import (
+    MOVES, N_CORNERS, N_FLIP, N_MOVES, N_SLICE, N_SLICE_PERM, N_TWIST, N_UD_EDGES, PHASE2_MOVES,
+    corners_coord, flip_coord, orient, permute, slice_coord, slice_perm_coord, twist_coord, ud_edges_coord,
+)
+
+# Directorio de las tablas (se puede cambiar con SCRAMBLE_TABLES_DIR)
+TABLES_DIR = os.getenv("SCRAMBLE_TABLES_DIR", os.path.join(os.path.dirname(__file__), "tables"))
+
+# Funciones que aplican un movimiento a la parte del estado de cada coordenada
+def _corner_orientation(co, m):
+    return orient(co, MOVES[m][0], MOVES[m][1], 3)
+
+
+def _edge_orientation(eo, m):
+    return orient(eo, MOVES[m][2], MOVES[m][3], 2)
+
+
+def _corner_permutation(cp, m):
+    return permute(cp, MOVES[m][0])
+
+
+def _edge_permutation(ep, m):
+    return permute(ep, MOVES[m][2])
+
+
+# Definición de cada tabla de movimientos: (tamaño, estado inicial, movimiento, coordenada, movimientos)
+MOVE_TABLES = {
+    "twist_move": (N_TWIST, (0,) * 8, _corner_orientation, twist_coord, range(N_MOVES)),
+    "flip_move": (N_FLIP, (0,) * 12, _edge_orientation, flip_coord, range(N_MOVES)),
+    "slice_move": (N_SLICE, tuple(range(12)), _edge_permutation, slice_coord, range(N_MOVES)),
+    "corners_move": (N_CORNERS, tuple(range(8)), _corner_permutation, corners_coord, PHASE2_MOVES),
+    "ud_edges_move": (N_UD_EDGES, tuple(range(12)), _edge_permutation, ud_edges_coord, PHASE2_MOVES),
+    "slice_perm_move": (N_SLICE_PERM, tuple(range(12)), _edge_permutation, slice_perm_coord, PHASE2_MOVES),
+}
+
+# Definición de cada tabla de poda: (tabla externa, tabla interna, movimientos)
+# El índice es externa * tamaño_interna + interna
+PRUNE_TABLES = {
+    "slice_twist_prune": ("slice_move", "twist_move", range(N_MOVES)),
+    "slice_flip_prune": ("slice_move", "flip_move", range(N_MOVES)),
+    "slice_corners_prune": ("slice_perm_move", "corners_move", PHASE2_MOVES),
+    "slice_ud_edges_prune": ("slice_perm_move", "ud_edges_move", PHASE2_MOVES),
+}
+
+
+# Recorremos en anchura todos los valores de la coordenada a partir del estado
+# resuelto, registrando a qué valor lleva cada movimiento
+def build_move_table(size, start, move, coord, moves):
+    table = np.zeros((size, N_MOVES), dtype=np.uint16)
+    seen = bytearray(size)
+    seen[coord(start)] = 1
+    queue = deque([start])
+    while queue:
+        state = queue.popleft()
+        index = coord(state)
+        for m in moves:
+            following = move(state, m)
+            value = coord(following)
+            table[index, m] = value
+            if not seen[value]:
+                seen[value] = 1
+                queue.append(following)
+    return table
+
+
+# Calculamos la distancia mínima al estado resuelto de cada par de
+# coordenadas, con un recorrido en anchura vectorizado por niveles
+def build_prune_table(outer_move, inner_move, moves):
+    inner_size = inner_move.shape[0]
+    depth = np.full(outer_move.shape[0] * inner_size, -1, dtype=np.int8)
+    depth[0] = 0
+    level = 0
+    frontier = np.array([0])
+    while frontier.size:
+        outer, inner = np.divmod(frontier, inner_size)
+        following = np.concatenate([
+            outer_move[outer, m].astype(np.int64) * inner_size + inner_move[inner, m] for m in moves
+        ])
+        following = np.unique(following[depth[following] < 0])
+        level += 1
+        depth[following] = level
+        frontier = following
+    return depth
+
+
+def _path(name):
+    return os.path.join(TABLES_DIR, f"{name}.npy")
+
+
+# Guardamos una tabla de forma atómica (varios workers pueden generarlas a la vez)
+def _save(name, table):
+    os.makedirs(TABLES_DIR, exist_ok=True)
+    temporary = f"{_path(name)}.{os.getpid()}.tmp"
+    with open(temporary, "wb") as file:
+        np.save(file, table)
+    os.replace(temporary, _path(name))
+
+
+# Generamos las tablas que falten
+def build_tables():
+    tables = {}
+    for name, definition in MOVE_TABLES.items():
+        if not os.path.exists(_path(name)):
+            _save(name, build_move_table(*definition))
+        tables[name] = np.load(_path(name))
+    for name, (outer, inner, moves) in PRUNE_TABLES.items():
+        if not os.path.exists(_path(name)):
+            _save(name, build_prune_table(tables[outer], tables[inner], moves))
+
+
+# Abrimos las tablas con memoria mapeada, generándolas si es necesario. Se
+# devuelven como memoryview planos porque el acceso a elementos individuales
+# desde Python es bastante más rápido que indexar arreglos de NumPy
+def load_tables() -> dict:
+    build_tables()
+    tables = {}
+    for name in list(MOVE_TABLES) + list(PRUNE_TABLES):
+        array = np.load(_path(name), mmap_mode="r")
+        tables[name] = memoryview(array).cast("B").cast(array.dtype.char)
+    return tables
+
+
+if __name__ == "__main__":
+    build_tables()
+    print(f"Tablas disponibles en {TABLES_DIR}")
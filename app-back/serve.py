@@ -0,0 +1,30 @@
+# Arranque del servidor HTTP
+
+# - APP_ENV=development: un solo proceso de uvicorn con recarga automática al
+#   cambiar el código (el vigilante de archivos sólo tiene sentido en desarrollo)
+# - En cualquier otro caso: gunicorn con varios workers de uvicorn y la
+#   aplicación precargada (ver gunicorn.conf.py)
+#
+# Uso: python serve.py
+
+import os
+import sys
+
+# Módulo y variable de la aplicación
+APP = "backend-service:app"
+
+
+def main():
+    if os.getenv("APP_ENV") == "development":
+        import uvicorn
+
+        uvicorn.run(APP, host="0.0.0.0", port=int(os.getenv("PORT", "8000")), reload=True)
+        return
+    # Reemplazamos este proceso por gunicorn, para que reciba directamente las
+    # señales de parada del contenedor y pueda drenar las peticiones en curso
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    os.execvp("gunicorn", ["gunicorn", *sys.argv[1:], APP])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# Medición del tiempo de arranque de la aplicación
+
+# El arranque se mide por tramos consecutivos: "import" (importar los routers,
+# los modelos y sus dependencias) y "boot" (desde que termina la importación,
+# o desde el fork del worker si la aplicación se precargó en gunicorn, hasta
+# que el lifespan deja la aplicación lista para atender peticiones). Si la
+# suma supera STARTUP_BUDGET segundos se avisa por la salida de errores. Los
+# tramos se exponen en /metrics.
+
+import os
+import sys
+from time import perf_counter
+
+# Segundos que puede tardar como mucho el arranque de un worker
+STARTUP_BUDGET = float(os.getenv("STARTUP_BUDGET", "10"))
+
+# Duración de cada tramo terminado
+phases = {}
+# Comienzo del tramo en curso
+_segment_start = perf_counter()
+
+
+# Terminamos el tramo en curso y devolvemos su duración
+def mark(phase: str) -> float:
+    global _segment_start
+    now = perf_counter()
+    phases[phase] = now - _segment_start
+    _segment_start = now
+    return phases[phase]
+
+
+# El worker recién creado por fork empieza su propio tramo de arranque
+def forked():
+    global _segment_start
+    _segment_start = perf_counter()
+
+
+# Comprobamos el tiempo total de arranque contra el presupuesto
+def check_budget() -> float:
+    total = sum(phases.values())
+    if total > STARTUP_BUDGET:
+        detail = ", ".join(f"{phase} {seconds:.2f} s" for phase, seconds in phases.items())
+        print(f"Startup budget exceeded: {total:.2f} s ({detail}), budget {STARTUP_BUDGET} s", file=sys.stderr)
+    return total
+
+
+# Líneas de Prometheus con los tramos del arranque
+def metrics_lines() -> list:
+    lines = ["# HELP app_startup_seconds Duración de cada tramo del arranque del worker",
+             "# TYPE app_startup_seconds gauge"]
+    lines += [f'app_startup_seconds{{phase="{phase}"}} {seconds:.6f}' for phase, seconds in phases.items()]
+    lines += ["# HELP app_startup_budget_seconds Presupuesto del tiempo de arranque (STARTUP_BUDGET)",
+              "# TYPE app_startup_budget_seconds gauge",
+              f"app_startup_budget_seconds {STARTUP_BUDGET}"]
+    return lines
@@ -0,0 +1,534 @@
+# Motor de estadísticas incrementales para las sesiones
+
+# Mantiene en memoria, por cada sesión, los tiempos ordenados cronológicamente y
+# las medias móviles de estilo WCA (ao5, ao12, ao50, ao100). Los solves forman
+# una skip list (ubicar, insertar y quitar uno cuesta O(log n) esperado) y cada
+# uno guarda el valor de las ventanas que comienzan en él; los mejores valores
+# se llevan en heaps con borrado diferido (O(log n) amortizado). Cada escritura
+# de un solve sólo recalcula las ventanas que lo contienen, por lo que el coste
+# es O(log n) en el largo de la sesión.
+#
+# Los DNF se representan con DNF (infinito): se ordenan como el peor tiempo,
+# así que una media con más DNF que tiempos descartados vale DNF, como en la
+# WCA. La media simple ("avg") y el mejor single no los incluyen.
+#
+# Las peticiones sólo actualizan el estado en memoria; las columnas de la
+# sesión (avg, ao5, ao12, qty) se guardan en segundo plano, una vez por ráfaga
+# de escrituras, con la cola de recompute.py que se encola al confirmar la
+# transacción.
+#
+# Cada escritura de un solve incrementa Session.revision en la misma
+# transacción. El estado en memoria recuerda la revisión con la que coincide:
+# si otro proceso (otro worker) modificó la sesión, la revisión de la base de
+# datos es otra y el estado se vuelve a cargar en lugar de usar ventanas
+# desactualizadas. Por lo mismo, las columnas sólo se guardan si la revisión
+# no cambió desde que se calcularon.
+
+from bisect import bisect_left, insort
+from collections import Counter
+from heapq import heapify, heappop, heappush
+from math import ceil
+from random import random
+from threading import Lock
+
+from sqlalchemy import case, event, select, update
+from sqlalchemy.orm import Session
+
+from database import SessionLocal, Penalty, Session as SessionModel, Solve
+from changes import change_log
+from recompute import DebouncedQueue
+
+# Tamaños de las medias móviles que se calculan
+AVERAGE_SIZES = (5, 12, 50, 100)
+# Milisegundos que suma la penalización +2
+PLUS_TWO_MS = 2000
+# Valor de un DNF en los cálculos: peor que cualquier tiempo
+DNF = float("inf")
+
+
+# Función para obtener el tiempo de un solve con su penalización
+def solve_ms(time_ms: int, penalty) -> float:
+    if penalty == Penalty.DNF:
+        return DNF
+    if penalty == Penalty.PLUS_TWO:
+        return time_ms + PLUS_TWO_MS
+    return time_ms
+
+
+# El mismo tiempo como expresión SQL (NULL si es DNF), para agregar en la
+# base de datos: MIN y AVG ignoran los NULL, es decir, los DNF
+result_ms = case(
+    (Solve.penalty == Penalty.DNF, None),
+    (Solve.penalty == Penalty.PLUS_TWO, Solve.time_ms + PLUS_TWO_MS),
+    else_=Solve.time_ms,
+)
+
+
+# Valor de un resultado en las respuestas: los DNF se devuelven como "DNF"
+def result_value(value):
+    return "DNF" if value == DNF else value
+
+
+# Valor de un resultado en una columna entera: los DNF se guardan como NULL
+def column_value(value):
+    return None if value == DNF else value
+
+
+# Cantidad de tiempos que se descartan por cada extremo (criterio de csTimer: 5%, mínimo 1)
+def trim_count(size: int) -> int:
+    return max(1, ceil(size * 0.05))
+
+
+# Media recortada de una ventana de tiempos
+def trimmed_mean(window) -> int:
+    ordered = sorted(window)
+    trim = trim_count(len(ordered))
+    kept = ordered[trim:len(ordered) - trim]
+    if kept[-1] == DNF:
+        return DNF
+    return round(sum(kept) / len(kept))
+
+
+# Lista ordenada con repeticiones (multiconjunto) basada en bisect
+class SortedList:
+    def __init__(self, values=()):
+        self._values = sorted(values)
+
+    def add(self, value):
+        insort(self._values, value)
+
+    def remove(self, value):
+        index = bisect_left(self._values, value)
+        if index < len(self._values) and self._values[index] == value:
+            del self._values[index]
+
+    def first(self):
+        return self._values[0] if self._values else None
+
+    # Cantidad de elementos menores que `value`
+    def bisect_left(self, value):
+        return bisect_left(self._values, value)
+
+    def __getitem__(self, index):
+        return self._values[index]
+
+    def __len__(self):
+        return len(self._values)
+
+
+# Multiconjunto del que sólo se consulta el mínimo: un heap en el que los
+# valores quitados se descartan al llegar a la cima
+class MinMultiset:
+    def __init__(self):
+        self._heap = []
+        self._present = Counter()
+        self._removed = Counter()
+        self._size = 0
+
+    def add(self, value):
+        heappush(self._heap, value)
+        self._present[value] += 1
+        self._size += 1
+
+    def remove(self, value):
+        if not self._present[value]:
+            return
+        self._present[value] -= 1
+        self._removed[value] += 1
+        self._size -= 1
+        # Si la mayoría de los elementos del heap ya se quitaron, lo reconstruimos
+        if len(self._heap) > 2 * self._size + 64:
+            self._present = +self._present
+            self._heap = list(self._present.elements())
+            heapify(self._heap)
+            self._removed.clear()
+
+    def first(self):
+        heap = self._heap
+        while heap and self._removed[heap[0]]:
+            self._removed[heappop(heap)] -= 1
+        return heap[0] if heap else None
+
+
+# Un solve de la línea de tiempo, con el valor de las ventanas que comienzan en él
+class TimelineNode:
+    __slots__ = ("key", "ms", "next", "prev", "windows")
+
+    def __init__(self, key, ms, level: int):
+        self.key = key
+        self.ms = ms
+        self.next = [None] * level
+        self.prev = None
+        self.windows = {}
+
+
+# Solves ordenados por (date, id_solve) en una skip list. El primer nivel es
+# una lista doblemente enlazada para recorrer los vecinos de un solve
+class Timeline:
+    MAX_LEVEL = 24
+    # Probabilidad de que un nodo suba al nivel siguiente
+    PROMOTION = 0.25
+
+    def __init__(self):
+        self.head = TimelineNode(None, None, self.MAX_LEVEL)
+        self.last = None
+        self.level = 1
+        self.size = 0
+
+    # Último nodo de cada nivel con clave menor que `key`
+    def _predecessors(self, key) -> list:
+        predecessors = [self.head] * self.MAX_LEVEL
+        node = self.head
+        for level in reversed(range(self.level)):
+            while node.next[level] is not None and node.next[level].key < key:
+                node = node.next[level]
+            predecessors[level] = node
+        return predecessors
+
+    def insert(self, key, ms) -> TimelineNode:
+        predecessors = self._predecessors(key)
+        level = 1
+        while level < self.MAX_LEVEL and random() < self.PROMOTION:
+            level += 1
+        self.level = max(self.level, level)
+        node = TimelineNode(key, ms, level)
+        for index in range(level):
+            node.next[index] = predecessors[index].next[index]
+            predecessors[index].next[index] = node
+        if predecessors[0] is not self.head:
+            node.prev = predecessors[0]
+        if node.next[0] is not None:
+            node.next[0].prev = node
+        else:
+            self.last = node
+        self.size += 1
+        return node
+
+    def remove(self, node: TimelineNode):
+        predecessors = self._predecessors(node.key)
+        for index in range(len(node.next)):
+            predecessors[index].next[index] = node.next[index]
+        if node.next[0] is not None:
+            node.next[0].prev = node.prev
+        else:
+            self.last = node.prev
+        while self.level > 1 and self.head.next[self.level - 1] is None:
+            self.level -= 1
+        self.size -= 1
+
+    # Nodo `steps` posiciones antes de `node` (o el primero, si no hay tantos)
+    @staticmethod
+    def back(node: TimelineNode, steps: int) -> TimelineNode:
+        while steps and node.prev is not None:
+            node = node.prev
+            steps -= 1
+        return node
+
+
+# Estado de las estadísticas de una sesión
+class SessionStats:
+    def __init__(self):
+        # Solves en orden cronológico y su nodo, por id_solve
+        self.timeline = Timeline()
+        self.nodes = {}
+        # Suma de los tiempos terminados y cantidad de DNF
+        self.total = 0
+        self.dnf = 0
+        self.singles = MinMultiset()
+        # Para cada tamaño N, los valores de todas las ventanas (el de cada una
+        # se guarda en el nodo en que comienza)
+        self.best_windows = {size: MinMultiset() for size in AVERAGE_SIZES}
+        # Revisión de la sesión en la base de datos (Session.revision) que
+        # incluye exactamente los solves de este estado
+        self.revision = None
+
+    # Cambia (o quita, si `value` es None) el valor de la ventana que comienza en `node`
+    def _set_window(self, node: TimelineNode, size: int, value):
+        best = self.best_windows[size]
+        old = node.windows.pop(size, None)
+        if old is not None:
+            best.remove(old)
+        if value is not None:
+            node.windows[size] = value
+            best.add(value)
+
+    # Recalcula las ventanas de tamaño `size` que comienzan entre `first` y
+    # `last` (inclusive), leyendo una sola vez los tiempos que abarcan
+    def _refresh(self, size: int, first: TimelineNode, last: TimelineNode):
+        starts, times = [], []
+        node = first
+        while node is not None and (not starts or starts[-1] is not last):
+            starts.append(node)
+            times.append(node.ms)
+            node = node.next[0]
+        while node is not None and len(times) < len(starts) + size - 1:
+            times.append(node.ms)
+            node = node.next[0]
+        # Las ventanas que no llegan a `size` solves no existen (las últimas de la sesión)
+        complete = max(0, len(times) - size + 1)
+        for index, start in enumerate(starts[:complete]):
+            self._set_window(start, size, trimmed_mean(times[index:index + size]))
+        for start in starts[complete:]:
+            if size in start.windows:
+                self._set_window(start, size, None)
+
+    # Añade un solve en la posición que le corresponde por fecha
+    def add(self, id_solve, date, ms):
+        # Si el solve ya estaba (por ejemplo, recién cargado desde la base de datos) lo reemplazamos
+        self.remove(id_solve)
+        node = self.timeline.insert((date, id_solve), ms)
+        self.nodes[id_solve] = node
+        if ms == DNF:
+            self.dnf += 1
+        else:
+            self.total += ms
+        self.singles.add(ms)
+        # Sólo cambian las ventanas que contienen el nuevo solve; las que
+        # empiezan después conservan su contenido
+        for size in AVERAGE_SIZES:
+            self._refresh(size, self.timeline.back(node, size - 1), node)
+
+    # Elimina un solve de la sesión
+    def remove(self, id_solve):
+        node = self.nodes.pop(id_solve, None)
+        if node is None:
+            return
+        previous = node.prev
+        for size in AVERAGE_SIZES:
+            self._set_window(node, size, None)
+        self.timeline.remove(node)
+        if node.ms == DNF:
+            self.dnf -= 1
+        else:
+            self.total -= node.ms
+        self.singles.remove(node.ms)
+        if previous is not None:
+            for size in AVERAGE_SIZES:
+                self._refresh(size, self.timeline.back(previous, size - 2), previous)
+
+    # Actualiza la fecha y/o el tiempo de un solve existente
+    def update(self, id_solve, date, ms):
+        self.add(id_solve, date, ms)
+
+    def __contains__(self, id_solve):
+        return id_solve in self.nodes
+
+    @property
+    def qty(self):
+        return self.timeline.size
+
+    # Media actual de los últimos `size` solves
+    def current(self, size):
+        if self.timeline.size < size:
+            return None
+        return self.timeline.back(self.timeline.last, size - 1).windows.get(size)
+
+    # Resumen de las estadísticas de la sesión
+    def summary(self) -> dict:
+        finished = self.qty - self.dnf
+        summary = {
+            "qty": self.qty,
+            "dnf": self.dnf,
+            "avg": round(self.total / finished) if finished else None,
+            "best": result_value(self.singles.first()),
+        }
+        for size in AVERAGE_SIZES:
+            summary[f"ao{size}"] = result_value(self.current(size))
+            summary[f"best_ao{size}"] = result_value(self.best_windows[size].first())
+        return summary
+
+
+# Registro de estadísticas por sesión, compartido por todos los routers
+class StatsEngine:
+    def __init__(self):
+        self._sessions = {}
+        # Protege sólo las operaciones en memoria: las consultas de una carga se
+        # hacen fuera del lock, que también se toma desde el bucle de eventos
+        self._lock = Lock()
+        # Guardado de las columnas de las sesiones en segundo plano
+        self.queue = DebouncedQueue("session_stats", self.recompute)
+
+    # Carga desde la base de datos el estado de una sesión (y, si está
+    # archivada, desde sus archivos; ver archive.py)
+    def _load(self, db: Session, db_session: SessionModel) -> SessionStats:
+        stats = SessionStats()
+        if db_session.archived and db_session.fk_user is not None:
+            # Importación diferida: archive.py usa las constantes de este módulo
+            from archive import open_archive, to_datetime
+
+            archive = open_archive(db_session.fk_user)
+            if archive is not None:
+                index = archive.sessions_index([db_session.id_session])
+                ids = archive.column("id_solve", index).tolist()
+                dates = archive.column("date", index).tolist()
+                for id_solve, date, ms in zip(ids, dates, archive.results(index).tolist()):
+                    stats.add(id_solve, to_datetime(date), ms if ms == DNF else int(ms))
+        rows = (
+            db.query(Solve.id_solve, Solve.date, Solve.time_ms, Solve.penalty)
+            .filter(Solve.fk_session == db_session.id_session)
+            .order_by(Solve.date, Solve.id_solve)
+        )
+        for id_solve, date, time_ms, penalty in rows:
+            stats.add(id_solve, date, solve_ms(time_ms, penalty))
+        stats.revision = db_session.revision
+        return stats
+
+    # Obtenemos el estado de una sesión, cargándolo si no está en memoria o si
+    # otro proceso (otro worker) modificó sus solves, es decir, si su revisión
+    # en la base de datos no es la del estado en memoria. La carga se instala
+    # sólo si otro hilo no dejó mientras tanto un estado igual o más nuevo
+    def get(self, db: Session, db_session: SessionModel) -> SessionStats:
+        with self._lock:
+            stats = self._sessions.get(db_session.id_session)
+        if stats is not None and stats.revision == db_session.revision:
+            return stats
+        stats = self._load(db, db_session)
+        with self._lock:
+            current = self._sessions.get(db_session.id_session)
+            if current is None or current.revision < stats.revision:
+                self._sessions[db_session.id_session] = stats
+            elif current.revision == stats.revision:
+                return current
+        return stats
+
+    # Olvidamos el estado de una sesión (por ejemplo, al eliminarla)
+    def forget(self, id_session: int):
+        with self._lock:
+            self._sessions.pop(id_session, None)
+
+    # Valores de las columnas de la sesión según su estado
+    def _columns(self, stats: SessionStats) -> dict:
+        summary = stats.summary()
+        return {
+            "avg": summary["avg"],
+            "ao5": column_value(stats.current(5)),
+            "ao12": column_value(stats.current(12)),
+            "qty": summary["qty"],
+        }
+
+    # Incrementamos la revisión de unas sesiones (en la transacción en curso,
+    # que bloquea sus filas hasta confirmarse) y devolvemos {id_session: revisión}
+    def _bump(self, db: Session, id_sessions) -> dict:
+        id_sessions = list(id_sessions)
+        db.execute(update(SessionModel).where(SessionModel.id_session.in_(id_sessions))
+                   .values(revision=SessionModel.revision + 1))
+        return dict(db.execute(select(SessionModel.id_session, SessionModel.revision)
+                               .where(SessionModel.id_session.in_(id_sessions))).all())
+
+    # Función auxiliar para aplicar un cambio sobre la sesión de un solve: se
+    # incrementa su revisión, se actualiza el estado en memoria (si está
+    # cargado y al día) y la sesión se encola para guardar sus columnas cuando
+    # se confirme la transacción
+    def _apply(self, db: Session, id_session, change):
+        if id_session is None:
+            return
+        revision = self._bump(db, [id_session]).get(id_session)
+        with self._lock:
+            stats = self._sessions.get(id_session)
+            if stats is not None:
+                if revision is not None and stats.revision == revision - 1:
+                    change(stats)
+                    stats.revision = revision
+                else:
+                    # Otro proceso modificó la sesión: se volverá a cargar al leerla
+                    del self._sessions[id_session]
+        db.info.setdefault(PENDING_SESSIONS, set()).add(id_session)
+
+    # Registramos un solve nuevo (debe tener id, es decir, después de db.flush())
+    def solve_added(self, db: Session, db_solve: Solve):
+        self._apply(db, db_solve.fk_session, lambda stats: stats.add(
+            db_solve.id_solve, db_solve.date, solve_ms(db_solve.time_ms, db_solve.penalty)))
+
+    # Registramos la eliminación de un solve
+    def solve_removed(self, db: Session, db_solve: Solve):
+        self._apply(db, db_solve.fk_session, lambda stats: stats.remove(db_solve.id_solve))
+
+    # Registramos la edición de un solve, que puede haber cambiado de sesión
+    def solve_updated(self, db: Session, db_solve: Solve, old_session: int):
+        if old_session != db_solve.fk_session:
+            self._apply(db, old_session, lambda stats: stats.remove(db_solve.id_solve))
+            self.solve_added(db, db_solve)
+        else:
+            self._apply(db, db_solve.fk_session, lambda stats: stats.update(
+                db_solve.id_solve, db_solve.date, solve_ms(db_solve.time_ms, db_solve.penalty)))
+
+    # Resumen completo de una sesión
+    def summary(self, db: Session, db_session: SessionModel) -> dict:
+        stats = self.get(db, db_session)
+        with self._lock:
+            return stats.summary()
+
+    # Resumen de una sesión sólo si ya está en memoria (sin consultar la base de datos)
+    def cached_summary(self, id_session: int):
+        with self._lock:
+            stats = self._sessions.get(id_session)
+            return stats.summary() if stats is not None else None
+
+    # Actualizamos las columnas de una sesión con el estado en memoria
+    def store(self, db: Session, db_session: SessionModel):
+        stats = self.get(db, db_session)
+        with self._lock:
+            values = self._columns(stats)
+        for name, value in values.items():
+            setattr(db_session, name, value)
+
+    # Registramos cambios en varias sesiones (por ejemplo, tras una carga
+    # masiva): se incrementa su revisión, se descarta su estado en memoria y
+    # se vuelven a cargar en segundo plano
+    def sessions_changed(self, db: Session, id_sessions):
+        if not id_sessions:
+            return
+        self._bump(db, id_sessions)
+        for id_session in id_sessions:
+            self.forget(id_session)
+        db.info.setdefault(PENDING_SESSIONS, set()).update(id_sessions)
+
+    # Guardamos las columnas de unas sesiones con su estado actual (desde la
+    # cola de recompute.py, en un hilo y con su propia conexión). Sólo se
+    # escriben si la revisión sigue siendo la leída: si otro proceso modificó
+    # la sesión mientras tanto, ese proceso encoló su propio guardado. Las
+    # sesiones guardadas se registran para la sincronización (ver changes.py)
+    def recompute(self, id_sessions):
+        db = SessionLocal()
+        try:
+            saved = []
+            for db_session in db.query(SessionModel).filter(SessionModel.id_session.in_(list(id_sessions))):
+                stats = self.get(db, db_session)
+                with self._lock:
+                    values = self._columns(stats)
+                if all(getattr(db_session, name) == value for name, value in values.items()):
+                    continue
+                result = db.execute(
+                    update(SessionModel)
+                    .where(SessionModel.id_session == db_session.id_session,
+                           SessionModel.revision == db_session.revision)
+                    .values(**values)
+                )
+                if result.rowcount:
+                    saved.append((db_session.id_session, db_session.fk_user))
+            change_log.sessions_saved(db, saved)
+            db.commit()
+        finally:
+            db.close()
+
+
+# Clave de db.info con las sesiones modificadas en la transacción en curso
+PENDING_SESSIONS = "stats_pending_sessions"
+
+# Instancia global del motor de estadísticas
+stats_engine = StatsEngine()
+
+
+# Al confirmar una transacción encolamos sus sesiones modificadas, para que el
+# guardado lea los datos ya confirmados
+@event.listens_for(Session, "after_commit")
+def schedule_sessions(db: Session):
+    for id_session in db.info.pop(PENDING_SESSIONS, ()):
+        stats_engine.queue.schedule(id_session)
+
+
+# Si se deshace, descartamos su estado en memoria, que ya incluía los cambios
+@event.listens_for(Session, "after_rollback")
+def discard_sessions(db: Session):
+    for id_session in db.info.pop(PENDING_SESSIONS, ()):
+        stats_engine.forget(id_session)
@@ -0,0 +1,127 @@
+# Selección del motor de base de datos
+
+# DB_BACKEND elige el motor con el que se crean los engines de database.py
+# (los modelos, los routers y las migraciones son los mismos en ambos):
+# - mysql (por defecto): mysql-connector para el código síncrono y aiomysql
+#   para el async. Los datos de conexión se leen de DB_USER, DB_PASSWORD,
+#   DB_HOST, DB_PORT y DB_NAME o, si faltan, de config.py
+# - sqlite: un archivo local (SQLITE_PATH), para instalaciones de un solo
+#   nodo y pruebas sin contenedor de MySQL; las lecturas no pasan por la red
+#
+# DATABASE_URL y ASYNC_DATABASE_URL reemplazan las URLs elegidas; si sólo se
+# indica DATABASE_URL, la asíncrona se deriva de ella (ver async_url).
+#
+# Cada conexión de SQLite se abre con:
+# - journal_mode=WAL: los lectores no se bloquean entre sí ni bloquean al
+#   escritor, así que el pool de conexiones lee en paralelo
+# - synchronous=NORMAL: con WAL sólo se sincroniza el disco en los
+#   checkpoints; un corte de luz puede perder las últimas transacciones
+#   confirmadas, pero nunca corrompe la base
+# - mmap_size=SQLITE_MMAP_SIZE: las páginas se leen con memoria mapeada,
+#   sin copiarlas a la caché de cada conexión
+# - busy_timeout=SQLITE_BUSY_TIMEOUT: SQLite admite un solo escritor a la vez.
+#   El driver abre la transacción recién con la primera escritura (las
+#   lecturas previas no toman bloqueos), y un escritor espera al anterior
+#   hasta este tiempo en lugar de fallar con "database is locked"
+# - foreign_keys=ON: las claves foráneas se validan, como en MySQL
+
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+try:
+    import config
+except ImportError:
+    config = None
+
+# Motor de base de datos: mysql o sqlite
+DB_BACKEND = os.getenv("DB_BACKEND", "mysql")
+# Archivo de la base de datos de SQLite
+SQLITE_PATH = os.getenv("SQLITE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "scramble-timer.db"))
+# Bytes de la base de SQLite que se leen con memoria mapeada (256 MiB)
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+# Milisegundos que un escritor espera a que SQLite quede libre
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000"))
+
+# Driver asíncrono de cada driver síncrono, para derivar ASYNC_DATABASE_URL
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+    "mysql": "mysql+aiomysql",
+    "mysql+mysqlconnector": "mysql+aiomysql",
+    "mysql+pymysql": "mysql+aiomysql",
+}
+
+
+# Dato de conexión de MySQL: variable de entorno o, si falta, config.py
+def setting(variable: str, attribute: str, default=None):
+    return os.getenv(variable) or getattr(config, attribute, default)
+
+
+# URL síncrona según DB_BACKEND (o DATABASE_URL)
+def database_url() -> str:
+    if os.getenv("DATABASE_URL"):
+        return os.environ["DATABASE_URL"]
+    if DB_BACKEND == "sqlite":
+        return f"sqlite:///{os.path.abspath(SQLITE_PATH)}"
+    if DB_BACKEND != "mysql":
+        raise ValueError(f"Unknown DB_BACKEND {DB_BACKEND!r} (expected 'mysql' or 'sqlite')")
+    user = setting("DB_USER", "user")
+    password = setting("DB_PASSWORD", "password")
+    host = setting("DB_HOST", "host", "localhost")
+    port = setting("DB_PORT", "port", 3306)
+    db_name = setting("DB_NAME", "db_name")
+    return f"mysql+mysqlconnector://{user}:{password}@{host}:{port}/{db_name}"
+
+
+# URL asíncrona: ASYNC_DATABASE_URL o la síncrona con su driver asíncrono
+def async_url(url: str) -> str:
+    if os.getenv("ASYNC_DATABASE_URL"):
+        return os.environ["ASYNC_DATABASE_URL"]
+    parsed = make_url(url)
+    return parsed.set(drivername=ASYNC_DRIVERS.get(parsed.drivername, parsed.drivername)).render_as_string(
+        hide_password=False)
+
+
+# Opciones de create_engine propias del motor, que se suman a las del pool
+# (pool_options en pool.py) y reemplazan las que no aplican
+def engine_options(url: str) -> dict:
+    if make_url(url).get_backend_name() != "sqlite":
+        return {}
+    return {
+        # Las conexiones van y vienen entre los hilos del threadpool y el pool
+        # ya garantiza que cada una la use un solo hilo a la vez
+        "connect_args": {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT / 1000},
+        # Un archivo local no cierra las conexiones por inactividad
+        "pool_pre_ping": False,
+        "pool_recycle": -1,
+    }
+
+
+# Configuramos cada conexión nueva de un engine de SQLite
+def configure(engine):
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}")
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+
+# Resumen del motor en uso, para /health/db
+def backend_status(engine) -> dict:
+    status = {"backend": engine.dialect.name, "driver": engine.dialect.driver}
+    if engine.dialect.name == "sqlite":
+        status.update({
+            "path": engine.url.database,
+            "mmap_size": SQLITE_MMAP_SIZE,
+            "busy_timeout_ms": SQLITE_BUSY_TIMEOUT,
+        })
+    return status
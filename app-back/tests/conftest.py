@@ -0,0 +1,88 @@
+# Configuración común de las pruebas: una base de datos SQLite y un
+# directorio de archivos (ver archive.py) temporales, que se eligen por
+# variables de entorno antes de importar los módulos de la aplicación.
+# Se ejecutan desde app-back con: python -m pytest tests
+
+import importlib
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+TEST_DIR = tempfile.mkdtemp(prefix="scramble-timer-tests-")
+os.environ["DB_BACKEND"] = "sqlite"
+os.environ["SQLITE_PATH"] = os.path.join(TEST_DIR, "test.db")
+os.environ["ARCHIVE_DIR"] = os.path.join(TEST_DIR, "archive")
+for variable in ("DATABASE_URL", "ASYNC_DATABASE_URL"):
+    os.environ.pop(variable, None)
+
+# Números para que los nombres de usuario (únicos) no se repitan entre pruebas
+USER_NUMBERS = itertools.count(1)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi.testclient import TestClient
+
+import migrations
+from database import SessionLocal, Cube, CubeType, SolveType, User
+
+
+@pytest.fixture(scope="session")
+def app():
+    migrations.upgrade()
+    yield importlib.import_module("backend-service").app
+    shutil.rmtree(TEST_DIR, ignore_errors=True)
+
+
+# Cliente sin las tareas de inicio (reservas de scrambles, rankings en
+# segundo plano): cada prueba crea sus propios datos
+@pytest.fixture
+def client(app):
+    return TestClient(app)
+
+
+@pytest.fixture
+def db(app):
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+# Crea un usuario con una sesión, un cubo y un tipo de solve y devuelve sus ids
+@pytest.fixture
+def owner(client, db):
+    name = f"user{next(USER_NUMBERS)}"
+    db_user = User(name=name, username=name, password="-", email=f"{name}@test")
+    db_cube_type = CubeType(cube_type="3x3")
+    db_solve_type = SolveType(solve_type="normal")
+    db.add_all([db_user, db_cube_type, db_solve_type])
+    db.flush()
+    db_cube = Cube(brand="b", model="m", fk_cube_type=db_cube_type.id_cube_type, magnetic=True)
+    db.add(db_cube)
+    db.commit()
+    id_session = client.post("/session/", json={
+        "name": "s", "avg": 0, "ao5": 0, "ao12": 0, "qty": 0, "fk_user": db_user.id_user,
+    }).json()["id_session"]
+    return {
+        "user": db_user.id_user, "session": id_session, "cube": db_cube.id_cube,
+        "cube_type": db_cube_type.id_cube_type, "solve_type": db_solve_type.id_solve_type,
+    }
+
+
+# Agrega por la API un solve a la sesión de `owner` (o a la indicada)
+@pytest.fixture
+def add_solve(client, owner):
+    def add(date, time_ms, penalty="OK", scramble="R U R' U'", session=None):
+        session = session or owner["session"]
+        response = client.post(f"/session/{session}/solve/", json={
+            "date": date, "time_ms": time_ms, "penalty": penalty, "scramble": scramble,
+            "fk_cube": owner["cube"], "fk_solve_type": owner["solve_type"], "fk_session": session,
+        })
+        assert response.status_code == 200, response.text
+        return response.json()
+    return add
@@ -0,0 +1,57 @@
+# Archivo de las sesiones antiguas (ver archive.py): los solves archivados se
+# leen igual que cuando estaban en la tabla
+
+import json
+import random
+
+from archive import archive_user, open_archive
+from database import Solve
+from stats import stats_engine
+
+
+def session_solves(client, id_session):
+    response = client.get(f"/session/{id_session}/export", params={"format": "ndjson"})
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def snapshot(client, owner, sessions):
+    # Las estadísticas se vuelven a cargar desde la base de datos y los archivos
+    for id_session in sessions:
+        stats_engine.forget(id_session)
+    return {
+        "export": client.get(f"/user/{owner['user']}/export").text,
+        "solves": [session_solves(client, id_session) for id_session in sessions],
+        "stats": [client.get(f"/session/{id_session}/stats").json() for id_session in sessions],
+    }
+
+
+def test_archive_round_trip(client, db, owner, add_solve):
+    rng = random.Random(5)
+    old = owner["session"]
+    recent = client.post("/session/", json={
+        "name": "r", "avg": 0, "ao5": 0, "ao12": 0, "qty": 0, "fk_user": owner["user"],
+    }).json()["id_session"]
+    for number in range(30):
+        add_solve(
+            f"2023-03-0{1 + number % 3}T10:{number:02d}:00", rng.randint(8000, 16000),
+            penalty=rng.choice(["OK"] * 6 + ["+2", "DNF"]), scramble=rng.choice(["R U", "F2 D' L", "B2"]),
+        )
+    add_solve("2026-10-01T10:00:00", 9000, session=recent)
+    before = snapshot(client, owner, [old, recent])
+    assert len(before["solves"][0]) == 30
+
+    assert archive_user(db, owner["user"], [old]) == 30
+    assert db.query(Solve).filter(Solve.fk_session == old).count() == 0
+    archive = open_archive(owner["user"])
+    assert list(archive.rows(archive.sessions_index([old]))) == before["solves"][0]
+    assert snapshot(client, owner, [old, recent]) == before
+
+    # Un solve nuevo en la sesión archivada se archiva en un segmento más
+    add_solve("2023-03-02T09:00:00", 10000, penalty="+2", scramble="U2")
+    before = snapshot(client, owner, [old, recent])
+    assert archive_user(db, owner["user"], [old]) == 1
+    archive = open_archive(owner["user"])
+    assert len(archive.segments) == 2
+    assert list(archive.rows(archive.sessions_index([old]))) == before["solves"][0]
+    assert snapshot(client, owner, [old, recent]) == before
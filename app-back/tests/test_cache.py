@@ -0,0 +1,40 @@
+# Caché de los catálogos (ver cache.py): las entradas se guardan por versión,
+# así que las escrituras de cualquier worker las invalidan en todos
+
+from sqlalchemy import update
+
+from database import SessionLocal, CatalogVersion, CubeType
+
+
+def test_write_in_other_worker_invalidates_cache(client, owner):
+    first = client.get("/cube_type/")
+    assert client.get("/cube_type/", headers={"If-None-Match": first.headers["ETag"]}).status_code == 304
+
+    # Otro worker renombra el tipo: no toca el caché de este proceso
+    db = SessionLocal()
+    try:
+        db.get(CubeType, owner["cube_type"]).cube_type = "renamed elsewhere"
+        db.execute(update(CatalogVersion).where(CatalogVersion.name == "cube_type").values(version=CatalogVersion.version + 1))
+        db.commit()
+    finally:
+        db.close()
+
+    second = client.get("/cube_type/", headers={"If-None-Match": first.headers["ETag"]})
+    assert second.status_code == 200
+    assert "renamed elsewhere" in [row["cube_type"] for row in second.json()]
+
+
+def catalog_version(name):
+    db = SessionLocal()
+    try:
+        return db.get(CatalogVersion, name).version
+    finally:
+        db.close()
+
+
+# Los cubos incluyen su tipo, así que las escrituras de cube_type invalidan también "cube"
+def test_cube_type_write_invalidates_cubes(client, owner):
+    before = catalog_version("cube"), catalog_version("solve_type")
+    assert client.put("/cube_type/%d" % owner["cube_type"], json={"cube_type": "renamed"}).status_code == 200
+    assert catalog_version("cube") == before[0] + 1
+    assert catalog_version("solve_type") == before[1]
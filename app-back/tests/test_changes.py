@@ -0,0 +1,84 @@
+# Registro de cambios para la sincronización (ver changes.py y /sync)
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import update
+
+from changes import SESSION, SOLVE, UPSERT, DELETE, change_log, prune_changes, versions
+from database import Change
+
+
+def sync_all(client, id_user, since, limit):
+    pages = []
+    while True:
+        page = client.get("/sync", params={"user_id": id_user, "since": since, "limit": limit}).json()
+        pages.append(page)
+        since = page["version"]
+        if not page["has_more"]:
+            return pages
+
+
+def test_since_pages_by_version(client, db, owner, add_solve):
+    start, _ = versions(db)
+    solves = [add_solve(f"2024-01-01T10:0{minute}:00", 10000)["id_solve"] for minute in range(5)]
+    # Terminamos la transacción de lectura para ver las versiones confirmadas por la API
+    db.commit()
+    bulk_version = versions(db)[0] + 1
+    db.commit()
+    # Una carga masiva registra todos sus solves en una sola versión
+    bulk = client.post(f"/session/{owner['session']}/solve/bulk", json=[
+        {"date": f"2024-01-02T10:0{minute}:00", "time_ms": 9000, "penalty": "OK", "scramble": "R",
+         "fk_cube": owner["cube"], "fk_solve_type": owner["solve_type"], "fk_session": owner["session"]}
+        for minute in range(4)
+    ])
+    assert bulk.status_code == 200, bulk.text
+    client.delete(f"/session/{owner['session']}/solve/{solves[0]}")
+
+    changes, has_more = change_log.since(db, owner["user"], start, 2)
+    assert has_more
+    assert len({(change.entity, change.entity_id) for change in changes}) == len(changes)
+
+    # Un límite menor que la carga masiva devuelve su versión completa en una página
+    pages = []
+    since = start
+    while True:
+        changes, has_more = change_log.since(db, owner["user"], since, 3)
+        pages.append([change.version for change in changes])
+        since = max(pages[-1])
+        if not has_more:
+            break
+    assert [page.count(bulk_version) for page in pages if bulk_version in page] == [4]
+
+    # El último cambio de cada entidad gana
+    latest = {}
+    for page in sync_all(client, owner["user"], start, 3):
+        for change in page["changes"]:
+            latest[(change["entity"], change["id"])] = change["op"]
+    assert latest[(SOLVE, solves[0])] == DELETE
+    assert all(latest[(SOLVE, id_solve)] == UPSERT for id_solve in solves[1:])
+    assert latest[(SESSION, owner["session"])] == UPSERT
+
+
+def test_other_users_changes_are_hidden(db, owner, add_solve):
+    start, _ = versions(db)
+    add_solve("2024-01-01T10:00:00", 10000)
+    changes, _ = change_log.since(db, owner["user"] + 1000, start, 100)
+    assert [change for change in changes if change.entity == SOLVE] == []
+
+
+def test_reset_after_prune(client, db, owner, add_solve):
+    start, _ = versions(db)
+    add_solve("2024-01-01T10:00:00", 10000)
+    # Envejecemos los cambios registrados hasta ahora y los purgamos
+    db.execute(update(Change).values(created_at=datetime.utcnow() - timedelta(days=30)))
+    db.commit()
+    assert prune_changes(7) > 0
+    current, pruned = versions(db)
+    assert pruned == current > start
+    page = client.get("/sync", params={"user_id": owner["user"], "since": start}).json()
+    assert page == {"version": current, "reset": True, "has_more": False, "changes": []}
+    # Desde la versión devuelta se sigue con normalidad
+    id_solve = add_solve("2024-01-01T10:01:00", 11000)["id_solve"]
+    page = client.get("/sync", params={"user_id": owner["user"], "since": current}).json()
+    assert not page["reset"]
+    assert [change["id"] for change in page["changes"] if change["entity"] == SOLVE] == [id_solve]
@@ -0,0 +1,47 @@
+# Paginación por cursor (date, id_solve) de los listados de solves
+
+import pytest
+from fastapi import HTTPException
+
+from routers.solve import cursor_filter
+
+
+def test_pages_follow_date_and_id(client, owner, add_solve):
+    # Varios solves con la misma fecha: el id desempata sin saltar ni repetir
+    dates = ["2024-01-01T10:00:00"] * 4 + ["2024-01-01T09:00:00"] * 3 + ["2024-01-02T08:00:00"] * 3
+    ids = [add_solve(date, 10000 + number)["id_solve"] for number, date in enumerate(dates)]
+    expected = [id_solve for _, id_solve in sorted(zip(dates, ids))]
+    url = f"/session/{owner['session']}/solve/"
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+        response = client.get(url, params=params)
+        assert response.status_code == 200
+        seen += [solve["id_solve"] for solve in response.json()]
+        cursor = response.headers.get("x-next-cursor")
+        if cursor is None:
+            break
+    assert seen == expected
+
+
+def test_last_full_page_has_cursor_to_empty_page(client, owner, add_solve):
+    for minute in range(4):
+        add_solve(f"2024-01-01T10:0{minute}:00", 10000)
+    url = f"/session/{owner['session']}/solve/"
+    response = client.get(url, params={"limit": 4})
+    cursor = response.headers["x-next-cursor"]
+    response = client.get(url, params={"limit": 4, "cursor": cursor})
+    assert response.json() == []
+    assert "x-next-cursor" not in response.headers
+
+
+@pytest.mark.parametrize("cursor", ["2024-01-01T10:00:00", "yesterday,3", "2024-01-01T10:00:00,x"])
+def test_invalid_cursor(cursor):
+    with pytest.raises(HTTPException) as error:
+        cursor_filter(cursor)
+    assert error.value.status_code == 400
+
+
+def test_invalid_cursor_response(client, owner):
+    response = client.get(f"/session/{owner['session']}/solve/", params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
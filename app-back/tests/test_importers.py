@@ -0,0 +1,111 @@
+# Lectura de las exportaciones de otros timers (ver importers.py)
+
+import json
+from datetime import datetime
+
+import pytest
+
+from database import Penalty
+from importers import ImportFormatError, parse_cstimer_json, parse_import, parse_time_text
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("12.34", (12340, Penalty.OK)),
+    ("1:02.34", (62340, Penalty.OK)),
+    # csTimer escribe los +2 con la penalización ya sumada
+    ("14.34+", (12340, Penalty.PLUS_TWO)),
+    ("DNF(12.34)", (12340, Penalty.DNF)),
+    ("DNF", (None, Penalty.DNF)),
+])
+def test_parse_time_text(text, expected):
+    assert parse_time_text(text) == expected
+
+
+def test_parse_time_text_rejects_short_plus_two():
+    with pytest.raises(ValueError):
+        parse_time_text("1.50+")
+
+
+def test_cstimer_json_penalties():
+    backup = {
+        "session1": [
+            [[0, 10000], "R U", "", 1700000000],
+            [[2000, 11000], "F2", "", 1700000060],
+            [[-1, 12000], "L B", "", 1700000120],
+            # Otras penalizaciones (+4) se suman al tiempo
+            [[4000, 9000], "D", "", 1700000180],
+        ],
+        # Las versiones antiguas guardan la sesión como texto JSON
+        "session2": json.dumps([[[0, 8000], "U2", "", 1700000240]]),
+        "properties": {"session1": "ignored"},
+    }
+    solves = list(parse_cstimer_json(json.dumps(backup).encode()))
+    assert [(ms, penalty, scramble) for _, ms, penalty, scramble in solves] == [
+        (10000, Penalty.OK, "R U"),
+        (11000, Penalty.PLUS_TWO, "F2"),
+        (12000, Penalty.DNF, "L B"),
+        (13000, Penalty.OK, "D"),
+        (8000, Penalty.OK, "U2"),
+    ]
+    assert solves[0][0] == datetime.fromtimestamp(1700000000)
+
+
+@pytest.mark.parametrize("data", [
+    b"{not json",
+    b"[]",
+    json.dumps({"session1": "{broken"}).encode(),
+    json.dumps({"session1": {"a": 1}}).encode(),
+    json.dumps({"session1": [[[0], "R", "", 1]]}).encode(),
+    json.dumps({"session1": [[[0, 1000], "R\u0000U", "", 1]]}).encode(),
+])
+def test_cstimer_json_invalid(data):
+    with pytest.raises(ImportFormatError):
+        list(parse_cstimer_json(data))
+
+
+def test_cstimer_csv():
+    data = (
+        "No.;Time;Comment;Scramble;Date;P.1\n"
+        "1;12.34;;R U;2024-01-01 10:00:00;12.34\n"
+        "2;14.34+;;F2;2024-01-01 10:01:00;14.34+\n"
+        "3;DNF(9.50);;L;2024-01-01 10:02:00;DNF(9.50)\n"
+    ).encode("utf-8-sig")
+    assert list(parse_import("session.csv", data)) == [
+        (datetime(2024, 1, 1, 10, 0), 12340, Penalty.OK, "R U"),
+        (datetime(2024, 1, 1, 10, 1), 12340, Penalty.PLUS_TWO, "F2"),
+        (datetime(2024, 1, 1, 10, 2), 9500, Penalty.DNF, "L"),
+    ]
+
+
+@pytest.mark.parametrize("data", [
+    b"date,time\n2024-01-01,12.34\n",
+    b"date,time,scramble\n2024-01-01,fast,R\n",
+    # No es UTF-8
+    b"date,time,scramble\n2024-01-01T10:00:00,12.34,R \xff\n",
+    # Fila corta
+    b"date,time,scramble\n2024-01-01T10:00:00\n",
+    # Campo más largo que el límite del módulo csv
+    b"date,time,scramble\n2024-01-01T10:00:00,12.34,\"" + b"R" * 200000 + b"\"\n",
+    b"date,time,scramble\n2024-01-01T10:00:00,12.34,R\x00U\n",
+])
+def test_generic_csv_errors(data):
+    with pytest.raises(ImportFormatError):
+        list(parse_import("solves.csv", data))
+
+
+def test_import_endpoint(client, owner):
+    url = f"/session/{owner['session']}/solve/import"
+    form = {"fk_cube": owner["cube"], "fk_solve_type": owner["solve_type"]}
+    data = b"date,time,scramble\n2024-01-01T10:00:00,12.34,R U\n2024-01-01T10:01:00,14.34+,F2\n2024-01-01T10:02:00,DNF,L\n"
+    response = client.post(url, data=form, files={"file": ("solves.csv", data)})
+    assert response.status_code == 200, response.text
+    assert response.json()["skipped"] == 1
+    solves = client.get(f"/session/{owner['session']}/solve/").json()
+    assert [(solve["time_ms"], solve["penalty"]) for solve in solves] == [(12340, "OK"), (12340, "+2")]
+    # Los errores de formato y los scrambles demasiado largos se responden con 400
+    response = client.post(url, data=form, files={"file": ("solves.json", b"{not json")})
+    assert response.status_code == 400
+    data = f"date,time,scramble\n2024-01-01T10:03:00,12.34,{'R ' * 100}\n".encode()
+    response = client.post(url, data=form, files={"file": ("solves.csv", data)})
+    assert response.status_code == 400
+    assert "Solve 1" in response.json()["detail"]
@@ -0,0 +1,69 @@
+# Rankings (ver leaderboard.py): las escrituras de otros workers se aplican
+# leyendo el registro de cambios, sin reconstruir todo
+
+from datetime import datetime
+
+from changes import change_log
+from database import SessionLocal, CubeType, Solve
+from leaderboard import leaderboards
+
+
+def single(owner, fk_cube_type=None):
+    return leaderboards.ranking(fk_cube_type or owner["cube_type"], "single").values.get(owner["user"])
+
+
+# Escritura hecha en otro worker: se registra en el registro de cambios, pero
+# este proceso no la aplica al confirmarla
+def remote_write(monkeypatch, write):
+    monkeypatch.setattr(change_log, "listeners", [])
+    db = SessionLocal()
+    try:
+        result = write(db)
+        db.commit()
+        return result
+    finally:
+        db.close()
+        monkeypatch.undo()
+
+
+def test_poll_applies_other_workers_changes(client, db, owner, add_solve, monkeypatch):
+    for minute in range(6):
+        add_solve(f"2024-01-01T10:0{minute}:00", 10000 + minute)
+    leaderboards.rebuild()
+    assert single(owner) == 10000
+
+    def add(db):
+        db_solve = Solve(date=datetime(2024, 1, 1, 11), time_ms=7000, penalty="OK", scramble="R",
+                         fk_cube=owner["cube"], fk_solve_type=owner["solve_type"], fk_session=owner["session"])
+        db.add(db_solve)
+        change_log.solve_saved(db, db_solve)
+        return db_solve.id_solve
+
+    id_solve = remote_write(monkeypatch, add)
+    assert single(owner) == 10000
+    leaderboards.poll()
+    assert single(owner) == 7000
+
+    def remove(db):
+        db_solve = db.get(Solve, id_solve)
+        change_log.solve_removed(db, db_solve)
+        db.delete(db_solve)
+
+    remote_write(monkeypatch, remove)
+    leaderboards.poll()
+    assert single(owner) == 10000
+
+
+def test_poll_moves_groups_on_cube_type_change(client, db, owner, add_solve):
+    add_solve("2024-01-01T10:00:00", 9000)
+    leaderboards.rebuild()
+    db_cube_type = CubeType(cube_type="4x4")
+    db.add(db_cube_type)
+    db.commit()
+    response = client.put(f"/cube/{owner['cube']}", json={
+        "brand": "b", "model": "m", "fk_cube_type": db_cube_type.id_cube_type, "magnetic": True,
+    })
+    assert response.status_code == 200
+    leaderboards.poll()
+    assert single(owner) is None
+    assert single(owner, db_cube_type.id_cube_type) == 9000
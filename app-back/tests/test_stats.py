@@ -0,0 +1,113 @@
+# Ventanas incrementales de SessionStats comparadas con un recálculo completo
+
+import random
+from datetime import datetime, timedelta
+from math import ceil
+from types import SimpleNamespace
+
+from stats import AVERAGE_SIZES, DNF, SessionStats, StatsEngine
+
+
+# Media de `size` al estilo de csTimer, calculada desde cero
+def reference_average(times, size):
+    ordered = sorted(times)
+    trim = max(1, ceil(size * 0.05))
+    kept = ordered[trim:size - trim]
+    if DNF in kept:
+        return DNF
+    return round(sum(kept) / len(kept))
+
+
+# Resumen esperado para unos tiempos en orden cronológico
+def reference_summary(times):
+    finished = [ms for ms in times if ms != DNF]
+    summary = {
+        "qty": len(times),
+        "dnf": len(times) - len(finished),
+        "avg": round(sum(finished) / len(finished)) if finished else None,
+        "best": min(times) if times else None,
+    }
+    for size in AVERAGE_SIZES:
+        averages = [reference_average(times[start:start + size], size) for start in range(len(times) - size + 1)]
+        summary[f"ao{size}"] = averages[-1] if averages else None
+        summary[f"best_ao{size}"] = min(averages) if averages else None
+    return {key: "DNF" if value == DNF else value for key, value in summary.items()}
+
+
+def chronological(solves):
+    return [ms for _, _, ms in sorted((date, id_solve, ms) for id_solve, (date, ms) in solves.items())]
+
+
+def random_time(rng):
+    return DNF if rng.random() < 0.08 else rng.randint(7000, 20000)
+
+
+def test_windows_match_full_recompute():
+    rng = random.Random(17)
+    start = datetime(2024, 1, 1)
+    stats = SessionStats()
+    solves = {}
+    for id_solve in range(1, 260):
+        # Fechas desordenadas y repetidas: el desempate es por id_solve
+        date = start + timedelta(minutes=rng.randint(0, 400))
+        ms = random_time(rng)
+        stats.add(id_solve, date, ms)
+        solves[id_solve] = (date, ms)
+        if id_solve % 10 == 0:
+            assert stats.summary() == reference_summary(chronological(solves))
+    for _ in range(150):
+        id_solve = rng.choice(list(solves))
+        if rng.random() < 0.5:
+            stats.remove(id_solve)
+            del solves[id_solve]
+        else:
+            date = start + timedelta(minutes=rng.randint(0, 400))
+            ms = random_time(rng)
+            stats.update(id_solve, date, ms)
+            solves[id_solve] = (date, ms)
+        assert stats.summary() == reference_summary(chronological(solves))
+
+
+def test_average_with_dnf():
+    stats = SessionStats()
+    start = datetime(2024, 1, 1)
+    for id_solve, ms in enumerate([10000, 11000, DNF, 12000, 13000], 1):
+        stats.add(id_solve, start + timedelta(minutes=id_solve), ms)
+    # Un DNF se descarta como el peor tiempo de la ao5
+    assert stats.current(5) == 12000
+    stats.add(6, start + timedelta(minutes=6), DNF)
+    assert stats.current(5) == DNF
+    assert stats.summary()["best_ao5"] == 12000
+    assert stats.summary()["dnf"] == 2
+
+
+def test_empty_and_removed_solves():
+    stats = SessionStats()
+    assert stats.summary() == reference_summary([])
+    stats.add(1, datetime(2024, 1, 1), 9000)
+    stats.remove(1)
+    stats.remove(1)
+    assert stats.qty == 0
+    assert stats.summary() == reference_summary([])
+
+
+# La carga de una sesión se hace sin tomar el lock del motor, y no reemplaza
+# un estado más nuevo que otro hilo haya instalado mientras tanto
+def test_engine_loads_outside_lock(monkeypatch):
+    engine = StatsEngine()
+    db_session = SimpleNamespace(id_session=1, revision=3)
+    newer = SessionStats()
+    newer.revision = 4
+
+    def load(db, db_session):
+        assert engine._lock.acquire(blocking=False)
+        engine._lock.release()
+        engine._sessions[db_session.id_session] = newer
+        stats = SessionStats()
+        stats.add(1, datetime(2024, 1, 1), 9000)
+        stats.revision = db_session.revision
+        return stats
+
+    monkeypatch.setattr(engine, "_load", load)
+    assert engine.summary(None, db_session)["qty"] == 1
+    assert engine._sessions[1] is newer
@@ -0,0 +1,48 @@
+# Estadísticas por usuario (ver user_stats.py)
+
+from datetime import datetime
+
+from sqlalchemy import select
+
+from database import SessionLocal, Solve, UserStats
+from user_stats import user_stats
+
+
+def test_summary_counts_solves(client, owner, add_solve):
+    for minute, time_ms in enumerate([10000, 12000, 11000, 9000, 13000]):
+        add_solve(f"2024-01-01T10:0{minute}:00", time_ms)
+    add_solve("2024-01-01T10:06:00", 8000, penalty="DNF")
+    groups = client.get(f"/user/{owner['user']}/stats").json()["groups"]
+    summary = [(group["qty"], group["dnf"], group["best"], group["averages"]["ao5"]["current"]) for group in groups]
+    assert summary == [(6, 1, 9000, 12000)]
+
+
+# Un solve que se confirma mientras se recalcula la fila no se pierde: el
+# resumen calculado no pisa sus contadores y la fila sigue desactualizada
+def test_concurrent_solve_is_not_overwritten(db, owner, add_solve, monkeypatch):
+    for minute in range(5):
+        add_solve(f"2024-01-01T10:0{minute}:00", 10000 + minute)
+    load = user_stats._load
+
+    def load_then_add(db, id_user, rows):
+        loaded = load(db, id_user, rows)
+        other = SessionLocal()
+        try:
+            db_solve = Solve(date=datetime(2024, 1, 1, 10, 10), time_ms=7000, penalty="OK", scramble="R", fk_cube=owner["cube"],
+                             fk_solve_type=owner["solve_type"], fk_session=owner["session"])
+            other.add(db_solve)
+            other.flush()
+            user_stats.solve_added(other, db_solve)
+            other.commit()
+        finally:
+            other.close()
+        return loaded
+
+    monkeypatch.setattr(user_stats, "_load", load_then_add)
+    groups = user_stats.summary(db, owner["user"])
+    db.commit()
+    assert groups[0]["qty"] == 5
+    monkeypatch.undo()
+    row = db.scalar(select(UserStats).where(UserStats.fk_user == owner["user"]))
+    assert (row.qty, row.best_ms, row.stale) == (6, 7000, True)
+    assert user_stats.summary(db, owner["user"])[0]["qty"] == 6
@@ -0,0 +1,546 @@
+# Estadísticas por usuario, tipo de cubo y tipo de solve
+
+# La tabla user_stats guarda un resumen por (usuario, tipo de cubo, tipo de
+# solve). Con cada solve nuevo se actualizan en SQL, de forma atómica y sin
+# leer la fila, los contadores (qty, total_ms, best_ms), y la fila queda
+# marcada como desactualizada (stale). Los percentiles, histogramas y medias
+# móviles se recalculan con NumPy al consultarlos, sólo para las filas
+# marcadas, así que un usuario que registra muchos solves seguidos no paga
+# ningún recálculo hasta que abre sus estadísticas.
+#
+# Los solves de las sesiones archivadas (ver archive.py) se leen de sus
+# archivos y se combinan con los de la tabla solve al recalcular.
+#
+# Cada worker conserva en memoria las series (ids, fechas y tiempos) de los
+# últimos grupos recalculados. Si desde entonces sólo se agregaron solves al
+# final del grupo, se leen únicamente esos solves y las medias se actualizan
+# con las ventanas que los incluyen. Las ediciones, eliminaciones y recálculos
+# cambian la revisión de la fila, y entonces el grupo se vuelve a leer entero.
+# La caché se valida también con los contadores de la fila, que se actualizan
+# en la misma transacción que los solves: un solve con un id menor puede
+# confirmarse después que otro mayor, y quedaría fuera de la lectura por id.
+#
+# El resumen recalculado se guarda con un UPDATE condicionado a la revisión y
+# a la cantidad de solves leídas: si otra petición sumó un solve (add_counters
+# siempre cambia qty) o modificó el grupo mientras tanto, la fila no se pisa y
+# sigue marcada como desactualizada; la respuesta usa igualmente el resumen
+# calculado y la próxima consulta vuelve a recalcularla.
+#
+# USER_STATS_CACHE_SIZE es la cantidad de grupos que conserva cada worker.
+#
+# Los tiempos se manejan como float64 con los DNF como infinito (ver stats.py):
+# cuentan en las medias de estilo WCA, pero no en la media simple, los
+# percentiles ni el histograma.
+
+import json
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from threading import Lock
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from sqlalchemy import and_, case, delete, func, insert, literal, or_, select, update
+from sqlalchemy.orm import Session
+
+from archive import NULL, archived_solves, key_value, merge_series, to_datetime, to_timestamps
+from database import Cube, CubeType, Session as SessionModel, Solve, SolveType, User, UserStats
+from stats import DNF, result_ms, solve_ms, trim_count
+
+# Percentiles que se devuelven
+PERCENTILES = (10, 25, 50, 75, 90)
+# Cantidad de intervalos del histograma de tiempos
+HISTOGRAM_BINS = 20
+# Medias de estilo WCA que se calculan (actual y mejor)
+AVERAGE_SIZES = (5, 12, 50, 100)
+# Tamaño de la media móvil de la tendencia y cantidad máxima de puntos devueltos
+TREND_SIZE = 50
+TREND_POINTS = 100
+# Cantidad de ventanas que se ordenan a la vez al calcular las medias, para
+# acotar la memoria usada con usuarios con muchos solves
+WINDOW_CHUNK = 100000
+# Grupos cuyas series se conservan en memoria entre consultas
+USER_STATS_CACHE_SIZE = int(os.getenv("USER_STATS_CACHE_SIZE", "128"))
+
+
+# Medias recortadas de todas las ventanas de `size` tiempos consecutivos (las
+# que conservan algún DNF tras el recorte valen infinito)
+def rolling_trimmed_means(ms: np.ndarray, size: int) -> np.ndarray:
+    if len(ms) < size:
+        return np.empty(0, dtype=np.float64)
+    trim = trim_count(size)
+    windows = sliding_window_view(ms, size)
+    means = np.empty(len(windows), dtype=np.float64)
+    for start in range(0, len(windows), WINDOW_CHUNK):
+        block = np.sort(windows[start:start + WINDOW_CHUNK], axis=1)[:, trim:size - trim]
+        means[start:start + WINDOW_CHUNK] = np.rint(block.mean(axis=1))
+    return means
+
+
+# Valor de un resultado en las respuestas ("DNF" o milisegundos enteros)
+def result(value):
+    return "DNF" if value == DNF else int(value)
+
+
+# Array con los tiempos (con su penalización) de una lista de (time_ms, penalty)
+def results_array(solves) -> np.ndarray:
+    return np.fromiter((solve_ms(time_ms, penalty) for time_ms, penalty in solves), dtype=np.float64, count=len(solves))
+
+
+# Media móvil simple de `size` tiempos, reducida a como mucho `points` puntos
+def trend(ms: np.ndarray, size: int, points: int) -> list:
+    if len(ms) < size:
+        return []
+    sums = np.cumsum(ms, dtype=np.int64)
+    means = (sums[size - 1:] - np.concatenate(([0], sums[:-size]))) / size
+    index = np.unique(np.linspace(0, len(means) - 1, min(points, len(means))).astype(np.int64))
+    return [{"index": int(i) + size, "mean": int(round(means[i]))} for i in index]
+
+
+# Resultado de las respuestas como float64 (los DNF como infinito)
+def result_float(value):
+    return DNF if value == "DNF" else float(value)
+
+
+# Array con los tiempos de result_ms (None en los DNF)
+def results_column(values) -> np.ndarray:
+    ms = np.array(values, dtype=np.float64)
+    ms[np.isnan(ms)] = DNF
+    return ms
+
+
+# Calcula el resumen de un grupo de solves a partir de sus tiempos (en orden
+# cronológico) y sus fechas en milisegundos desde 1970. Con `previous`, el
+# resumen de los tiempos sin los últimos `appended`, las mejores medias sólo
+# se calculan sobre las ventanas que incluyen algún tiempo nuevo
+def summarize(ms: np.ndarray, timestamps: np.ndarray, previous: dict = None, appended: int = 0) -> dict:
+    averages = {}
+    for size in AVERAGE_SIZES:
+        if previous is None:
+            means = rolling_trimmed_means(ms, size)
+            best = means.min() if len(means) else None
+        else:
+            means = rolling_trimmed_means(ms[-(appended + size - 1):], size)
+            best = previous["averages"][f"ao{size}"]["best"]
+            best = None if best is None else result_float(best)
+            if len(means) and (best is None or means.min() < best):
+                best = means.min()
+        averages[f"ao{size}"] = {
+            "current": result(means[-1]) if len(means) else None,
+            "best": result(best) if best is not None else None,
+        }
+    summary = {"qty": int(len(ms)), "dnf": int(np.isinf(ms).sum()), "averages": averages}
+    # El resto de las estadísticas sólo considera los solves terminados
+    finished = np.flatnonzero(np.isfinite(ms))
+    if not len(finished):
+        return {**summary, "mean": None, "std": None, "best": None, "best_date": None, "worst": None,
+                "percentiles": None, "histogram": None, "by_hour": [],
+                "trend": {"size": TREND_SIZE, "points": []}}
+    best = int(finished[np.argmin(ms[finished])])
+    hours = (timestamps[finished] // 3600000) % 24
+    ms = ms[finished]
+    counts, edges = np.histogram(ms, bins=HISTOGRAM_BINS)
+    hour_qty = np.bincount(hours, minlength=24)
+    hour_total = np.bincount(hours, weights=ms, minlength=24)
+    return {
+        **summary,
+        "mean": int(round(ms.mean())),
+        "std": int(round(ms.std())),
+        "best": int(ms.min()),
+        "best_date": to_datetime(timestamps[best]).isoformat(),
+        "worst": int(ms.max()),
+        "percentiles": {
+            f"p{p}": int(round(value)) for p, value in zip(PERCENTILES, np.percentile(ms, PERCENTILES))
+        },
+        "histogram": {
+            "edges": [int(round(edge)) for edge in edges],
+            "counts": counts.tolist(),
+        },
+        "by_hour": [
+            {"hour": hour, "qty": int(hour_qty[hour]), "mean": int(round(hour_total[hour] / hour_qty[hour]))}
+            for hour in np.flatnonzero(hour_qty).tolist()
+        ],
+        "trend": {"size": TREND_SIZE, "points": trend(ms, TREND_SIZE, TREND_POINTS)},
+    }
+
+
+# Valor de una clave en los archivos (None se guarda como -1)
+def nullable(value):
+    return NULL if value is None else value
+
+
+# Revisión de las filas de user_stats para los cambios que no son agregar
+# solves (ediciones, eliminaciones, recreaciones), que invalida las series en
+# memoria de todos los workers: el momento actual en microsegundos
+def new_revision() -> int:
+    return time.time_ns() // 1000
+
+
+# Condición para la fila de user_stats de una clave (usuario, tipo de cubo, tipo de solve)
+def key_filter(key):
+    fk_user, fk_cube_type, fk_solve_type = key
+    return and_(
+        UserStats.fk_user == fk_user,
+        UserStats.fk_cube_type == fk_cube_type,
+        UserStats.fk_solve_type == fk_solve_type,
+    )
+
+
+# Consulta de los solves de los grupos (usuario, tipo de cubo, tipo de solve)
+def group_solves_query(*columns):
+    return (
+        select(*columns)
+        .select_from(Solve)
+        .join(SessionModel, Solve.fk_session == SessionModel.id_session)
+        .outerjoin(Cube, Solve.fk_cube == Cube.id_cube)
+        .where(SessionModel.fk_user.is_not(None))
+    )
+
+
+# Consulta de los contadores de user_stats de los solves existentes, agregados
+# en la propia base de datos (result_ms es NULL en los DNF)
+def counters_query(user_ids=None):
+    query = group_solves_query(
+        SessionModel.fk_user, Cube.fk_cube_type, Solve.fk_solve_type,
+        func.count(), func.count() - func.count(result_ms),
+        func.coalesce(func.sum(result_ms), 0), func.min(result_ms),
+    ).group_by(SessionModel.fk_user, Cube.fk_cube_type, Solve.fk_solve_type)
+    if user_ids is not None:
+        query = query.where(SessionModel.fk_user.in_(list(user_ids)))
+    return query
+
+
+# Función para marcar como desactualizadas todas las estadísticas de los
+# usuarios indicados (o de todos), recreando sus filas a partir de los solves
+# con los contadores ya calculados. Con `archived`, se suman también los
+# solves archivados (las migraciones anteriores a Session.archived no lo usan)
+def mark_users_stale(db, user_ids=None, archived=True):
+    clear = delete(UserStats)
+    if user_ids is not None:
+        clear = clear.where(UserStats.fk_user.in_(list(user_ids)))
+    db.execute(clear)
+    db.execute(insert(UserStats).from_select(
+        ["fk_user", "fk_cube_type", "fk_solve_type", "qty", "dnf", "total_ms", "best_ms", "stale", "revision"],
+        counters_query(user_ids).add_columns(literal(True), literal(new_revision())),
+    ))
+    if archived:
+        for fk_user, columns in archived_solves(db, user_ids).items():
+            keys = np.stack((columns["fk_cube_type"], columns["fk_solve_type"]), axis=1)
+            groups, inverse = np.unique(keys, axis=0, return_inverse=True)
+            inverse = inverse.reshape(-1)
+            for group, (fk_cube_type, fk_solve_type) in enumerate(groups.tolist()):
+                ms = columns["result"][inverse == group]
+                finished = ms[np.isfinite(ms)]
+                add_counters(
+                    db, (fk_user, key_value(fk_cube_type), key_value(fk_solve_type)),
+                    qty=len(ms), dnf=len(ms) - len(finished), total_ms=int(finished.sum()),
+                    best_ms=int(finished.min()) if len(finished) else None,
+                )
+
+
+# Sumamos contadores a la fila de una clave (creándola si no existe) y la
+# marcamos como desactualizada. La suma se hace en la propia base de datos,
+# para que varios workers puedan escribir a la vez. Antes se bloquea la fila
+# del usuario, para que dos workers no creen a la vez la misma fila: el índice
+# ux_user_stats_key no lo impide con las claves NULL (solves sin cubo), y con
+# MySQL, bloquear después del UPDATE puede terminar en un deadlock
+def add_counters(db, key, qty: int, dnf: int, total_ms: int, best_ms):
+    fk_user, fk_cube_type, fk_solve_type = key
+    db.execute(select(User.id_user).where(User.id_user == fk_user).with_for_update())
+    counters = {
+        "qty": UserStats.qty + qty,
+        "dnf": UserStats.dnf + dnf,
+        "total_ms": UserStats.total_ms + total_ms,
+    }
+    if best_ms is not None:
+        counters["best_ms"] = case(
+            (or_(UserStats.best_ms.is_(None), UserStats.best_ms > best_ms), best_ms), else_=UserStats.best_ms)
+    result = db.execute(update(UserStats).where(key_filter(key)).values(stale=True, **counters))
+    if result.rowcount == 0:
+        db.execute(insert(UserStats).values(
+            fk_user=fk_user, fk_cube_type=fk_cube_type, fk_solve_type=fk_solve_type,
+            qty=qty, dnf=dnf, total_ms=total_ms, best_ms=best_ms, stale=True, revision=new_revision(),
+        ))
+
+
+# Serie de un grupo en memoria: ids, fechas y tiempos en orden cronológico
+# (incluidos los archivados), con su resumen y la revisión de la fila
+class GroupSeries:
+    def __init__(self, revision: int, ids: np.ndarray, timestamps: np.ndarray, ms: np.ndarray, summary: dict):
+        self.revision = revision
+        self.ids = ids
+        self.timestamps = timestamps
+        self.ms = ms
+        self.summary = summary
+        self.last_id = int(ids.max()) if len(ids) else 0
+
+
+# Registro de estadísticas por usuario, compartido por todos los routers
+class UserStatsEngine:
+    def __init__(self):
+        # Series de los grupos, de la menos a la más usada
+        self._series = OrderedDict()
+        self._lock = Lock()
+
+    # Obtenemos la clave (usuario, tipo de cubo, tipo de solve) de un solve
+    def solve_key(self, db: Session, db_solve: Solve):
+        fk_user = db.scalar(select(SessionModel.fk_user).where(SessionModel.id_session == db_solve.fk_session))
+        if fk_user is None:
+            return None
+        fk_cube_type = db.scalar(select(Cube.fk_cube_type).where(Cube.id_cube == db_solve.fk_cube))
+        return (fk_user, fk_cube_type, db_solve.fk_solve_type)
+
+    # Marcamos como desactualizada la fila de una clave
+    def _mark_stale(self, db: Session, key):
+        if key is not None:
+            db.execute(update(UserStats).where(key_filter(key)).values(stale=True, revision=new_revision()))
+
+    # Registramos un solve nuevo: actualizamos los contadores en la propia
+    # base de datos, para que varios workers puedan escribir a la vez.
+    # Devolvemos la clave del solve (también en solve_removed y solve_updated)
+    def solve_added(self, db: Session, db_solve: Solve):
+        key = self.solve_key(db, db_solve)
+        if key is None:
+            return
+        ms = solve_ms(db_solve.time_ms, db_solve.penalty)
+        if ms == DNF:
+            add_counters(db, key, qty=1, dnf=1, total_ms=0, best_ms=None)
+        else:
+            add_counters(db, key, qty=1, dnf=0, total_ms=ms, best_ms=ms)
+        return key
+
+    # Registramos la eliminación de un solve. Si era el mejor single, el
+    # siguiente se obtiene con un MIN en la base de datos sobre el resto del
+    # grupo (los solves archivados se vuelven a considerar al recalcular la fila)
+    def solve_removed(self, db: Session, db_solve: Solve):
+        key = self.solve_key(db, db_solve)
+        if key is None:
+            return
+        ms = solve_ms(db_solve.time_ms, db_solve.penalty)
+        if ms == DNF:
+            counters = {"dnf": UserStats.dnf - 1}
+        else:
+            fk_user, fk_cube_type, fk_solve_type = key
+            best = group_solves_query(func.min(result_ms)).where(
+                SessionModel.fk_user == fk_user,
+                Cube.fk_cube_type == fk_cube_type,
+                Solve.fk_solve_type == fk_solve_type,
+                Solve.id_solve != db_solve.id_solve,
+            ).scalar_subquery()
+            counters = {
+                "total_ms": UserStats.total_ms - ms,
+                "best_ms": case((UserStats.best_ms < ms, UserStats.best_ms), else_=best),
+            }
+        db.execute(update(UserStats).where(key_filter(key)).values(
+            qty=UserStats.qty - 1, stale=True, revision=new_revision(), **counters))
+        return key
+
+    # Registramos la edición de un solve, cuya clave anterior se obtuvo con
+    # solve_key antes de modificarlo
+    def solve_updated(self, db: Session, db_solve: Solve, old_key):
+        key = self.solve_key(db, db_solve)
+        if key == old_key:
+            self._mark_stale(db, key)
+        else:
+            # El solve cambió de grupo: se recrean las filas de sus usuarios
+            user_ids = {k[0] for k in (key, old_key) if k is not None}
+            if user_ids:
+                db.flush()
+                mark_users_stale(db, user_ids)
+        return key
+
+    # Marcamos como desactualizados los usuarios dueños de unas sesiones (por
+    # ejemplo, tras una carga masiva) y devolvemos sus ids
+    def sessions_changed(self, db: Session, id_sessions):
+        user_ids = set(db.scalars(
+            select(SessionModel.fk_user).where(SessionModel.id_session.in_(list(id_sessions)))
+        )) - {None}
+        if user_ids:
+            mark_users_stale(db, user_ids)
+        return user_ids
+
+    # Serie en memoria de la fila de un grupo, si sigue en la misma revisión
+    def _cached(self, row: UserStats):
+        key = (row.fk_user, row.fk_cube_type, row.fk_solve_type)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None or series.revision != row.revision:
+                return None
+            self._series.move_to_end(key)
+            return series
+
+    # Guardamos la serie de la fila de un grupo, descartando las menos usadas
+    def _remember(self, row: UserStats, series: "GroupSeries"):
+        key = (row.fk_user, row.fk_cube_type, row.fk_solve_type)
+        with self._lock:
+            self._series[key] = series
+            self._series.move_to_end(key)
+            while len(self._series) > USER_STATS_CACHE_SIZE:
+                self._series.popitem(last=False)
+
+    # Condición de que la fila no cambió desde que se leyó
+    @staticmethod
+    def _unchanged(row: UserStats):
+        return and_(
+            UserStats.id_user_stats == row.id_user_stats,
+            UserStats.revision == row.revision,
+            UserStats.qty == row.qty,
+        )
+
+    # Guardamos en la fila el resumen de su grupo, si no cambió desde que se leyó
+    def _store(self, db: Session, row: UserStats, series: "GroupSeries", now: datetime):
+        summary = series.summary
+        db.execute(
+            update(UserStats)
+            .where(self._unchanged(row))
+            .values(
+                qty=summary["qty"],
+                dnf=summary["dnf"],
+                total_ms=int(series.ms[np.isfinite(series.ms)].sum()),
+                best_ms=summary["best"],
+                data=json.dumps(summary),
+                stale=False,
+                updated_at=now,
+            )
+            .execution_options(synchronize_session=False)
+        )
+
+    # Agregamos a la serie en memoria de una fila los solves nuevos de su
+    # grupo. Devolvemos None si el grupo hay que leerlo entero: los solves
+    # nuevos no van todos después de los anteriores (por ejemplo, uno
+    # importado con una fecha pasada) o no coinciden con los contadores
+    def _extend(self, db: Session, row: UserStats, series: "GroupSeries"):
+        rows = db.execute(
+            group_solves_query(Solve.id_solve, Solve.date, result_ms)
+            .where(
+                SessionModel.fk_user == row.fk_user,
+                Cube.fk_cube_type == row.fk_cube_type,
+                Solve.fk_solve_type == row.fk_solve_type,
+                Solve.id_solve > series.last_id,
+            )
+            .order_by(Solve.date, Solve.id_solve)
+        ).all()
+        if len(series.ms) + len(rows) != row.qty:
+            return None
+        if not rows:
+            return series
+        ids, dates, results = zip(*rows)
+        ids = np.array(ids, dtype=np.int64)
+        timestamps = to_timestamps(dates)
+        if len(series.ids) and (timestamps[0], ids[0]) <= (series.timestamps[-1], series.ids[-1]):
+            return None
+        ids = np.concatenate((series.ids, ids))
+        timestamps = np.concatenate((series.timestamps, timestamps))
+        ms = np.concatenate((series.ms, results_column(results)))
+        return GroupSeries(row.revision, ids, timestamps, ms, summarize(ms, timestamps, series.summary, len(rows)))
+
+    # Leemos enteros los grupos de unas filas de un usuario, con los solves
+    # de la tabla y los archivados, y devolvemos la serie de cada fila
+    def _load(self, db: Session, id_user: int, rows: list) -> list:
+        solves = db.execute(
+            group_solves_query(
+                func.coalesce(Cube.fk_cube_type, NULL), func.coalesce(Solve.fk_solve_type, NULL),
+                Solve.id_solve, Solve.date, result_ms,
+            )
+            .where(SessionModel.fk_user == id_user)
+            .where(or_(*[
+                and_(Cube.fk_cube_type == row.fk_cube_type, Solve.fk_solve_type == row.fk_solve_type)
+                for row in rows
+            ]))
+            .order_by(Solve.date, Solve.id_solve)
+        ).all()
+        if solves:
+            cube_types, solve_types, ids, dates, results = zip(*solves)
+            columns = {
+                "fk_cube_type": np.array(cube_types, dtype=np.int64),
+                "fk_solve_type": np.array(solve_types, dtype=np.int64),
+                "id_solve": np.array(ids, dtype=np.int64),
+                "date": to_timestamps(dates),
+                "result": results_column(results),
+            }
+        else:
+            columns = None
+        archived = archived_solves(db, [id_user]).get(id_user)
+        loaded = []
+        for row in rows:
+            series = []
+            for source in (columns, archived):
+                if source is not None:
+                    mask = ((source["fk_cube_type"] == nullable(row.fk_cube_type))
+                            & (source["fk_solve_type"] == nullable(row.fk_solve_type)))
+                    series.append((source["id_solve"][mask], source["date"][mask], source["result"][mask]))
+            if not series:
+                loaded.append(None)
+                continue
+            ids, timestamps, ms = merge_series(*series)
+            loaded.append(GroupSeries(row.revision, ids, timestamps, ms, summarize(ms, timestamps) if len(ms) else None))
+        return loaded
+
+    # Recalculamos con NumPy las filas desactualizadas de un usuario: los
+    # grupos en memoria sólo con sus solves nuevos, el resto leyéndolos enteros.
+    # Devolvemos los resúmenes calculados por id de fila (None si el grupo quedó vacío)
+    def refresh(self, db: Session, id_user: int) -> dict:
+        stale = db.scalars(select(UserStats).where(UserStats.fk_user == id_user, UserStats.stale.is_(True))).all()
+        summaries = {}
+        if not stale:
+            return summaries
+        now = datetime.utcnow()
+        missing = []
+        for row in stale:
+            series = self._cached(row)
+            if series is not None:
+                series = self._extend(db, row, series)
+            if series is None:
+                missing.append(row)
+                continue
+            self._remember(row, series)
+            self._store(db, row, series, now)
+            summaries[row.id_user_stats] = series.summary
+        if missing:
+            for row, series in zip(missing, self._load(db, id_user, missing)):
+                if series is None or not len(series.ms):
+                    db.execute(
+                        delete(UserStats).where(self._unchanged(row)).execution_options(synchronize_session=False))
+                    summaries[row.id_user_stats] = None
+                    continue
+                self._remember(row, series)
+                self._store(db, row, series, now)
+                summaries[row.id_user_stats] = series.summary
+        # Las filas se volverán a leer con los valores guardados
+        for row in stale:
+            db.expire(row)
+        return summaries
+
+    # Estadísticas de un usuario, por tipo de cubo y tipo de solve
+    def summary(self, db: Session, id_user: int) -> list:
+        summaries = self.refresh(db, id_user)
+        rows = db.execute(
+            select(UserStats, CubeType.cube_type, SolveType.solve_type)
+            .outerjoin(CubeType, UserStats.fk_cube_type == CubeType.id_cube_type)
+            .outerjoin(SolveType, UserStats.fk_solve_type == SolveType.id_solve_type)
+            .where(UserStats.fk_user == id_user)
+            .order_by(UserStats.fk_cube_type, UserStats.fk_solve_type)
+        ).all()
+        groups = []
+        for row, cube_type, solve_type in rows:
+            # El resumen recién calculado vale aunque no se haya podido guardar
+            # en la fila; las filas creadas después de recalcular se omiten
+            if row.id_user_stats in summaries:
+                summary = summaries[row.id_user_stats]
+            else:
+                summary = json.loads(row.data) if row.data else None
+            if summary is None:
+                continue
+            groups.append({
+                "fk_cube_type": row.fk_cube_type,
+                "cube_type": cube_type,
+                "fk_solve_type": row.fk_solve_type,
+                "solve_type": solve_type,
+                **summary,
+            })
+        return groups
+
+
+# Instancia global de las estadísticas por usuario
+user_stats = UserStatsEngine()